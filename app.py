@@ -1,5 +1,5 @@
 from base.routes import main as main_bp
-from flask import Flask
+from flask import Flask, request
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from config import config
@@ -36,6 +36,10 @@ def create_app(config_name=None):
     # Desabilita cache para desenvolvimento
     @app.after_request
     def add_header(response):
+        # Tiles são revalidados pelo navegador via ETag (If-None-Match -> 304)
+        if request.endpoint == 'main.tiles':
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
         response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, post-check=0, pre-check=0, max-age=0'
         response.headers['Pragma'] = 'no-cache'
         response.headers['Expires'] = '-1'
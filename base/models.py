@@ -114,8 +114,15 @@ class LatLong(db.Model):
     latitude = db.Column(db.Float, nullable=False) 
     longitude = db.Column(db.Float, nullable=False)
     user_point = db.Column(db.Boolean, nullable=True, default=False)  # False = Ponto de entrega/cliente; True = infraestrutura física (loja/galpão/depósito)
+    geocell = db.Column(db.Integer, nullable=True)  # Célula da grade espacial (GeoUtils.geocell) - preenchida automaticamente
+    range_km = db.Column(db.Float, nullable=True)  # Raio de atuação do ponto de saída (apenas user_point=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Consultas por viewport: id_user + faixas de geocell
+    __table_args__ = (
+        db.Index('idx_latlong_user_geocell', 'id_user', 'geocell'),
+    )
+
     def get_user(self):
         """Busca o usuário que criou esta localização"""
         return User.query.get(self.id_user)
@@ -128,6 +135,14 @@ class LatLong(db.Model):
 
     def __repr__(self):
         return f'<LatLong User:{self.id_user} {self.latitude},{self.longitude}>'
+
+
+@db.event.listens_for(LatLong, 'before_insert')
+@db.event.listens_for(LatLong, 'before_update')
+def _set_latlong_geocell(mapper, connection, target):
+    """Mantém LatLong.geocell sincronizado com latitude/longitude"""
+    from ml.geo_utils import GeoUtils
+    target.geocell = GeoUtils.geocell(target.latitude, target.longitude)
     
 class Routs(db.Model):
     """Modelo para rotas - Banco: routs"""
@@ -147,6 +162,58 @@ class Routs(db.Model):
     def __repr__(self):
         return f'<Routs User:{self.id_user} - {self.timestamp}>'
     
+class RoutingJob(db.Model):
+    """
+    Job de roteirização executado em segundo plano - Banco: routs
+    
+    Guarda estado, progresso e resultado de /autenticado/roteirizacao/processar
+    quando chamado com async=true, para a interface consultar sem manter a
+    requisição aberta.
+    """
+    __bind_key__ = 'routs'
+    __tablename__ = 'routing_jobs_data'
+    
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CANCELLED = 'cancelled'
+    FINISHED_STATUSES = (STATUS_DONE, STATUS_FAILED, STATUS_CANCELLED)
+    
+    id = db.Column(db.String(36), primary_key=True)  # uuid4
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default=STATUS_QUEUED)
+    progress = db.Column(db.Float, nullable=False, default=0.0)  # 0..1
+    message = db.Column(db.String(200), nullable=True)  # Etapa atual
+    params = db.Column(db.Text, nullable=True)  # JSON dos parâmetros validados
+    result = db.Column(db.Text, nullable=True)  # JSON do resultado (status done)
+    error = db.Column(db.Text, nullable=True)
+    status_code = db.Column(db.Integer, nullable=True)  # Código HTTP do erro (status failed)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)  # Último sinal do processo que executa (início/progresso)
+    
+    def is_finished(self):
+        return self.status in self.FINISHED_STATUSES
+    
+    def __repr__(self):
+        return f'<RoutingJob {self.id} User:{self.user_id} - {self.status}>'
+    
+    def to_dict(self):
+        """Serializa o estado do job (sem o resultado)"""
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'progress': round(self.progress or 0.0, 3),
+            'message': self.message,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+    
 class KNN(db.Model):
     """Modelo para rotas com cliente - Banco: routs_w_client"""
 
@@ -154,14 +221,21 @@ class KNN(db.Model):
     __tablename__ = 'KNN_data'
 
     id = db.Column(db.Integer, primary_key=True)
-    id_client = db.Column(db.Integer, nullable=False)  # Referência ao ClientName.hash_client
+    id_client = db.Column(db.Integer, nullable=False)  # Referência ao LatLong.id (ponto do cliente)
     group_number = db.Column(db.Integer, nullable=True)
     polygon_id = db.Column(db.Integer, nullable=False)  # Referência ao Polygon.id
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Pertinência cliente → área é lida por área (painel/filtros) e atualizada por cliente
+    __table_args__ = (
+        db.Index('idx_knn_polygon_client', 'polygon_id', 'id_client'),
+        db.Index('idx_knn_client', 'id_client'),
+    )
+
     def get_client(self):
-        """Busca o cliente relacionado a esta rota"""
-        return ClientName.query.get(self.id_client)
+        """Busca o cliente relacionado a esta rota (via LatLong.hash_client)"""
+        location = db.session.get(LatLong, self.id_client)
+        return location.get_client() if location else None
     def get_polygon(self):
         """Busca o polígono relacionado a esta rota"""
         return Polygon.query.get(self.polygon_id)
@@ -181,6 +255,54 @@ class Polygon(db.Model):
     max_clients_per_day = db.Column(db.Integer, nullable=True)  # Máximo de clientes por dia (None = sem limite)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Geometria compilada a partir do geojson_data (gravada ao salvar a área)
+    geometry_wkb = db.Column(db.LargeBinary, nullable=True)  # Polígono em WKB (x=longitude, y=latitude)
+    bbox_min_lat = db.Column(db.Float, nullable=True)
+    bbox_max_lat = db.Column(db.Float, nullable=True)
+    bbox_min_lng = db.Column(db.Float, nullable=True)
+    bbox_max_lng = db.Column(db.Float, nullable=True)
+    geometry_simplified = db.Column(db.JSON, nullable=True)  # {tolerância em graus: WKB hex} (GeoUtils.simplify_levels)
+    geometry_version = db.Column(db.Integer, nullable=True, default=0)  # Incrementa a cada recompilação
+
+    def set_geojson(self, feature):
+        """Grava o GeoJSON da área e recompila a geometria (WKB + bbox)"""
+        import json
+        self.geojson_data = json.dumps(feature)
+        self.compile_geometry(feature)
+
+    def compile_geometry(self, geojson=None):
+        """Compila geojson_data para WKB + bbox + versões simplificadas; retorna False se o GeoJSON não for um polígono válido"""
+        from ml.geo_utils import GeoUtils
+        compiled = GeoUtils.compile_geojson(geojson if geojson is not None else self.geojson_data)
+
+        if compiled is None:
+            self.geometry_wkb = None
+            self.geometry_simplified = None
+            self.bbox_min_lat = self.bbox_max_lat = self.bbox_min_lng = self.bbox_max_lng = None
+        else:
+            self.geometry_wkb = compiled['wkb']
+            self.geometry_simplified = {
+                str(tolerance): wkb.hex() for tolerance, wkb in compiled['simplified'].items()
+            }
+            self.bbox_min_lat = compiled['bbox']['min_lat']
+            self.bbox_max_lat = compiled['bbox']['max_lat']
+            self.bbox_min_lng = compiled['bbox']['min_lon']
+            self.bbox_max_lng = compiled['bbox']['max_lon']
+
+        self.geometry_version = (self.geometry_version or 0) + 1
+        return compiled is not None
+
+    def get_bbox(self):
+        """Retorna o bounding box compilado no formato do GeoUtils (ou None)"""
+        if self.bbox_min_lat is None:
+            return None
+        return {
+            'min_lat': self.bbox_min_lat,
+            'max_lat': self.bbox_max_lat,
+            'min_lon': self.bbox_min_lng,
+            'max_lon': self.bbox_max_lng
+        }
+
     def __repr__(self):
         return f'<Polygon {self.group_name} - {self.id}>'
 
@@ -249,7 +371,15 @@ class NDBFeatures(db.Model):
         return f'<NDBFeatures Client:{self.client_hash} - Freq:{self.freq_salle_client}>'
 
 class NDBOut (db.Model):
-    """Modelo para resultados de análise - Banco: neuraldatabaserout"""
+    """
+    Modelo para resultados de análise - Banco: neuraldatabaserout
+
+    Cada roteirização calculada grava uma linha por grupo/dia com as métricas de
+    qualidade (ml/route_metrics.py): rout_number é o número do grupo,
+    model_version a ALGORITHM_VERSION do route_optimizer, score o score RFM
+    médio, sum_distance_km o percurso com ida e volta ao ponto de saída e
+    time_moved o tempo estimado de direção em minutos.
+    """
 
     __bind_key__ = 'neuraldatabaserout'
     __tablename__ = 'ndbout_data' 
@@ -263,6 +393,14 @@ class NDBOut (db.Model):
     time_moved = db.Column(db.Float, nullable=True)
     timestamp = db.Column(db.DateTime, nullable=True)
 
+    # Métricas de qualidade da roteirização
+    user_id = db.Column(db.Integer, nullable=True, index=True)
+    plan_key = db.Column(db.String(40), nullable=True, index=True)  # Impressão digital da entrada (ml/route_cache.py)
+    depot_id = db.Column(db.Integer, nullable=True)
+    intra_cluster_km = db.Column(db.Float, nullable=True)  # Entre clientes consecutivos, sem o ponto de saída
+    centroid_spread_km = db.Column(db.Float, nullable=True)  # Distância média dos clientes ao centro do grupo
+    depot_distance_km = db.Column(db.Float, nullable=True)  # Ponto de saída → centro do grupo
+
     def get_client(self):
         """Busca o cliente relacionado a este resultado"""
         if self.client_hash:
@@ -456,7 +594,7 @@ class SavedCalendar(db.Model):
     configuracao = db.Column(db.Text, nullable=False)  # {dias, incluir_sabado, incluir_domingo, max_clientes_dia}
     
     # Dados das alocações (JSON)
-    alocacoes = db.Column(db.Text, nullable=False)  # Lista de {dia, cluster_id, num_clientes, score_medio, polygon_name}
+    alocacoes = db.Column(db.Text, nullable=False)  # Lista de {dia, cluster_id, num_clientes, score_medio, polygon_name, centro, clientes}
     
     # Estatísticas
     total_clusters = db.Column(db.Integer, nullable=False)
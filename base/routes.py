@@ -1,5 +1,5 @@
 #from tkinter.font import names
-from flask import Blueprint, render_template, request, redirect, url_for, jsonify, session, send_file, flash
+from flask import Blueprint, render_template, request, redirect, url_for, jsonify, session, send_file, flash, make_response
 from flask_login import login_required, current_user, login_user, logout_user
 from shapely import points
 from base.forms import LoginForm
@@ -18,11 +18,63 @@ logger = logging.getLogger(__name__)
 # define o blueprint; o Flask vai registrar esse blueprint em create_app()
 main = Blueprint('main', __name__, template_folder='templates', static_folder='static', static_url_path='/static')
 
+
+def _get_polygon_index(uid):
+    """Índice espacial (STRtree) das áreas do usuário, em cache entre requisições"""
+    from ml.spatial_index import get_user_polygon_index
+    return get_user_polygon_index(uid)
+
+
+def _invalidate_user_polygons(uid):
+    """
+    Descarta caches derivados das áreas do usuário após POST/DELETE em /grupos.
+    Vale só para este processo; os demais workers percebem a mudança pela versão
+    dos dados conferida no banco a cada uso (ml/user_cache.py).
+    """
+    from ml.spatial_index import invalidate_polygon_index
+    from ml.tiles import invalidate_tiles
+    from ml.route_cache import invalidate_route_cache
+    invalidate_polygon_index(uid)
+    invalidate_tiles(uid)
+    invalidate_route_cache(uid)
+
+
+def _invalidate_user_clients(uid):
+    """Descarta caches derivados dos pontos de cliente do usuário após importação"""
+    from ml.point_clusters import invalidate_point_clusters
+    from ml.tiles import invalidate_tiles
+    from ml.route_cache import invalidate_route_cache
+    invalidate_point_clusters(uid)
+    invalidate_tiles(uid)
+    invalidate_route_cache(uid)
+
+
+def _invalidate_user_depots(uid):
+    """Descarta caches derivados dos pontos de saída do usuário após POST/PUT/DELETE em /pontosSaida"""
+    from ml.depots import invalidate_depot_index
+    from ml.tiles import invalidate_tiles
+    from ml.route_cache import invalidate_route_cache
+    invalidate_depot_index(uid)
+    invalidate_tiles(uid)
+    invalidate_route_cache(uid)
+
+
+def _get_membership_counts(uid, polygon_index, polygon_ids=None):
+    """
+    Contagem de clientes por área lida da pertinência materializada (tabela KNN).
+    Retorna ({polygon_id: count}, clientes distintos em alguma área).
+    """
+    from ml.membership import ensure_user_membership, count_clients_by_polygon
+    ensure_user_membership(uid, polygon_index)
+    return count_clients_by_polygon(polygon_index.ids if polygon_ids is None else polygon_ids)
+
+
 # ...existing code...
 @main.route('/autenticado/grupos', methods=['GET', 'POST', 'DELETE'])
 def grupos():
     """
     GET ?action=get  -> retorna clients + areas (JSON)
+                        opcional: bbox=oeste,sul,leste,norte e zoom (apenas pontos visíveis)
     POST            -> cria/atualiza áreas a partir de GeoJSON (JSON)
     DELETE          -> deleta área por id (?id=)
     """
@@ -51,28 +103,25 @@ def grupos():
             clients = ClientName.query.filter_by(user_id=uid).all()
             result = []
 
-            # Busca todos os pontos do usuário e indexa por hash normalizado
+            # Viewport opcional: só os pontos dentro do bbox do mapa
+            from ml.geo_utils import GeoUtils
+            from ml.viewport import query_viewport_points, parse_zoom
+            try:
+                bbox = GeoUtils.parse_bbox(request.args['bbox']) if request.args.get('bbox') else None
+                zoom = parse_zoom(request.args.get('zoom'))
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+
+            # Busca os pontos do usuário e indexa por hash normalizado
             from collections import defaultdict
-            latlongs = LatLong.query.filter_by(id_user=uid).all()
+            latlongs = query_viewport_points(uid, bbox=bbox, zoom=zoom)
             hash_map = defaultdict(list)
             for p in latlongs:
-                if not p.hash_client:
+                if not p['hash_client']:
                     continue
-                key = str(p.hash_client).strip().lower()
-                try:
-                    lat = float(p.latitude) if p.latitude is not None else None
-                    lng = float(p.longitude) if p.longitude is not None else None
-                except Exception:
-                    lat = p.latitude
-                    lng = p.longitude
-                hash_map[key].append({
-                    'id': p.id,
-                    'hash_client': p.hash_client,
-                    'latitude': lat,
-                    'longitude': lng,
-                    'user_point': bool(p.user_point),
-                    'id_user': p.id_user
-                })
+                key = str(p['hash_client']).strip().lower()
+                p['id_user'] = uid
+                hash_map[key].append(p)
 
             print(f"📥 [DEBUG GET] Clientes encontrados: {len(clients)} | Pontos latlong (index): {sum(len(v) for v in hash_map.values())}")
 
@@ -80,6 +129,8 @@ def grupos():
             for c in clients:
                 client_hash_key = str(c.hash_client).strip().lower() if c.hash_client else None
                 client_points = hash_map.get(client_hash_key, [])
+                if (bbox is not None or zoom is not None) and not client_points:
+                    continue  # Cliente fora da área visível
                 result.append({
                     'name_client': c.name_client,
                     'hash_client': c.hash_client,
@@ -148,6 +199,13 @@ def grupos():
 
             db.session.delete(polygon)
             db.session.commit()
+            _invalidate_user_polygons(uid)
+
+            try:
+                from ml.membership import remove_polygon_membership
+                remove_polygon_membership([area_id_int])
+            except Exception as e:
+                logger.warning(f"Erro ao remover pertinência da área {area_id_int}: {e}")
 
             return jsonify({'success': True, 'message': 'Área excluída com sucesso!'})
         except Exception as e:
@@ -177,6 +235,7 @@ def grupos():
             # Salva cada feature como um polígono no banco
             saved_count = 0
             updated_count = 0
+            changed_polygons = []
 
             for feature in data['features']:
                 props = feature.get('properties', {})
@@ -190,36 +249,49 @@ def grupos():
                     polygon = Polygon.query.filter_by(id=db_id, user_id=uid).first()
                     if polygon:
                         polygon.group_name = group_name
-                        polygon.geojson_data = json.dumps(feature)
+                        polygon.set_geojson(feature)
+                        changed_polygons.append(polygon)
                         updated_count += 1
                         print(f"🔄 [DEBUG] Atualizando área ID {db_id}: {group_name}")
                     else:
                         print(f"⚠️ [DEBUG] Área ID {db_id} não encontrada, criando nova")
                         polygon = Polygon(
                             user_id=uid,
-                            group_name=group_name,
-                            geojson_data=json.dumps(feature)
+                            group_name=group_name
                         )
+                        polygon.set_geojson(feature)
                         db.session.add(polygon)
+                        changed_polygons.append(polygon)
                         saved_count += 1
                 else:
                     # Verifica se já existe área com mesmo nome para evitar duplicação
                     existing = Polygon.query.filter_by(user_id=uid, group_name=group_name).first()
                     if existing:
                         print(f"⚠️ [DEBUG] Área '{group_name}' já existe, atualizando")
-                        existing.geojson_data = json.dumps(feature)
+                        existing.set_geojson(feature)
+                        changed_polygons.append(existing)
                         updated_count += 1
                     else:
                         # Cria nova área
                         polygon = Polygon(
                             user_id=uid,
-                            group_name=group_name,
-                            geojson_data=json.dumps(feature)
+                            group_name=group_name
                         )
+                        polygon.set_geojson(feature)
                         db.session.add(polygon)
+                        changed_polygons.append(polygon)
                         saved_count += 1
 
             db.session.commit()
+            if saved_count or updated_count:
+                _invalidate_user_polygons(uid)
+
+                # Atualiza a pertinência cliente → área apenas das áreas alteradas
+                try:
+                    from ml.membership import refresh_polygon_membership
+                    refresh_polygon_membership(uid, [p.id for p in changed_polygons], _get_polygon_index(uid))
+                except Exception as e:
+                    logger.warning(f"Erro ao atualizar pertinência das áreas: {e}")
 
             total_msg = []
             if saved_count > 0:
@@ -250,8 +322,6 @@ def grupos():
 def painel():
     # Calcula estatísticas de clientes por área
     try:
-        from ml.geo_utils import GeoUtils
-        
         # Obtém o ID do usuário logado
         user_id = session.get('user_id')
         if not user_id:
@@ -263,89 +333,29 @@ def painel():
         except:
             uid = user_id
         
-        # Busca apenas os clientes do usuário logado (não pontos de base)
-        clients = LatLong.query.filter_by(id_user=uid, user_point=False).all()
-        clients_data = [{
-            'id': c.id, 
-            'latitude': c.latitude, 
-            'longitude': c.longitude,
-            'hash_client': c.hash_client
-        } for c in clients]
+        # Conta apenas os clientes do usuário logado (não pontos de base)
+        total_clients = LatLong.query.filter_by(id_user=uid, user_point=False).count()
         
-        # Busca apenas os polígonos (áreas) do usuário logado
-        polygons = Polygon.query.filter_by(user_id=uid).all()
-        polygons_data = []
+        # Índice espacial das áreas do usuário (em cache entre requisições)
+        polygon_index = _get_polygon_index(uid)
+        polygons_data = polygon_index.get_polygons()
         
-        for p in polygons:
-            try:
-                geojson = json.loads(p.geojson_data)
-                
-                # Extrai coordenadas do GeoJSON conforme o formato
-                if geojson.get('type') == 'Feature':
-                    geometry = geojson.get('geometry', {})
-                    if geometry.get('type') == 'Polygon':
-                        # GeoJSON Polygon tem coordenadas em [[[lon, lat], ...]]
-                        coords_array = geometry.get('coordinates', [[]])[0]
-                    elif geometry.get('type') == 'Rectangle':
-                        # Retângulo também tem formato similar
-                        coords_array = geometry.get('coordinates', [[]])[0]
-                    else:
-                        print(f"⚠️  Tipo de geometria não suportado: {geometry.get('type')}")
-                        continue
-                elif geojson.get('type') == 'Polygon':
-                    coords_array = geojson.get('coordinates', [[]])[0]
-                else:
-                    print(f"⚠️  Tipo de GeoJSON não suportado: {geojson.get('type')}")
-                    continue
-                
-                # Converte [lon, lat] para [lat, lon] como esperado pelo GeoUtils
-                coords = [[c[1], c[0]] for c in coords_array] if coords_array else []
-                
-                if len(coords) >= 3:
-                    polygons_data.append({
-                        'id': p.id,
-                        'name': p.group_name,
-                        'coordinates': coords
-                    })
-                else:
-                    print(f"⚠️  Área '{p.group_name}' tem menos de 3 coordenadas")
-                    
-            except Exception as e:
-                print(f"❌ Erro ao processar área '{p.group_name}': {e}")
-                import traceback
-                traceback.print_exc()
-                continue
-        
-        # Filtra clientes por área usando otimização
+        # Contagens por área lidas da pertinência materializada
         if polygons_data:
-            result = GeoUtils.filter_clients_by_polygons_optimized(
-                clients_data, 
-                polygons_data
-            )
+            counts, clients_with_area = _get_membership_counts(uid, polygon_index)
             
             # Calcula estatísticas
             clients_by_area = {}
-            clients_with_area = set()
-            
             for polygon in polygons_data:
-                poly_id = polygon['id']
-                poly_name = polygon['name']
-                clients_in_area = result.get(poly_id, [])
-                clients_by_area[poly_name] = len(clients_in_area)
-                
-                # Adiciona IDs ao set de clientes com área
-                for client in clients_in_area:
-                    clients_with_area.add(client.get('id'))
+                clients_by_area[polygon['name']] = counts.get(polygon['id'], 0)
             
             # Calcula clientes sem área
-            total_clients = len(clients_data)
-            clients_without_area = total_clients - len(clients_with_area)
+            clients_without_area = total_clients - clients_with_area
             
         else:
             # Sem áreas cadastradas
             clients_by_area = {}
-            clients_without_area = len(clients_data)
-            total_clients = len(clients_data)
+            clients_without_area = total_clients
         
         stats = {
             'clients_by_area': clients_by_area,
@@ -367,8 +377,6 @@ def painel():
 def painel_stats():
     """Endpoint API para obter estatísticas de clientes por área"""
     try:
-        from ml.geo_utils import GeoUtils
-        
         # Obtém o ID do usuário logado
         user_id = session.get('user_id')
         if not user_id:
@@ -386,94 +394,32 @@ def painel_stats():
         except:
             uid = user_id
         
-        # Busca apenas os clientes do usuário logado (não pontos de base)
-        clients = LatLong.query.filter_by(id_user=uid, user_point=False).all()
-        clients_data = [{
-            'id': c.id, 
-            'latitude': c.latitude, 
-            'longitude': c.longitude,
-            'hash_client': c.hash_client
-        } for c in clients]
-        
-        # Busca apenas os polígonos (áreas) do usuário logado
-        polygons = Polygon.query.filter_by(user_id=uid).all()
-        polygons_data = []
+        # Conta apenas os clientes do usuário logado (não pontos de base)
+        total_clients = LatLong.query.filter_by(id_user=uid, user_point=False).count()
         
-        for p in polygons:
-            try:
-                geojson = json.loads(p.geojson_data)
-                
-                # Extrai coordenadas do GeoJSON conforme o formato
-                if geojson.get('type') == 'Feature':
-                    geometry = geojson.get('geometry', {})
-                    if geometry.get('type') == 'Polygon':
-                        # GeoJSON Polygon tem coordenadas em [[[lon, lat], ...]]
-                        coords_array = geometry.get('coordinates', [[]])[0]
-                    elif geometry.get('type') == 'Rectangle':
-                        # Retângulo também tem formato similar
-                        coords_array = geometry.get('coordinates', [[]])[0]
-                    else:
-                        print(f"⚠️  Tipo de geometria não suportado: {geometry.get('type')}")
-                        continue
-                elif geojson.get('type') == 'Polygon':
-                    coords_array = geojson.get('coordinates', [[]])[0]
-                else:
-                    print(f"⚠️  Tipo de GeoJSON não suportado: {geojson.get('type')}")
-                    continue
-                
-                # Converte [lon, lat] para [lat, lon] como esperado pelo GeoUtils
-                coords = [[c[1], c[0]] for c in coords_array] if coords_array else []
-                
-                if len(coords) >= 3:
-                    polygons_data.append({
-                        'id': p.id,
-                        'name': p.group_name,
-                        'coordinates': coords
-                    })
-                else:
-                    print(f"⚠️  Área '{p.group_name}' tem menos de 3 coordenadas")
-                    
-            except Exception as e:
-                print(f"❌ Erro ao processar área '{p.group_name}': {e}")
-                import traceback
-                traceback.print_exc()
-                continue
+        # Índice espacial das áreas do usuário (em cache entre requisições)
+        polygon_index = _get_polygon_index(uid)
+        polygons_data = polygon_index.get_polygons()
         
-        # Filtra clientes por área usando otimização
+        # Contagens por área lidas da pertinência materializada
         if polygons_data:
-            result = GeoUtils.filter_clients_by_polygons_optimized(
-                clients_data, 
-                polygons_data
-            )
+            counts, clients_with_area = _get_membership_counts(uid, polygon_index)
             
             # Calcula estatísticas
             clients_by_area = []
-            clients_with_area = set()
-            
             for polygon in polygons_data:
-                poly_id = polygon['id']
-                poly_name = polygon['name']
-                clients_in_area = result.get(poly_id, [])
-                count = len(clients_in_area)
-                
                 clients_by_area.append({
-                    'area_name': poly_name,
-                    'count': count
+                    'area_name': polygon['name'],
+                    'count': counts.get(polygon['id'], 0)
                 })
-                
-                # Adiciona IDs ao set de clientes com área
-                for client in clients_in_area:
-                    clients_with_area.add(client.get('id'))
             
             # Calcula clientes sem área
-            total_clients = len(clients_data)
-            clients_without_area = total_clients - len(clients_with_area)
+            clients_without_area = total_clients - clients_with_area
             
         else:
             # Sem áreas cadastradas
             clients_by_area = []
-            clients_without_area = len(clients_data)
-            total_clients = len(clients_data)
+            clients_without_area = total_clients
         
         return jsonify({
             'success': True,
@@ -916,6 +862,7 @@ def pontosSaida():
                     'latitude': p.latitude,
                     'longitude': p.longitude,
                     'hash_client': p.hash_client or 'BASE',
+                    'range_km': p.range_km,
                     'created_at': p.created_at.isoformat() if p.created_at else None
                 })
             
@@ -952,11 +899,13 @@ def pontosSaida():
                 hash_client=nome,  # Armazena nome temporariamente aqui
                 latitude=float(latitude),
                 longitude=float(longitude),
+                range_km=float(range_km) if range_km is not None else None,
                 user_point=True  # Marca como ponto base
             )
             
             db.session.add(novo_ponto)
             db.session.commit()
+            _invalidate_user_depots(uid)
             
             return jsonify({
                 'success': True,
@@ -966,7 +915,7 @@ def pontosSaida():
                     'nome': nome,
                     'latitude': novo_ponto.latitude,
                     'longitude': novo_ponto.longitude,
-                    'range_km': range_km
+                    'range_km': novo_ponto.range_km
                 }
             })
             
@@ -1002,8 +951,11 @@ def pontosSaida():
                 ponto.latitude = float(data['latitude'])
             if 'longitude' in data:
                 ponto.longitude = float(data['longitude'])
+            if 'range' in data:
+                ponto.range_km = float(data['range']) if data['range'] is not None else None
             
             db.session.commit()
+            _invalidate_user_depots(uid)
             
             return jsonify({
                 'success': True,
@@ -1012,7 +964,8 @@ def pontosSaida():
                     'id': ponto.id,
                     'nome': ponto.hash_client,
                     'latitude': ponto.latitude,
-                    'longitude': ponto.longitude
+                    'longitude': ponto.longitude,
+                    'range_km': ponto.range_km
                 }
             })
             
@@ -1042,6 +995,7 @@ def pontosSaida():
             
             db.session.delete(ponto)
             db.session.commit()
+            _invalidate_user_depots(uid)
             
             return jsonify({'success': True, 'message': 'Ponto Base excluído com sucesso!'})
             
@@ -1191,6 +1145,7 @@ def clientes():
                 lon_col = find_col('longitude', 'lon', 'lng', 'longitud')
 
                 registros = 0
+                novas_localizacoes = []
                 user_id = session.get('user_id', 'anon')
                 try:
                     uid = int(user_id)
@@ -1263,11 +1218,22 @@ def clientes():
                                     created_at=datetime.now()
                                 )
                                 db.session.add(loc)
+                                novas_localizacoes.append(loc)
                             except Exception:
                                 # ignora valores inválidos de coordenada
                                 pass
 
                 db.session.commit()
+                _invalidate_user_clients(uid)
+
+                # Atualiza a pertinência cliente → área apenas dos pontos novos
+                if novas_localizacoes:
+                    try:
+                        from ml.membership import refresh_clients_membership
+                        refresh_clients_membership(uid, [loc.id for loc in novas_localizacoes], _get_polygon_index(uid))
+                    except Exception as e:
+                        logger.warning(f"Erro ao atualizar pertinência dos clientes importados: {e}")
+
                 flash(f'{registros} clientes importados com sucesso!', 'success')
                 return redirect(url_for('main.clientes'))
 
@@ -1317,6 +1283,8 @@ def api_latlongs():
     """Retorna pontos de lat/long para um usuário em JSON.
     Query params:
       - user_id (opcional) : se omitido, usa sessão
+      - bbox (opcional)    : oeste,sul,leste,norte - só pontos dentro da área visível
+      - zoom (opcional)    : agrupa pontos de cliente no mesmo pixel (campo 'count')
     """
     user_id = request.args.get('user_id') or session.get('user_id')
     try:
@@ -1329,30 +1297,114 @@ def api_latlongs():
         except Exception:
             return jsonify({'success': True, 'points': []})
 
-        points = LatLong.query.filter_by(id_user=uid).all()
-        data = []
-        for p in points:
-            data.append({
-                'id': p.id,
-                'latitude': p.latitude,
-                'longitude': p.longitude,
-                'user_point': bool(p.user_point),
-                'hash_client': p.hash_client
-            })
+        from ml.geo_utils import GeoUtils
+        from ml.viewport import query_viewport_points, parse_zoom
+        try:
+            bbox = GeoUtils.parse_bbox(request.args['bbox']) if request.args.get('bbox') else None
+            zoom = parse_zoom(request.args.get('zoom'))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        data = query_viewport_points(uid, bbox=bbox, zoom=zoom)
 
         return jsonify({'success': True, 'points': data})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@main.route('/api/clusters')
+def api_clusters():
+    """Retorna os pontos de cliente do usuário da sessão agrupados por zoom (clusters com contagem e centróide).
+    Query params:
+      - zoom (obrigatório) : zoom atual do mapa
+      - bbox (opcional)    : oeste,sul,leste,norte - só clusters dentro da área visível
+    Pontos de saída (user_point=True) vêm à parte em 'depots', sem agrupamento.
+    """
+    user_id = session.get('user_id')
+    try:
+        if not user_id:
+            return jsonify({'success': True, 'clusters': [], 'depots': []})
+
+        try:
+            uid = int(user_id)
+        except Exception:
+            return jsonify({'success': True, 'clusters': [], 'depots': []})
+
+        from ml.geo_utils import GeoUtils
+        from ml.viewport import parse_zoom
+        from ml.point_clusters import get_point_clusters
+        try:
+            bbox = GeoUtils.parse_bbox(request.args['bbox']) if request.args.get('bbox') else None
+            zoom = parse_zoom(request.args.get('zoom'))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        if zoom is None:
+            return jsonify({'success': False, 'error': 'Parâmetro zoom é obrigatório'}), 400
+
+        clusters = get_point_clusters(uid).get_clusters(bbox, zoom)
+
+        depots = [{
+            'id': p.id,
+            'hash_client': p.hash_client,
+            'latitude': p.latitude,
+            'longitude': p.longitude
+        } for p in LatLong.query.filter_by(id_user=uid, user_point=True).all()]
+
+        return jsonify({'success': True, 'zoom': zoom, 'clusters': clusters, 'depots': depots})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@main.route('/tiles/<int:z>/<int:x>/<int:y>')
+def tiles(z, x, y):
+    """Tile GeoJSON (XYZ) com clusters de clientes, pontos de saída e áreas simplificadas.
+    Cada feature traz a camada em properties.layer ('clients', 'depots' ou 'areas').
+    Responde 304 quando o ETag enviado pelo navegador (If-None-Match) ainda é válido.
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'success': False, 'error': 'Não autenticado'}), 401
+
+    try:
+        uid = int(user_id)
+    except Exception:
+        return jsonify({'success': False, 'error': 'Usuário inválido'}), 400
+
+    try:
+        from ml.tiles import get_tile, tile_data_version
+        from ml.point_clusters import get_point_clusters
+        try:
+            etag, body = get_tile(
+                uid, z, x, y,
+                lambda: _get_polygon_index(uid),
+                lambda: get_point_clusters(uid),
+                tile_data_version(uid)
+            )
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        # Tile inalterado: o navegador reaproveita a cópia que já tem
+        if etag in request.if_none_match:
+            response = make_response('', 304)
+        else:
+            response = make_response(body)
+            response.mimetype = 'application/geo+json'
+        response.set_etag(etag)
+        return response
+    except Exception as e:
+        logger.error(f"❌ [TILES] Erro ao gerar tile {z}/{x}/{y}: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @main.route('/autenticado/area-statistics', methods=['POST'])
 def get_area_statistics():
     """
     Retorna estatísticas de vendas para uma lista de clientes (hashes)
-    Usado quando o usuário seleciona um polígono no mapa
+    Usado para áreas desenhadas no mapa que ainda não foram salvas
+    (áreas salvas usam /autenticado/area-statistics/areas, por ID)
     
-    IMPORTANTE: OrderHistory e ClientName estão em bancos diferentes,
-    então fazemos queries separadas e processamos os dados em memória.
+    As vendas são agregadas por cliente em SQL (GROUP BY hash_cliente), sem
+    IN (...) com os hashes recebidos e sem carregar as linhas do histórico.
     """
     try:
         data = request.get_json()
@@ -1360,7 +1412,6 @@ def get_area_statistics():
         clientes_hashes = data.get('clientes', [])
         
         print(f"📊 [STATS] User: {user_id} | Clientes: {len(clientes_hashes)}")
-        print(f"📊 [STATS] Hashes recebidos: {clientes_hashes[:3]}..." if len(clientes_hashes) > 3 else f"📊 [STATS] Hashes: {clientes_hashes}")
         
         # Tenta converter user_id
         try:
@@ -1368,92 +1419,13 @@ def get_area_statistics():
         except:
             uid = user_id
         
+        from ml.area_statistics import aggregate_sales_by_client, summarize, empty_statistics
+        
         # Se não há clientes, retorna zeros
         if not clientes_hashes:
-            return jsonify({
-                'success': True,
-                'total_clientes': 0,
-                'total_pedidos': 0,
-                'valor_total': 0.0,
-                'ticket_medio': 0.0,
-                'ultima_compra': None
-            })
-        
-        # Busca TODAS as vendas deste usuário (sem filtro de hash primeiro)
-        # para debug
-        total_vendas_usuario = OrderHistory.query.filter_by(user_id=uid).count()
-        print(f"[STATS] Total de vendas do usuário {uid}: {total_vendas_usuario}")
-        
-        # Busca dados do histórico de vendas FILTRADO pelos hashes
-        vendas = OrderHistory.query.filter(
-            OrderHistory.user_id == uid,
-            OrderHistory.hash_cliente.in_(clientes_hashes)
-        ).all()
-        
-        print(f"[STATS] Vendas encontradas: {len(vendas)}")
-        
-        # Se não há vendas, retorna zeros
-        if not vendas:
-            print(f"[STATS] Nenhuma venda encontrada para os hashes fornecidos")
-            # Debug: mostra alguns hashes do banco
-            sample_vendas = OrderHistory.query.filter_by(user_id=uid).limit(3).all()
-            if sample_vendas:
-                print(f"[STATS] Exemplo de hashes no banco:")
-                for v in sample_vendas:
-                    print(f"   - {v.hash_cliente}")
-            
-            return jsonify({
-                'success': True,
-                'total_clientes': 0,
-                'total_pedidos': 0,
-                'valor_total': 0.0,
-                'ticket_medio': 0.0,
-                'ultima_compra': None
-            })
-        
-        # Processa dados em memória
-        clientes_unicos = set()
-        total_pedidos = 0
-        valores = []
-        datas = []
-        
-        for venda in vendas:
-            clientes_unicos.add(venda.hash_cliente)
-            total_pedidos += 1
-            
-            if venda.valor_total_pagamento:
-                valores.append(float(venda.valor_total_pagamento))
-            
-            if venda.data_compra:
-                datas.append(venda.data_compra)
+            return jsonify({'success': True, **empty_statistics()})
         
-        valor_total = sum(valores) if valores else 0.0
-        ticket_medio = (valor_total / len(valores)) if valores else 0.0
-        
-        # Formata a última compra
-        ultima_compra_str = None
-        if datas:
-            # Ordena e pega a mais recente
-            datas_ordenadas = sorted(datas, reverse=True)
-            ultima = datas_ordenadas[0]
-            
-            try:
-                if isinstance(ultima, datetime):
-                    ultima_compra_str = ultima.strftime('%d/%m/%Y')
-                else:
-                    dt = datetime.strptime(str(ultima), '%Y-%m-%d %H:%M:%S')
-                    ultima_compra_str = dt.strftime('%d/%m/%Y')
-            except:
-                ultima_compra_str = str(ultima)
-        
-        result = {
-            'success': True,
-            'total_clientes': len(clientes_unicos),
-            'total_pedidos': total_pedidos,
-            'valor_total': valor_total,
-            'ticket_medio': ticket_medio,
-            'ultima_compra': ultima_compra_str
-        }
+        result = {'success': True, **summarize(clientes_hashes, aggregate_sales_by_client(uid))}
         
         print(f"[STATS] Resultado: {result}")
         
@@ -1474,6 +1446,42 @@ def get_area_statistics():
         }), 500
 
 
+@main.route('/autenticado/area-statistics/areas', methods=['GET'])
+def get_areas_statistics():
+    """
+    Retorna as estatísticas de vendas de todas as áreas salvas do usuário em uma chamada.
+    Query params:
+      - ids (opcional) : IDs de áreas separados por vírgula (padrão: todas)
+    A pertinência cliente → área é resolvida no servidor (tabela KNN).
+    Resposta: {success, areas: {polygon_id: {total_clientes, total_pedidos, valor_total,
+               ticket_medio, ultima_compra, clientes_na_area}}}
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'success': False, 'error': 'Não autenticado'}), 401
+
+    try:
+        uid = int(user_id)
+    except Exception:
+        return jsonify({'success': False, 'error': 'Usuário inválido'}), 400
+
+    try:
+        polygon_ids = None
+        if request.args.get('ids'):
+            try:
+                polygon_ids = [int(pid) for pid in request.args['ids'].split(',') if pid.strip()]
+            except ValueError:
+                return jsonify({'success': False, 'error': 'Parâmetro ids inválido'}), 400
+
+        from ml.area_statistics import get_area_statistics as compute_area_statistics
+        stats = compute_area_statistics(uid, _get_polygon_index(uid), polygon_ids)
+
+        return jsonify({'success': True, 'areas': {str(pid): values for pid, values in stats.items()}})
+    except Exception as e:
+        logger.error(f"❌ [STATS] Erro ao calcular estatísticas por área: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @main.route('/autenticado/historicovendas', methods=['GET', 'POST', 'DELETE'])
 def historicovendas():
     """
@@ -1769,6 +1777,8 @@ def roteirizacao_get_grupos():
     """
     API específica para roteirização: retorna apenas polígonos/áreas do usuário.
     Usado na etapa 1 da roteirização para seleção de grupos.
+    As coordenadas vêm da versão simplificada da área (≈ 11 m); ?geojson=1 inclui
+    também o GeoJSON da mesma geometria.
     """
     try:
         # 🔍 DEBUG: Verificar estado da sessão
@@ -1790,10 +1800,17 @@ def roteirizacao_get_grupos():
         
         logger.info(f"🎯 [ROTEIRIZAÇÃO] Buscando grupos para user_id: {uid}")
         
-        # Buscar APENAS polígonos do usuário (não clientes)
-        polygons = Polygon.query.filter_by(user_id=uid).order_by(Polygon.created_at.desc()).all()
+        # Buscar APENAS polígonos do usuário (não clientes) - geometria já compilada
+        from shapely.geometry import mapping
+        from ml.geo_utils import LIST_TOLERANCE_DEG
+        include_geojson = request.args.get('geojson') in ('1', 'true')
+        polygons = sorted(
+            _get_polygon_index(uid).get_polygons(),
+            key=lambda p: p['created_at'] or datetime.min,
+            reverse=True
+        )
         
-        logger.info(f"📊 [ROTEIRIZAÇÃO] Encontrados {len(polygons)} polígonos no banco")
+        logger.info(f"📊 [ROTEIRIZAÇÃO] Encontrados {len(polygons)} polígonos válidos")
         
         if not polygons:
             logger.warning(f"⚠️ [ROTEIRIZAÇÃO] Nenhum grupo encontrado para user_id: {uid}")
@@ -1805,43 +1822,26 @@ def roteirizacao_get_grupos():
         
         result = []
         for p in polygons:
-            try:
-                geojson = json.loads(p.geojson_data)
-                
-                # Validar se GeoJSON tem coordenadas válidas
-                coords = []
-                if isinstance(geojson, dict):
-                    geometry = geojson.get('geometry', {})
-                    if geometry:
-                        coords_raw = geometry.get('coordinates', [])
-                        if coords_raw and len(coords_raw) > 0:
-                            # Formato GeoJSON: [[[lon, lat], ...]]
-                            # Pega o anel externo (primeiro array)
-                            coords = coords_raw[0] if len(coords_raw) > 0 else []
-                
-                # Verificar se tem pelo menos 3 pontos (polígono válido)
-                if not coords or len(coords) < 3:
-                    logger.warning(f"⚠️ [ROTEIRIZAÇÃO] Polígono {p.id} '{p.group_name}' tem coordenadas inválidas ({len(coords)} pontos)")
-                    continue
-                
-                # Adicionar à lista
-                grupo = {
-                    'id': p.id,
-                    'name': p.group_name,
-                    'coordinates': coords,  # [[[lon, lat], ...]]
-                    'geojson': geojson,  # GeoJSON completo
-                    'created_at': p.created_at.isoformat() if p.created_at else None
+            geometry = p.get('simplified', {}).get(LIST_TOLERANCE_DEG, p['geometry'])
+            
+            # Formato GeoJSON: anel externo em [lon, lat]
+            coords = [list(c) for c in geometry.exterior.coords]
+            
+            grupo = {
+                'id': p['id'],
+                'name': p['name'],
+                'coordinates': coords,  # [[lon, lat], ...]
+                'created_at': p['created_at'].isoformat() if p['created_at'] else None
+            }
+            if include_geojson:
+                grupo['geojson'] = {
+                    'type': 'Feature',
+                    'geometry': mapping(geometry),
+                    'properties': {'name': p['name'], 'db_id': p['id']}
                 }
-                
-                result.append(grupo)
-                logger.info(f"   ✓ Polígono {p.id}: '{p.group_name}' ({len(coords)} pontos)")
-                
-            except json.JSONDecodeError as e:
-                logger.error(f"   ✗ Erro ao decodificar JSON do polígono {p.id}: {str(e)}")
-                continue
-            except Exception as e:
-                logger.error(f"   ✗ Erro ao processar polígono {p.id}: {str(e)}")
-                continue
+            
+            result.append(grupo)
+            logger.info(f"   ✓ Polígono {p['id']}: '{p['name']}' ({len(coords)} pontos)")
         
         logger.info(f"✅ [ROTEIRIZAÇÃO] Retornando {len(result)} grupos válidos")
         
@@ -1873,38 +1873,33 @@ def filter_clients_by_areas():
     except:
         uid = user_id
     
-    # Busca apenas clientes do usuário logado
-    clients = LatLong.query.filter_by(id_user=uid, user_point=False).all()
-    clients_data = [{'id': c.id, 'latitude': c.latitude, 'longitude': c.longitude} 
-                    for c in clients]
-    
-    # Busca apenas polígonos do usuário logado que estão na seleção
-    polygons = Polygon.query.filter(
-        Polygon.id.in_(selected_ids),
-        Polygon.user_id == uid
-    ).all()
-    polygons_data = [{'id': p.id, 'coordinates': json.loads(p.geojson_data)} 
-                     for p in polygons]
+    try:
+        selected_ids = [int(pid) for pid in selected_ids]
+    except (TypeError, ValueError):
+        return jsonify({'counts': {}, 'error': 'IDs de polígonos inválidos'}), 400
     
-    # Filtra com otimização
-    from ml.geo_utils import GeoUtils
-    result = GeoUtils.filter_clients_by_polygons_optimized(
-        clients_data, 
-        polygons_data
-    )
+    # Contagens lidas da pertinência materializada (apenas áreas do usuário)
+    polygon_index = _get_polygon_index(uid)
+    selected_ids = [pid for pid in selected_ids if pid in polygon_index.position]
+    counts, _ = _get_membership_counts(uid, polygon_index, selected_ids)
     
-    # Retorna contagens
-    counts = {pid: len(clients) for pid, clients in result.items()}
     return jsonify({'counts': counts})
 
 @main.route('/autenticado/roteirizacao/processar', methods=['POST'])
 def processar_roteirizacao():
-    """Processa roteirização usando K-Means clustering com filtro de tamanho"""
+    """
+    Processa roteirização usando K-Means clustering com filtro de tamanho
+    
+    Body JSON: dias, grupos_selecionados, max_clients_per_day (opcional),
+    respeitar_range, agrupamento, algoritmo (ver /autenticado/roteirizacao/algoritmos),
+    tempo_limite_s e async. Com async=true a roteirização roda
+    em segundo plano e a resposta (202) traz o job_id para consulta em
+    /autenticado/roteirizacao/jobs/<job_id>.
+    """
+    from ml.routing_service import RoutingError, validate_routing_params, plan_routes
+    
     try:
-        data = request.json
-        dias = data.get('dias')
-        grupos_selecionados = data.get('grupos_selecionados', [])
-        max_clients_per_day = data.get('max_clients_per_day')  # Opcional
+        data = request.json or {}
         
         # Obtém user_id da sessão
         user_id = session.get('user_id')
@@ -1919,157 +1914,26 @@ def processar_roteirizacao():
         except:
             uid = user_id
         
-        # Validações
-        if not dias or not isinstance(dias, int) or dias <= 0:
-            return jsonify({
-                'success': False,
-                'error': 'Número de dias inválido'
-            }), 400
-        
-        if dias > 30:
-            return jsonify({
-                'success': False,
-                'error': 'Número máximo de dias é 30'
-            }), 400
-        
-        # Valida max_clients_per_day se fornecido
-        if max_clients_per_day is not None:
-            if not isinstance(max_clients_per_day, int) or max_clients_per_day < 1 or max_clients_per_day > 100:
-                return jsonify({
-                    'success': False,
-                    'error': 'Máximo de clientes por dia deve estar entre 1 e 100'
-                }), 400
-        
-        if not grupos_selecionados or len(grupos_selecionados) == 0:
-            return jsonify({
-                'success': False,
-                'error': 'Nenhum grupo selecionado'
-            }), 400
-        
-        # Busca apenas os clientes do usuário logado
-        clients = LatLong.query.filter_by(id_user=uid, user_point=False).all()
-        
-        if not clients:
-            return jsonify({
-                'success': False,
-                'error': 'Nenhum cliente cadastrado'
-            }), 400
-        
-        # Prepara DataFrame com clientes
-        import pandas as pd
-        clients_data = [{
-            'id': c.id,
-            'latitude': c.latitude,
-            'longitude': c.longitude,
-            'hash_client': c.hash_client
-        } for c in clients]
-        df_clientes = pd.DataFrame(clients_data)
-        
-        # Busca apenas polígonos do usuário logado que estão selecionados
-        polygons = Polygon.query.filter(
-            Polygon.id.in_(grupos_selecionados),
-            Polygon.user_id == uid
-        ).all()
-        
-        if not polygons:
-            return jsonify({
-                'success': False,
-                'error': 'Grupos selecionados não encontrados'
-            }), 400
-        
-        polygons_data = []
-        for p in polygons:
-            geojson = json.loads(p.geojson_data)
-            # Extrai coordenadas do GeoJSON (geometry.coordinates[0])
-            # GeoJSON format: {"type": "Feature", "geometry": {"type": "Polygon", "coordinates": [[[lon, lat], ...]]}}
-            coords = []
-            if isinstance(geojson, dict):
-                geometry = geojson.get('geometry', {})
-                if geometry:
-                    coords_raw = geometry.get('coordinates', [])
-                    if coords_raw and len(coords_raw) > 0:
-                        # coords_raw[0] é o anel externo do polígono
-                        # Formato GeoJSON: [lon, lat], converter para [lat, lon]
-                        coords = [[c[1], c[0]] for c in coords_raw[0]]
-            
-            print(f"🔍 Polígono {p.group_name} (ID: {p.id}): {len(coords)} coordenadas extraídas")
-            
-            polygons_data.append({
-                'id': p.id,
-                'name': p.group_name,
-                'coordinates': coords
-            })
-        
-        print(f"📊 Total de polígonos preparados: {len(polygons_data)}")
-        
-        # Executa K-Means com filtro de polígonos (usando KMM para filtrar)
-        from ml.KMM import run_kmeans_clustering
-        
-        df_result, num_clusters, clients_count = run_kmeans_clustering(
-            df_clientes,
-            dias,
-            selected_polygon_ids=grupos_selecionados,
-            polygons_data=polygons_data
-        )
-        
-        if df_result.empty:
-            return jsonify({
-                'success': False,
-                'error': 'Nenhum cliente encontrado nas áreas selecionadas'
-            }, 400)
-        
-        # Converte DataFrame filtrado para formato do route_optimizer
-        from ml.route_optimizer import convert_kmm_to_optimizer_format, create_routes_knn, format_result_for_api
-        
-        filtered_clients = convert_kmm_to_optimizer_format(df_result)
-        
-        print(f"🎯 Iniciando route_optimizer: {len(filtered_clients)} clientes, {dias} dias, limite: {max_clients_per_day}")
-        
-        # Aplica algoritmo de roteirização com filtro de tamanho
-        groups = create_routes_knn(
-            filtered_clients,
-            n_days=dias,
-            max_clients_per_day=max_clients_per_day
-        )
+        params = validate_routing_params(data)
         
-        if not groups:
+        if data.get('async'):
+            from ml.routing_jobs import submit_job
+            job_id = submit_job(uid, params)
             return jsonify({
-                'success': False,
-                'error': 'Erro ao criar grupos de roteirização'
-            }), 500
-        
-        # Busca scores dos clientes para incluir no resultado
-        scores_map = {}
-        try:
-            client_scores = ClientScore.query.filter_by(user_id=uid).all()
-            for score in client_scores:
-                scores_map[score.hash_cliente] = {
-                    'score_total': score.score_total,
-                    'segmento': score.get_segmento() if hasattr(score, 'get_segmento') else None
-                }
-        except Exception as e:
-            logger.warning(f"Erro ao buscar scores: {e}")
-        
-        # Cria mapeamento de polígonos (id -> nome)
-        polygons_map = {p['id']: p['name'] for p in polygons_data}
-        
-        # Formata resultado para API
-        result = format_result_for_api(groups, scores_map, polygons_map)
-        
-        # Adiciona informações extras
-        result['clients_count_by_polygon'] = clients_count
-        result['requested_days'] = dias
-        result['max_clients_per_day'] = max_clients_per_day
-        
-        # Mensagem descritiva
-        if result['split_groups'] > 0:
-            result['message'] = f"{result['total_groups']} grupos criados para {dias} dias! ({result['split_groups']} grupos foram divididos pelo filtro de tamanho)"
-        else:
-            result['message'] = f"{result['total_groups']} grupos criados para {dias} dias!"
+                'success': True,
+                'job_id': job_id,
+                'status': 'queued',
+                'status_url': url_for('main.roteirizacao_job_status', job_id=job_id),
+                'result_url': url_for('main.roteirizacao_job_resultado', job_id=job_id)
+            }), 202
         
-        print(f"✅ Roteirização concluída: {result['total_groups']} grupos ({result['split_groups']} divididos)")
+        return jsonify(plan_routes(uid, params))
         
-        return jsonify(result)
+    except RoutingError as e:
+        return jsonify({
+            'success': False,
+            'error': e.message
+        }), e.status_code
         
     except Exception as e:
         print(f"Erro ao processar roteirização: {e}")
@@ -2081,6 +1945,74 @@ def processar_roteirizacao():
         }), 500
 
 
+@main.route('/autenticado/roteirizacao/jobs/<job_id>', methods=['GET', 'DELETE'])
+def roteirizacao_job_status(job_id):
+    """
+    GET    -> estado e progresso de um job de roteirização
+    DELETE -> cancela o job (na fila ou em execução)
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'success': False, 'error': 'Usuário não autenticado'}), 401
+    
+    from ml.routing_jobs import get_job, cancel_job
+    
+    if request.method == 'DELETE':
+        job = cancel_job(int(user_id), job_id)
+    else:
+        job = get_job(int(user_id), job_id)
+    
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job não encontrado'}), 404
+    
+    return jsonify({'success': True, **job.to_dict()})
+
+
+@main.route('/autenticado/roteirizacao/jobs/<job_id>/resultado')
+def roteirizacao_job_resultado(job_id):
+    """Resultado de um job concluído (mesmo formato da resposta síncrona de /processar)"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'success': False, 'error': 'Usuário não autenticado'}), 401
+    
+    from ml.routing_jobs import get_job
+    from base.models import RoutingJob
+    
+    job = get_job(int(user_id), job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job não encontrado'}), 404
+    
+    if job.status == RoutingJob.STATUS_FAILED:
+        return jsonify({'success': False, 'error': job.error}), job.status_code or 500
+    
+    if job.status != RoutingJob.STATUS_DONE:
+        return jsonify({
+            **job.to_dict(),
+            'success': False,
+            'error': f'Job ainda não concluído ({job.status})'
+        }), 409
+    
+    # O resultado já está serializado em JSON
+    return make_response(job.result, 200, {'Content-Type': 'application/json'})
+
+
+@main.route('/autenticado/roteirizacao/algoritmos')
+def roteirizacao_algoritmos():
+    """Algoritmos de agrupamento aceitos em /processar (parâmetro algoritmo), com a complexidade esperada"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'success': False, 'error': 'Usuário não autenticado'}), 401
+    
+    # O registro (com 'balanced') é preenchido na importação de ml.clustering
+    from ml.clustering import ALGORITHMS, ALGORITHM_AUTO
+    
+    return jsonify({
+        'success': True,
+        'default': ALGORITHM_AUTO,
+        'algoritmos': [algorithm.to_dict() for algorithm in ALGORITHMS.values()]
+    })
+
+
 # ============================================================================
 # ENDPOINTS DE API - SCORES RFM
 # ============================================================================
@@ -2280,7 +2212,9 @@ def salvar_calendario():
                 "cluster_id": int,
                 "num_clientes": int,
                 "score_medio": float,
-                "polygon_name": str
+                "polygon_name": str,
+                "centro": {"lat": float, "lng": float},
+                "clientes": [{"hash_cliente", "latitude", "longitude", "score"}, ...]
             }
         ],
         "total_clusters": int,
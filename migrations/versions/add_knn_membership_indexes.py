@@ -0,0 +1,28 @@
+"""Add membership indexes to KNN_data
+
+Revision ID: add_knn_membership_indexes
+Revises: add_max_clients_per_day
+Create Date: 2025-11-20
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_knn_membership_indexes'
+down_revision = 'add_max_clients_per_day'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Cria índices usados pela pertinência cliente → área materializada"""
+    op.create_index('idx_knn_polygon_client', 'KNN_data', ['polygon_id', 'id_client'])
+    op.create_index('idx_knn_client', 'KNN_data', ['id_client'])
+
+
+def downgrade():
+    """Remove índices de pertinência da tabela KNN_data"""
+    op.drop_index('idx_knn_client', table_name='KNN_data')
+    op.drop_index('idx_knn_polygon_client', table_name='KNN_data')
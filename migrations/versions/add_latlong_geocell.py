@@ -0,0 +1,37 @@
+"""Add geocell (spatial grid cell) to latlong_data
+
+Revision ID: add_latlong_geocell
+Revises: add_polygon_compiled_geometry
+Create Date: 2025-11-22
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_latlong_geocell'
+down_revision = 'add_polygon_compiled_geometry'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Adiciona a célula da grade espacial (GeoUtils.geocell) e o índice por viewport"""
+    with op.batch_alter_table('latlong_data', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('geocell', sa.Integer(), nullable=True))
+    op.create_index('idx_latlong_user_geocell', 'latlong_data', ['id_user', 'geocell'])
+
+    # Preenche os pontos existentes (mesma fórmula de GeoUtils.geocell: células de 0.05°)
+    op.execute(
+        "UPDATE latlong_data SET geocell = "
+        "CAST((latitude + 90) / 0.05 AS INTEGER) * 7200 + CAST((longitude + 180) / 0.05 AS INTEGER) "
+        "WHERE latitude BETWEEN -90 AND 90 AND longitude BETWEEN -180 AND 180"
+    )
+
+
+def downgrade():
+    """Remove a coluna geocell e o índice por viewport"""
+    op.drop_index('idx_latlong_user_geocell', table_name='latlong_data')
+    with op.batch_alter_table('latlong_data', schema=None) as batch_op:
+        batch_op.drop_column('geocell')
@@ -0,0 +1,28 @@
+"""Add range_km (departure point service radius) to latlong_data
+
+Revision ID: add_latlong_range_km
+Revises: add_polygon_simplified_geometry
+Create Date: 2025-11-24
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_latlong_range_km'
+down_revision = 'add_polygon_simplified_geometry'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Adiciona o raio de atuação dos pontos de saída (user_point=True)"""
+    with op.batch_alter_table('latlong_data', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('range_km', sa.Float(), nullable=True))
+
+
+def downgrade():
+    """Remove o raio de atuação dos pontos de saída"""
+    with op.batch_alter_table('latlong_data', schema=None) as batch_op:
+        batch_op.drop_column('range_km')
@@ -0,0 +1,42 @@
+"""Add route quality metric columns to ndbout_data
+
+Revision ID: add_ndbout_route_metrics
+Revises: add_routing_jobs
+Create Date: 2025-11-26
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_ndbout_route_metrics'
+down_revision = 'add_routing_jobs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Adiciona as métricas de qualidade por grupo da roteirização"""
+    with op.batch_alter_table('ndbout_data', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('user_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('plan_key', sa.String(length=40), nullable=True))
+        batch_op.add_column(sa.Column('depot_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('intra_cluster_km', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('centroid_spread_km', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('depot_distance_km', sa.Float(), nullable=True))
+        batch_op.create_index('ix_ndbout_data_user_id', ['user_id'])
+        batch_op.create_index('ix_ndbout_data_plan_key', ['plan_key'])
+
+
+def downgrade():
+    """Remove as métricas de qualidade da roteirização"""
+    with op.batch_alter_table('ndbout_data', schema=None) as batch_op:
+        batch_op.drop_index('ix_ndbout_data_plan_key')
+        batch_op.drop_index('ix_ndbout_data_user_id')
+        batch_op.drop_column('depot_distance_km')
+        batch_op.drop_column('centroid_spread_km')
+        batch_op.drop_column('intra_cluster_km')
+        batch_op.drop_column('depot_id')
+        batch_op.drop_column('plan_key')
+        batch_op.drop_column('user_id')
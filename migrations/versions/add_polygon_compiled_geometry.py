@@ -0,0 +1,38 @@
+"""Add compiled geometry (WKB + bbox) to polygon_data
+
+Revision ID: add_polygon_compiled_geometry
+Revises: add_knn_membership_indexes
+Create Date: 2025-11-21
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_polygon_compiled_geometry'
+down_revision = 'add_knn_membership_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Adiciona a geometria compilada das áreas (preenchida ao salvar ou no primeiro carregamento)"""
+    with op.batch_alter_table('polygon_data', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('geometry_wkb', sa.LargeBinary(), nullable=True))
+        batch_op.add_column(sa.Column('bbox_min_lat', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('bbox_max_lat', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('bbox_min_lng', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('bbox_max_lng', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('geometry_version', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    """Remove as colunas de geometria compilada"""
+    with op.batch_alter_table('polygon_data', schema=None) as batch_op:
+        batch_op.drop_column('geometry_version')
+        batch_op.drop_column('bbox_max_lng')
+        batch_op.drop_column('bbox_min_lng')
+        batch_op.drop_column('bbox_max_lat')
+        batch_op.drop_column('bbox_min_lat')
+        batch_op.drop_column('geometry_wkb')
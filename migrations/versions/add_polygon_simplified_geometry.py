@@ -0,0 +1,28 @@
+"""Add simplified geometry levels to polygon_data
+
+Revision ID: add_polygon_simplified_geometry
+Revises: add_latlong_geocell
+Create Date: 2025-11-23
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_polygon_simplified_geometry'
+down_revision = 'add_latlong_geocell'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Adiciona as versões simplificadas das áreas (preenchidas no primeiro carregamento)"""
+    with op.batch_alter_table('polygon_data', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('geometry_simplified', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    """Remove as versões simplificadas das áreas"""
+    with op.batch_alter_table('polygon_data', schema=None) as batch_op:
+        batch_op.drop_column('geometry_simplified')
@@ -0,0 +1,43 @@
+"""Add routing_jobs_data (background routing jobs)
+
+Revision ID: add_routing_jobs
+Revises: add_latlong_range_km
+Create Date: 2025-11-25
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_routing_jobs'
+down_revision = 'add_latlong_range_km'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Cria a tabela de jobs de roteirização em segundo plano"""
+    op.create_table(
+        'routing_jobs_data',
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('progress', sa.Float(), nullable=False),
+        sa.Column('message', sa.String(length=200), nullable=True),
+        sa.Column('params', sa.Text(), nullable=True),
+        sa.Column('result', sa.Text(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('status_code', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_routing_jobs_data_user_id', 'routing_jobs_data', ['user_id'])
+
+
+def downgrade():
+    """Remove a tabela de jobs de roteirização"""
+    op.drop_index('ix_routing_jobs_data_user_id', table_name='routing_jobs_data')
+    op.drop_table('routing_jobs_data')
@@ -0,0 +1,28 @@
+"""Add heartbeat column to routing_jobs_data
+
+Revision ID: add_routing_jobs_heartbeat
+Revises: add_ndbout_route_metrics
+Create Date: 2025-11-27
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_routing_jobs_heartbeat'
+down_revision = 'add_ndbout_route_metrics'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Adiciona o heartbeat usado para detectar jobs abandonados"""
+    with op.batch_alter_table('routing_jobs_data', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    """Remove o heartbeat dos jobs de roteirização"""
+    with op.batch_alter_table('routing_jobs_data', schema=None) as batch_op:
+        batch_op.drop_column('heartbeat_at')
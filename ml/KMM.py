@@ -1,24 +1,26 @@
 import pandas as pd
-from sklearn.cluster import KMeans
 import numpy as np
 import math
-import sys
-import os
 
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-from geo_utils import GeoUtils
+from ml.geo_utils import GeoUtils
+from ml.clustering import make_kmeans, get_algorithm
 
 
-def filter_clients_by_selected_polygons(customers_df, selected_polygon_ids, polygons_data):
+def filter_clients_by_selected_polygons(customers_df, selected_polygon_ids, polygons_data, max_workers=None):
     """
     Filtra clientes que estão dentro dos polígonos selecionados de forma otimizada.
     Adiciona coluna 'polygon_id' indicando a qual polígono cada cliente pertence.
     
+    A pertinência é calculada direto sobre as colunas latitude/longitude (sem converter
+    o DataFrame em dicts). Acima de PARALLEL_MIN_POINTS clientes os pontos são divididos
+    em blocos entre processos (GeoUtils.points_in_polygons_chunked).
+    
     Args:
         customers_df (pd.DataFrame): DataFrame com todos os clientes (latitude, longitude)
         selected_polygon_ids (list): Lista de IDs dos polígonos selecionados
         polygons_data (list): Lista completa de polígonos com formato:
                              [{'id': 1, 'name': 'Grupo A', 'coordinates': [[lat, lon], ...]}, ...]
+        max_workers (int, optional): Número de processos no modo paralelo (padrão: CPUs)
     
     Returns:
         pd.DataFrame: DataFrame filtrado contendo apenas clientes dentro das áreas selecionadas
@@ -33,39 +35,31 @@ def filter_clients_by_selected_polygons(customers_df, selected_polygon_ids, poly
     if not selected_polygons:
         return pd.DataFrame(), {}
     
-    clients_list = customers_df.to_dict('records')
+    lats = pd.to_numeric(customers_df['latitude'], errors='coerce').to_numpy(dtype=float)
+    lngs = pd.to_numeric(customers_df['longitude'], errors='coerce').to_numpy(dtype=float)
     
-    clients_by_polygon = GeoUtils.filter_clients_by_polygons_optimized(
-        clients_list, 
-        selected_polygons
+    membership, polygon_ids = GeoUtils.points_in_polygons_chunked(
+        lats, lngs, selected_polygons, max_workers=max_workers
     )
     
-    # Mapeia clientes para seus polígonos
-    client_to_polygon = {}
-    clients_count = {}
+    clients_count = {p['id']: 0 for p in selected_polygons}
+    clients_count.update({pid: int(n) for pid, n in zip(polygon_ids, membership.sum(axis=0))})
     
-    for polygon_id, clients in clients_by_polygon.items():
-        clients_count[polygon_id] = len(clients)
-        for client in clients:
-            client_id = client.get('id') or client.get('hash_client')
-            if client_id:
-                client_to_polygon[client_id] = polygon_id
+    inside = membership.any(axis=1) if membership.shape[1] else np.zeros(len(customers_df), dtype=bool)
     
-    # Filtra DataFrame
-    unique_client_ids = set(client_to_polygon.keys())
+    # Cliente em mais de uma área fica com a última (mesma regra do mapeamento anterior)
+    last_polygon = membership.shape[1] - 1 - np.argmax(membership[:, ::-1], axis=1) if membership.shape[1] else None
     
-    if 'id' in customers_df.columns:
-        filtered_df = customers_df[customers_df['id'].isin(unique_client_ids)].copy()
-        filtered_df['polygon_id'] = filtered_df['id'].map(client_to_polygon)
-    elif 'hash_client' in customers_df.columns:
-        filtered_df = customers_df[customers_df['hash_client'].isin(unique_client_ids)].copy()
-        filtered_df['polygon_id'] = filtered_df['hash_client'].map(client_to_polygon)
+    filtered_df = customers_df[inside].copy()
+    if inside.any():
+        filtered_df['polygon_id'] = np.asarray(polygon_ids)[last_polygon[inside]]
     else:
-        filtered_df = customers_df.copy()
+        filtered_df['polygon_id'] = pd.Series(dtype='int64')
     
     return filtered_df, clients_count
 
-def run_kmeans_clustering(customers_df, days, selected_polygon_ids=None, polygons_data=None):
+def run_kmeans_clustering(customers_df, days, selected_polygon_ids=None, polygons_data=None, minibatch_min_points=None,
+                          algoritmo=None):
     """
     Executa o algoritmo K-Means para agrupar clientes.
     Opcionalmente filtra clientes por polígonos selecionados antes do clustering.
@@ -76,6 +70,13 @@ def run_kmeans_clustering(customers_df, days, selected_polygon_ids=None, polygon
         days (int): O número de dias para dividir os clientes, usado para calcular 'k'.
         selected_polygon_ids (list, optional): Lista de IDs dos polígonos para filtrar clientes.
         polygons_data (list, optional): Lista de dados dos polígonos (necessário se selected_polygon_ids for fornecido).
+        minibatch_min_points (int, optional): Limite para o MiniBatchKMeans (padrão: MINIBATCH_MIN_POINTS).
+        algoritmo (str, optional): Algoritmo do registro de ml/clustering.py ('kmeans', 'minibatch',
+                                   'grid', 'balanced' ou 'auto'); sem ele, o KMeans com n_init='auto' abaixo.
+                                   Com 'balanced' nenhum grupo passa de ceil(N / k) clientes.
+
+    Acima de MINIBATCH_MIN_POINTS clientes o agrupamento usa MiniBatchKMeans
+    (ml/clustering.py); o backend usado fica em df.attrs['clustering_backend'].
 
     Returns:
         pd.DataFrame: O DataFrame dos clientes (filtrados se aplicável) com uma nova coluna 'cluster'
@@ -111,14 +112,21 @@ def run_kmeans_clustering(customers_df, days, selected_polygon_ids=None, polygon
     # Seleciona as coordenadas para o clustering
     coordinates = customers_df[['latitude', 'longitude']].values
 
-    # Instancia e treina o modelo K-Means
-    # n_init='auto' é o padrão recomendado para versões futuras do scikit-learn
-    kmeans = KMeans(n_clusters=k, random_state=42, n_init='auto')
-    kmeans.fit(coordinates)
+    if algoritmo is None:
+        # Instancia e treina o modelo K-Means (MiniBatchKMeans para muitos clientes)
+        # n_init='auto' é o padrão recomendado para versões futuras do scikit-learn
+        kmeans, backend = make_kmeans(k, num_customers, n_init='auto', min_points=minibatch_min_points)
+        kmeans.fit(coordinates)
+        labels = kmeans.labels_
+    else:
+        algorithm = get_algorithm(algoritmo, num_customers, k)
+        labels = algorithm.fit(coordinates, k)
+        backend = algorithm.backend
 
     # Adiciona os rótulos dos clusters ao DataFrame original
     customers_df_copy = customers_df.copy()
-    customers_df_copy['cluster'] = kmeans.labels_
+    customers_df_copy['cluster'] = labels
+    customers_df_copy.attrs['clustering_backend'] = backend
 
     return customers_df_copy, k, clients_count
 
@@ -0,0 +1,152 @@
+"""
+Area Statistics - Estatísticas de vendas por área (Polygon)
+===========================================================
+
+Calcula no servidor as estatísticas de vendas de todas as áreas de um usuário
+em uma única chamada, sem receber a lista de clientes do navegador:
+
+1. Pertinência cliente → área lida da tabela KNN (ml/membership.py)
+2. Vendas agregadas por cliente em SQL (COUNT/SUM/MAX ... GROUP BY hash_cliente)
+3. Consolidação por área em memória (OrderHistory, LatLong e KNN ficam em
+   bancos diferentes, então não há JOIN entre eles)
+
+Nenhuma consulta usa IN (...) com os hashes dos clientes e nenhuma linha de
+OrderHistory é carregada como objeto ORM.
+
+Autor: SynapseLog
+"""
+
+import logging
+from datetime import datetime
+from sqlalchemy import func, case
+from typing import Dict, Iterable, List, Optional
+
+from base.models import db, LatLong, OrderHistory
+from ml.membership import ensure_user_membership, get_client_polygon_pairs
+
+logger = logging.getLogger(__name__)
+
+
+def empty_statistics() -> Dict:
+    """Estatísticas de uma área sem vendas"""
+    return {
+        'total_clientes': 0,
+        'total_pedidos': 0,
+        'valor_total': 0.0,
+        'ticket_medio': 0.0,
+        'ultima_compra': None,
+        'clientes_na_area': 0
+    }
+
+
+def _format_date(value) -> Optional[str]:
+    """Data da última compra no formato dd/mm/aaaa"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.strftime('%d/%m/%Y')
+    try:
+        return datetime.strptime(str(value)[:19], '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y')
+    except ValueError:
+        return str(value)
+
+
+def aggregate_sales_by_client(user_id) -> Dict[str, tuple]:
+    """
+    Vendas do usuário agregadas por cliente em uma única consulta
+
+    Returns:
+        dict: {hash_cliente: (pedidos, soma dos valores, qtd. de valores, última compra)}
+    """
+    valor = OrderHistory.valor_total_pagamento
+    rows = db.session.query(
+        OrderHistory.hash_cliente,
+        func.count(OrderHistory.id),
+        func.sum(case((valor != 0, valor))),
+        func.count(case((valor != 0, 1))),
+        func.max(OrderHistory.data_compra)
+    ).filter(
+        OrderHistory.user_id == user_id,
+        OrderHistory.hash_cliente.isnot(None)
+    ).group_by(OrderHistory.hash_cliente).all()
+
+    return {hash_cliente: (pedidos, soma or 0.0, valores, ultima)
+            for hash_cliente, pedidos, soma, valores, ultima in rows}
+
+
+def summarize(hashes: Iterable[str], sales: Dict[str, tuple]) -> Dict:
+    """
+    Consolida as vendas de um conjunto de clientes
+
+    Args:
+        hashes: Hashes dos clientes da área
+        sales: Resultado de aggregate_sales_by_client
+
+    Returns:
+        dict: Mesmo formato de empty_statistics()
+    """
+    stats = empty_statistics()
+    hashes = set(hashes)
+    stats['clientes_na_area'] = len(hashes)
+
+    valores = 0
+    ultima = None
+    for hash_cliente in hashes:
+        client_sales = sales.get(hash_cliente)
+        if client_sales is None:
+            continue
+        pedidos, soma, qtd_valores, data = client_sales
+        stats['total_clientes'] += 1
+        stats['total_pedidos'] += pedidos
+        stats['valor_total'] += float(soma)
+        valores += qtd_valores
+        if data is not None and (ultima is None or data > ultima):
+            ultima = data
+
+    stats['ticket_medio'] = stats['valor_total'] / valores if valores else 0.0
+    stats['ultima_compra'] = _format_date(ultima)
+    return stats
+
+
+def get_area_statistics(user_id, polygon_index, polygon_ids: Optional[List[int]] = None) -> Dict[int, Dict]:
+    """
+    Estatísticas de vendas por área do usuário
+
+    Args:
+        user_id: Dono das áreas, clientes e vendas
+        polygon_index: PolygonIndex do usuário
+        polygon_ids: Restringe a algumas áreas (None = todas)
+
+    Returns:
+        dict: {polygon_id: estatísticas} (áreas sem clientes/vendas vêm zeradas)
+    """
+    ensure_user_membership(user_id, polygon_index)
+    if polygon_ids is None:
+        polygon_ids = list(polygon_index.ids)
+    else:
+        polygon_ids = [pid for pid in polygon_ids if pid in polygon_index.position]
+
+    result = {pid: empty_statistics() for pid in polygon_ids}
+    pairs = get_client_polygon_pairs(polygon_ids)
+    if not pairs:
+        return result
+
+    hash_by_point = dict(
+        db.session.query(LatLong.id, LatLong.hash_client).filter(
+            LatLong.id_user == user_id,
+            LatLong.user_point == False  # noqa: E712
+        ).all()
+    )
+
+    hashes_by_polygon = {pid: [] for pid in polygon_ids}
+    for client_id, pid in pairs:
+        hash_client = hash_by_point.get(client_id)
+        if hash_client is not None:
+            hashes_by_polygon[pid].append(hash_client)
+
+    sales = aggregate_sales_by_client(user_id)
+    for pid, hashes in hashes_by_polygon.items():
+        result[pid] = summarize(hashes, sales)
+
+    logger.info(f"📊 Estatísticas por área: user={user_id} áreas={len(polygon_ids)} clientes_com_vendas={len(sales)}")
+    return result
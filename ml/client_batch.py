@@ -0,0 +1,201 @@
+"""
+Client Batch - Clientes em colunas NumPy ao longo da roteirização
+================================================================
+
+A roteirização convertia os clientes várias vezes (linhas do ORM → dicts →
+DataFrame → dicts via iterrows) e remontava arrays de coordenadas a cada
+nível da divisão por tamanho. ClientBatch guarda uma coluna por campo:
+
+- ids, lats, lngs, polygon_ids, depot_ids (-1 = sem valor), scores (NaN = sem score)
+- hashes e names (arrays de objetos)
+
+Agrupamento e divisão trabalham com arrays de índices sobre o lote; os dicts
+dos clientes só são montados na saída (to_records), para a API.
+
+Um lote criado a partir de dicts (from_records) devolve os próprios dicts em
+to_records, preservando campos extras.
+
+Autor: SynapseLog
+"""
+
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+MISSING_ID = -1
+DEFAULT_NAME = 'Cliente sem nome'
+
+
+class ClientBatch:
+    """Lote colunar de clientes"""
+
+    def __init__(self, ids, lats, lngs, hashes=None, polygon_ids=None, depot_ids=None,
+                 scores=None, names=None, records: Optional[List[Dict]] = None):
+        """
+        Args:
+            ids, lats, lngs: Colunas obrigatórias (mesmo tamanho)
+            hashes, names: Colunas de texto (None = vazias)
+            polygon_ids, depot_ids: Área e ponto de saída (None = todos MISSING_ID)
+            scores: Score RFM (None = todos NaN)
+            records: Dicts de origem, devolvidos por to_records
+        """
+        self.ids = np.asarray(ids, dtype=np.int64)
+        n = self.ids.shape[0]
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lngs = np.asarray(lngs, dtype=np.float64)
+        self.hashes = _object_column(hashes, n)
+        self.names = _object_column(names, n)
+        self.polygon_ids = np.full(n, MISSING_ID, dtype=np.int64) if polygon_ids is None else np.asarray(polygon_ids, dtype=np.int64)
+        self.depot_ids = np.full(n, MISSING_ID, dtype=np.int64) if depot_ids is None else np.asarray(depot_ids, dtype=np.int64)
+        self.scores = np.full(n, np.nan) if scores is None else np.asarray(scores, dtype=np.float64)
+        self.records = records
+        self._coordinates = None
+
+    # ------------------------------------------------------------------
+    # Construção
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple]) -> 'ClientBatch':
+        """Lote a partir de tuplas (id, latitude, longitude, hash_client) vindas do banco"""
+        rows = list(rows)
+        if not rows:
+            return cls.empty()
+        ids, lats, lngs, hashes = zip(*rows)
+        return cls(ids, lats, lngs, hashes=hashes)
+
+    @classmethod
+    def from_records(cls, records: Sequence[Dict]) -> 'ClientBatch':
+        """Lote a partir de dicts no formato do route_optimizer ({'lat', 'lng', ...})"""
+        records = list(records)
+        return cls(
+            [_int_or_missing(r.get('id')) for r in records],
+            [r['lat'] for r in records],
+            [r['lng'] for r in records],
+            hashes=[r.get('hash_client') for r in records],
+            names=[r.get('name') for r in records],
+            polygon_ids=[_int_or_missing(r.get('polygon_id')) for r in records],
+            depot_ids=[_int_or_missing(r.get('depot_id')) for r in records],
+            scores=[np.nan if r.get('score') is None else r['score'] for r in records],
+            records=records
+        )
+
+    @classmethod
+    def empty(cls) -> 'ClientBatch':
+        return cls(np.empty(0, dtype=np.int64), np.empty(0), np.empty(0))
+
+    # ------------------------------------------------------------------
+    # Acesso
+    # ------------------------------------------------------------------
+
+    def __len__(self) -> int:
+        return self.ids.shape[0]
+
+    @property
+    def coordinates(self) -> np.ndarray:
+        """Array (N, 2) de [lat, lng]"""
+        if self._coordinates is None:
+            self._coordinates = np.column_stack([self.lats, self.lngs])
+        return self._coordinates
+
+    def take(self, indices) -> 'ClientBatch':
+        """Sub-lote com as posições `indices` (na ordem dada)"""
+        indices = np.asarray(indices, dtype=np.int64)
+        return ClientBatch(
+            self.ids[indices], self.lats[indices], self.lngs[indices],
+            hashes=self.hashes[indices], polygon_ids=self.polygon_ids[indices],
+            depot_ids=self.depot_ids[indices], scores=self.scores[indices], names=self.names[indices],
+            records=None if self.records is None else [self.records[i] for i in indices]
+        )
+
+    def center(self, indices=None) -> Dict[str, float]:
+        """Centroide (média de lat/lng) das posições `indices` (None = todo o lote)"""
+        lats = self.lats if indices is None else self.lats[indices]
+        lngs = self.lngs if indices is None else self.lngs[indices]
+        if lats.shape[0] == 0:
+            return {'lat': 0, 'lng': 0}
+        return {'lat': float(lats.mean()), 'lng': float(lngs.mean())}
+
+    def set_depots(self, depot_ids) -> None:
+        """Grava o ponto de saída de cada cliente (também nos dicts de origem, se houver)"""
+        self.depot_ids = np.asarray(depot_ids, dtype=np.int64)
+        if self.records is not None:
+            for record, depot_id in zip(self.records, self.depot_ids):
+                record['depot_id'] = None if depot_id == MISSING_ID else int(depot_id)
+
+    def set_scores(self, hashes: Sequence[str], values: Sequence[float]) -> None:
+        """
+        Alinha os scores (hash_client → score) às posições do lote, numa única
+        junção vetorizada; clientes sem score ficam com NaN
+        """
+        index = pd.Index(list(hashes), dtype=object)
+        values = np.asarray(values, dtype=np.float64)
+        if index.has_duplicates:
+            keep = ~index.duplicated(keep='last')
+            index, values = index[keep], values[keep]
+
+        self.scores = np.full(len(self), np.nan)
+        if len(index) == 0:
+            return
+        positions = index.get_indexer(self.hashes)
+        found = positions >= 0
+        self.scores[found] = values[positions[found]]
+
+    def select_polygons(self, pairs: Sequence[Tuple[int, int]]) -> 'ClientBatch':
+        """
+        Mantém os clientes com alguma área em `pairs` [(id_client, polygon_id), ...],
+        na ordem do lote; cliente em áreas sobrepostas fica com o último par
+        """
+        pairs = np.asarray(list(pairs), dtype=np.int64).reshape(-1, 2)
+        if pairs.shape[0] == 0:
+            return self.take(np.empty(0, dtype=np.int64))
+
+        # Último par de cada cliente: primeira ocorrência na ordem invertida
+        reversed_pairs = pairs[::-1]
+        member_ids, first = np.unique(reversed_pairs[:, 0], return_index=True)
+        member_polygons = reversed_pairs[first, 1]
+
+        positions = np.flatnonzero(np.isin(self.ids, member_ids))
+        selected = self.take(positions)
+        selected.polygon_ids = member_polygons[np.searchsorted(member_ids, selected.ids)]
+        return selected
+
+    def to_records(self, indices=None) -> List[Dict]:
+        """
+        Dicts dos clientes (formato do route_optimizer / API)
+
+        Args:
+            indices: Posições a materializar (None = todo o lote)
+        """
+        positions = range(len(self)) if indices is None else np.asarray(indices, dtype=np.int64)
+        if self.records is not None:
+            return [self.records[i] for i in positions]
+
+        has_depots = bool((self.depot_ids != MISSING_ID).any())
+        records = []
+        for i in positions:
+            record = {
+                'hash_client': self.hashes[i],
+                'name': self.names[i] if self.names[i] is not None else DEFAULT_NAME,
+                'lat': float(self.lats[i]),
+                'lng': float(self.lngs[i]),
+                'id': int(self.ids[i])
+            }
+            if self.polygon_ids[i] != MISSING_ID:
+                record['polygon_id'] = int(self.polygon_ids[i])
+            if has_depots:
+                record['depot_id'] = None if self.depot_ids[i] == MISSING_ID else int(self.depot_ids[i])
+            records.append(record)
+        return records
+
+
+def _object_column(values, n: int) -> np.ndarray:
+    column = np.empty(n, dtype=object)
+    if values is not None:
+        column[:] = list(values)
+    return column
+
+
+def _int_or_missing(value) -> int:
+    return MISSING_ID if value is None else int(value)
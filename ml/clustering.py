@@ -0,0 +1,414 @@
+"""
+Clustering - Escolha entre KMeans e MiniBatchKMeans pelo tamanho da entrada
+==========================================================================
+
+O KMeans completo (com várias inicializações) domina o tempo da roteirização
+a partir de dezenas de milhares de clientes. Acima de MINIBATCH_MIN_POINTS
+pontos usamos MiniBatchKMeans, que ajusta os centros com amostras de
+MINIBATCH_BATCH_SIZE pontos e para cedo quando a inércia deixa de melhorar
+(MINIBATCH_MAX_NO_IMPROVEMENT lotes seguidos). A saída (labels_ e
+cluster_centers_) tem o mesmo formato nos dois casos.
+
+Os limites podem ser ajustados pelas variáveis de ambiente de mesmo nome.
+
+Registro de algoritmos
+----------------------
+ALGORITHMS reúne os algoritmos da fase 1 da roteirização (agrupamento inicial
+por dia), cada um com a complexidade esperada e uma estimativa de custo:
+
+- kmeans: KMeans completo, n_init=10 — O(n_init · iter · N · k)
+- minibatch: MiniBatchKMeans — O(n_init · lotes · B · k), quase independente de N
+- grid: pré-agrupa os pontos numa grade de GRID_CELL_KM e roda KMeans nos
+  centros das células, pesados pelo número de clientes — O(N log N + C · k)
+- balanced: KMeans com capacidade (balanced_kmeans) com ceil(N / k) pontos por
+  grupo — O(iter · N · log k) (capacitated=True: grupos do mesmo tamanho, sem
+  divisão posterior); balanced_kmeans também é usado direto nos dias novos do
+  replanejamento incremental, com a capacidade explícita
+
+Pontos repetidos
+----------------
+Vários clientes no mesmo endereço (lojas de um prédio, um shopping) viram um
+único ponto com peso (collapse_duplicates): o KMeans roda sobre os pontos
+distintos com sample_weight e os rótulos voltam para os clientes. Com
+DEDUPE_EPSILON_KM > 0, pontos na mesma célula de DEDUPE_EPSILON_KM também são
+unidos (no centro ponderado da célula).
+
+ALGORITHM_AUTO escolhe pelo número de clientes (kmeans abaixo de
+MINIBATCH_MIN_POINTS, minibatch acima) e, se a estimativa passar do tempo
+limite (CLUSTERING_TIME_BUDGET_S), troca pelo próximo mais barato.
+
+Autor: SynapseLog
+"""
+
+import logging
+import math
+import os
+import warnings
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.neighbors import KDTree
+
+logger = logging.getLogger(__name__)
+
+BACKEND_KMEANS = 'kmeans'
+BACKEND_MINIBATCH = 'minibatch'
+
+# A partir de quantos pontos o MiniBatchKMeans é usado
+MINIBATCH_MIN_POINTS = int(os.environ.get('MINIBATCH_MIN_POINTS', 50000))
+
+# Pontos por lote do MiniBatchKMeans
+MINIBATCH_BATCH_SIZE = int(os.environ.get('MINIBATCH_BATCH_SIZE', 4096))
+
+# Parada antecipada: lotes seguidos sem melhora da inércia
+MINIBATCH_MAX_NO_IMPROVEMENT = int(os.environ.get('MINIBATCH_MAX_NO_IMPROVEMENT', 10))
+
+# Inicializações do MiniBatchKMeans (cada uma é barata)
+MINIBATCH_N_INIT = 3
+
+# Iterações máximas do KMeans com capacidade (atribuição + recálculo dos centros)
+BALANCED_MAX_ITER = 20
+
+# Centros mais próximos considerados por ponto em cada rodada da atribuição com capacidade
+BALANCED_CANDIDATES = 8
+
+
+def choose_backend(n_samples: int, min_points: Optional[int] = None) -> str:
+    """BACKEND_MINIBATCH a partir de `min_points` pontos (padrão MINIBATCH_MIN_POINTS), senão BACKEND_KMEANS"""
+    threshold = MINIBATCH_MIN_POINTS if min_points is None else min_points
+    return BACKEND_MINIBATCH if n_samples >= threshold else BACKEND_KMEANS
+
+
+def make_kmeans(n_clusters: int, n_samples: int, random_state: int = 42, n_init=10,
+                min_points: Optional[int] = None, batch_size: Optional[int] = None) -> Tuple[object, str]:
+    """
+    Estimador de k-means adequado ao tamanho da entrada
+
+    Args:
+        n_clusters: Número de grupos
+        n_samples: Número de pontos que serão agrupados
+        random_state: Semente (resultados determinísticos)
+        n_init: Inicializações do KMeans completo
+        min_points: Limite para o MiniBatchKMeans (padrão MINIBATCH_MIN_POINTS)
+        batch_size: Tamanho do lote (padrão MINIBATCH_BATCH_SIZE)
+
+    Returns:
+        tuple: (estimador não treinado, backend escolhido)
+    """
+    backend = choose_backend(n_samples, min_points)
+    if backend == BACKEND_KMEANS:
+        return KMeans(n_clusters=n_clusters, random_state=random_state, n_init=n_init), backend
+
+    batch_size = batch_size or MINIBATCH_BATCH_SIZE
+    logger.info(f"⚡ MiniBatchKMeans: {n_samples} pontos, {n_clusters} grupos, lote {batch_size}")
+    estimator = MiniBatchKMeans(
+        n_clusters=n_clusters,
+        random_state=random_state,
+        batch_size=batch_size,
+        n_init=MINIBATCH_N_INIT,
+        max_no_improvement=MINIBATCH_MAX_NO_IMPROVEMENT
+    )
+    return estimator, backend
+
+
+def balanced_kmeans(
+    coordinates: np.ndarray,
+    n_clusters: int,
+    capacity: int,
+    max_iter: int = BALANCED_MAX_ITER,
+    random_state: int = 42
+) -> np.ndarray:
+    """
+    KMeans com capacidade: nenhum grupo recebe mais que `capacity` pontos.
+
+    Parte dos centros de um KMeans comum e alterna:
+    1. Atribuição com capacidade (_capacitated_assignment), vetorizada
+    2. Recálculo dos centros pela média dos pontos atribuídos
+    até a atribuição não mudar (ou max_iter).
+
+    Args:
+        coordinates: Array (N, 2) de [lat, lng]
+        n_clusters: Número de grupos
+        capacity: Máximo de pontos por grupo (n_clusters * capacity >= N)
+
+    Returns:
+        Array (N,) com o grupo de cada ponto
+    """
+    n_points = coordinates.shape[0]
+    if n_clusters * capacity < n_points:
+        raise ValueError(f"Capacidade insuficiente: {n_clusters} grupos x {capacity} < {n_points} pontos")
+
+    with warnings.catch_warnings():
+        warnings.filterwarnings('ignore', category=ConvergenceWarning)
+        kmeans, _ = make_kmeans(n_clusters, n_points, random_state=random_state, n_init=1)
+        centers = kmeans.fit(coordinates).cluster_centers_.copy()
+
+    labels = np.full(n_points, -1, dtype=np.int64)
+    for iteration in range(max_iter):
+        new_labels = _capacitated_assignment(coordinates, centers, capacity)
+
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+
+        counts = np.bincount(labels, minlength=n_clusters)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, coordinates)
+        filled = counts > 0
+        centers[filled] = sums[filled] / counts[filled, None]
+
+    logger.debug(f"      balanced_kmeans: {n_points} pontos, {n_clusters} grupos, {iteration + 1} iterações")
+    return labels
+
+
+def _capacitated_assignment(coordinates: np.ndarray, centers: np.ndarray, capacity: int,
+                            n_candidates: int = BALANCED_CANDIDATES) -> np.ndarray:
+    """
+    Atribui cada ponto a um centro sem passar de `capacity` pontos por centro.
+
+    Cada ponto consulta (KDTree) só os `n_candidates` centros mais próximos
+    entre os que ainda têm vaga; pontos com maior "arrependimento" (distância
+    ao 2º candidato menos a distância ao 1º) têm prioridade. Em cada rodada r,
+    os pontos pendentes disputam o r-ésimo candidato: ordenados por centro
+    (ordenação estável, mantendo a prioridade), cada centro aceita os primeiros
+    pela contagem acumulada até esgotar as vagas. Quem sobrar após todos os
+    candidatos consulta de novo os centros que ainda têm vaga.
+
+    Tudo em operações de array: O(N · n_candidates · log k) por chamada.
+
+    Returns:
+        Array (N,) com o centro de cada ponto
+    """
+    n_points, n_clusters = coordinates.shape[0], centers.shape[0]
+    labels = np.full(n_points, -1, dtype=np.int64)
+    remaining = np.full(n_clusters, capacity, dtype=np.int64)
+    pending = np.arange(n_points)
+
+    while pending.size:
+        open_clusters = np.flatnonzero(remaining > 0)
+        n_nearest = min(n_candidates, open_clusters.size)
+        dist, nearest = KDTree(centers[open_clusters]).query(coordinates[pending], k=n_nearest)
+        preference = open_clusters[nearest]
+        regret = dist[:, 1] - dist[:, 0] if n_nearest > 1 else np.zeros(pending.size)
+        order = np.argsort(-regret, kind='stable')
+        pending, preference = pending[order], preference[order]
+
+        for rank in range(n_nearest):
+            if pending.size == 0:
+                break
+            choice = preference[:, rank]
+            by_cluster = np.argsort(choice, kind='stable')
+            sorted_choice = choice[by_cluster]
+            # Posição de cada ponto na fila do seu centro
+            queue_position = np.arange(sorted_choice.size) - np.searchsorted(sorted_choice, sorted_choice)
+            accepted = np.zeros(pending.size, dtype=bool)
+            accepted[by_cluster[queue_position < remaining[sorted_choice]]] = True
+
+            labels[pending[accepted]] = choice[accepted]
+            remaining -= np.bincount(choice[accepted], minlength=n_clusters)
+            pending, preference = pending[~accepted], preference[~accepted]
+
+    return labels
+
+
+# ============================================================================
+# REGISTRO DE ALGORITMOS
+# ============================================================================
+
+ALGORITHM_AUTO = 'auto'
+ALGORITHM_KMEANS = 'kmeans'
+ALGORITHM_MINIBATCH = 'minibatch'
+ALGORITHM_GRID = 'grid'
+ALGORITHM_BALANCED = 'balanced'
+
+# Tempo limite padrão do agrupamento para a escolha automática (segundos)
+CLUSTERING_TIME_BUDGET_S = float(os.environ.get('CLUSTERING_TIME_BUDGET_S', 30))
+
+# Operações elementares (distância ponto-centro) por segundo usadas nas estimativas
+CLUSTERING_OPS_PER_SECOND = float(os.environ.get('CLUSTERING_OPS_PER_SECOND', 2e8))
+
+# Lado da célula da grade do pré-agrupamento (km)
+GRID_CELL_KM = float(os.environ.get('CLUSTERING_GRID_CELL_KM', 0.5))
+
+KM_PER_DEGREE = 111.32
+
+# Distância (km) abaixo da qual clientes contam como o mesmo ponto; 0 = só coordenadas idênticas
+DEDUPE_EPSILON_KM = float(os.environ.get('CLUSTERING_DEDUPE_EPSILON_KM', 0.0))
+
+
+def collapse_duplicates(coordinates: np.ndarray, epsilon_km: Optional[float] = None,
+                        sample_weight=None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Une coordenadas iguais (ou na mesma célula de epsilon_km) em pontos com peso
+
+    Args:
+        coordinates: Array (N, 2) de [lat, lng]
+        epsilon_km: Lado da célula em km (None = DEDUPE_EPSILON_KM; 0 = só idênticas)
+        sample_weight: Peso de cada coordenada (None = 1)
+
+    Returns:
+        tuple: (pontos (M, 2), pesos (M,), inverse (N,)) com points[inverse] ≈ coordinates
+    """
+    coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    weights = np.ones(len(coordinates)) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+    epsilon_km = DEDUPE_EPSILON_KM if epsilon_km is None else epsilon_km
+    if len(coordinates) == 0:
+        return coordinates, weights, np.empty(0, dtype=np.int64)
+
+    if epsilon_km <= 0:
+        points, inverse = np.unique(coordinates, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        return points, np.bincount(inverse, weights=weights), inverse
+
+    # Células de epsilon_km: o grau de longitude encolhe com o cosseno da latitude
+    cell_lat = epsilon_km / KM_PER_DEGREE
+    cell_lng = cell_lat / max(math.cos(math.radians(float(np.mean(coordinates[:, 0])))), 1e-6)
+    cells = np.floor(coordinates / [cell_lat, cell_lng]).astype(np.int64)
+    _, inverse = np.unique(cells, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    point_weights = np.bincount(inverse, weights=weights)
+    points = np.column_stack([
+        np.bincount(inverse, weights=weights * coordinates[:, 0]) / point_weights,
+        np.bincount(inverse, weights=weights * coordinates[:, 1]) / point_weights
+    ])
+    return points, point_weights, inverse
+
+
+class ClusteringAlgorithm:
+    """Entrada do registro: rotula N pontos em até n_clusters grupos"""
+
+    def __init__(self, name: str, fit: Callable, complexity: str, cost: Callable[[int, int], float],
+                 backend: str = BACKEND_KMEANS, capacitated: bool = False, description: str = ''):
+        """
+        Args:
+            name: Nome aceito em /roteirizacao/processar (parâmetro algoritmo)
+            fit: fit(coordinates (N, 2), n_clusters, sample_weight=None) -> labels (N,)
+            complexity: Complexidade esperada, para documentação e para a API
+            cost: cost(N, k) -> operações estimadas (base da escolha automática)
+            backend: Estimador usado (BACKEND_KMEANS ou BACKEND_MINIBATCH), informado nos grupos
+            capacitated: Grupos já respeitam a capacidade (sem filtro de tamanho depois)
+            description: Texto curto exibido ao usuário
+        """
+        self.name = name
+        self.fit = fit
+        self.complexity = complexity
+        self.cost = cost
+        self.backend = backend
+        self.capacitated = capacitated
+        self.description = description
+
+    def estimate_seconds(self, n_samples: int, n_clusters: int) -> float:
+        """Tempo estimado do agrupamento, em segundos"""
+        return self.cost(n_samples, n_clusters) / CLUSTERING_OPS_PER_SECOND
+
+    def to_dict(self) -> Dict:
+        return {'name': self.name, 'complexity': self.complexity, 'capacitated': self.capacitated,
+                'description': self.description}
+
+
+ALGORITHMS: Dict[str, ClusteringAlgorithm] = {}
+
+
+def register_algorithm(algorithm: ClusteringAlgorithm) -> ClusteringAlgorithm:
+    """Registra (ou substitui) um algoritmo pelo nome"""
+    ALGORITHMS[algorithm.name] = algorithm
+    return algorithm
+
+
+def available_algorithms() -> List[str]:
+    """Nomes aceitos no parâmetro algoritmo, incluindo ALGORITHM_AUTO"""
+    return [ALGORITHM_AUTO] + list(ALGORITHMS)
+
+
+def choose_algorithm(n_samples: int, n_clusters: int, time_budget: Optional[float] = None) -> str:
+    """
+    Escolha automática: kmeans ou minibatch pelo número de pontos (choose_backend)
+    e, se a estimativa passar de time_budget, o próximo mais barato
+    """
+    budget = CLUSTERING_TIME_BUDGET_S if time_budget is None else time_budget
+    preferred = ALGORITHM_MINIBATCH if choose_backend(n_samples) == BACKEND_MINIBATCH else ALGORITHM_KMEANS
+    candidates = [preferred] + [name for name in (ALGORITHM_MINIBATCH, ALGORITHM_GRID) if name != preferred]
+
+    for name in candidates:
+        if ALGORITHMS[name].estimate_seconds(n_samples, n_clusters) <= budget:
+            return name
+
+    cheapest = min(candidates, key=lambda name: ALGORITHMS[name].cost(n_samples, n_clusters))
+    logger.warning(f"⏱️ Nenhum algoritmo cabe em {budget}s para {n_samples} pontos; usando {cheapest}")
+    return cheapest
+
+
+def get_algorithm(name: str, n_samples: int = 0, n_clusters: int = 1,
+                  time_budget: Optional[float] = None) -> ClusteringAlgorithm:
+    """
+    Algoritmo do registro pelo nome (ALGORITHM_AUTO resolve por choose_algorithm)
+
+    Raises:
+        ValueError: Nome não registrado
+    """
+    if name == ALGORITHM_AUTO:
+        name = choose_algorithm(n_samples, n_clusters, time_budget)
+    if name not in ALGORITHMS:
+        raise ValueError(f"Algoritmo de agrupamento desconhecido: {name}")
+    return ALGORITHMS[name]
+
+
+def _fit_kmeans(coordinates: np.ndarray, n_clusters: int, sample_weight=None) -> np.ndarray:
+    # Mesma configuração de make_kmeans abaixo do limite do MiniBatchKMeans
+    estimator, _ = make_kmeans(n_clusters, len(coordinates), min_points=len(coordinates) + 1)
+    return estimator.fit_predict(coordinates, sample_weight=sample_weight)
+
+
+def _fit_minibatch(coordinates: np.ndarray, n_clusters: int, sample_weight=None) -> np.ndarray:
+    estimator, _ = make_kmeans(n_clusters, len(coordinates), min_points=0)
+    return estimator.fit_predict(coordinates, sample_weight=sample_weight)
+
+
+def _fit_balanced(coordinates: np.ndarray, n_clusters: int, sample_weight=None) -> np.ndarray:
+    """
+    balanced_kmeans com capacidade ceil(N / n_clusters): grupos que diferem em
+    no máximo um ponto. A capacidade conta pontos, então não há pesos
+    (os chamadores de algoritmos capacitados passam os clientes sem unir repetidos)
+    """
+    if sample_weight is not None and not np.all(np.asarray(sample_weight) == 1):
+        raise ValueError("Agrupamento balanceado conta pontos: sample_weight não é suportado")
+    n_clusters = min(n_clusters, len(coordinates))
+    return balanced_kmeans(coordinates, n_clusters, math.ceil(len(coordinates) / n_clusters))
+
+
+def _fit_grid(coordinates: np.ndarray, n_clusters: int, sample_weight=None) -> np.ndarray:
+    """KMeans sobre os centros das células da grade, pesados pela soma dos pesos de cada célula"""
+    centers, cell_weights, inverse = collapse_duplicates(coordinates, GRID_CELL_KM, sample_weight)
+    logger.info(f"🔲 Pré-agrupamento em grade: {len(coordinates)} pontos → {len(centers)} células")
+
+    k = min(n_clusters, len(centers))
+    estimator, _ = make_kmeans(k, len(centers), min_points=len(centers) + 1)
+    return estimator.fit_predict(centers, sample_weight=cell_weights)[inverse]
+
+
+register_algorithm(ClusteringAlgorithm(
+    ALGORITHM_KMEANS, _fit_kmeans, 'O(n_init · iter · N · k)',
+    cost=lambda n, k: 10 * 30 * n * k,
+    description='KMeans completo (10 inicializações)'
+))
+register_algorithm(ClusteringAlgorithm(
+    ALGORITHM_MINIBATCH, _fit_minibatch, 'O(n_init · lotes · B · k)',
+    cost=lambda n, k: MINIBATCH_N_INIT * 3 * n * k,
+    backend=BACKEND_MINIBATCH,
+    description='MiniBatchKMeans (lotes com parada antecipada)'
+))
+register_algorithm(ClusteringAlgorithm(
+    ALGORITHM_GRID, _fit_grid, 'O(N log N + C · k), C = células ocupadas',
+    # C desconhecido antes da grade: estimado como √N células ocupadas
+    cost=lambda n, k: n * max(math.log2(n), 1) + 10 * 30 * math.sqrt(n) * k,
+    description=f'Grade de {GRID_CELL_KM} km + KMeans pesado nas células'
+))
+register_algorithm(ClusteringAlgorithm(
+    ALGORITHM_BALANCED, _fit_balanced, 'O(iter · N · log k)',
+    cost=lambda n, k: BALANCED_MAX_ITER * n * BALANCED_CANDIDATES * max(math.log2(k), 1),
+    capacitated=True,
+    description='KMeans com capacidade (dias do mesmo tamanho, sem divisões)'
+))
@@ -0,0 +1,183 @@
+"""
+Depots - Atribuição de clientes ao ponto de saída mais próximo
+==============================================================
+
+Mantém, por usuário, uma BallTree (métrica haversine) sobre os pontos de saída
+(LatLong com user_point=True, cadastrados em /autenticado/pontosSaida) e
+atribui cada cliente ao ponto de saída mais próximo com uma única consulta
+vetorizada.
+
+Opcionalmente respeita o raio de atuação (LatLong.range_km) de cada ponto: um
+cliente fora do raio do mais próximo fica com o ponto mais próximo que ainda o
+cobre, ou sem ponto de saída se nenhum cobrir.
+
+A árvore fica em cache enquanto a versão dos pontos de saída
+(depot_data_version, lida do banco a cada uso) não mudar.
+
+Autor: SynapseLog
+"""
+
+import logging
+import numpy as np
+from sklearn.neighbors import BallTree
+from typing import Dict, List, Tuple
+
+from base.models import db, LatLong
+from ml.client_batch import ClientBatch, MISSING_ID
+from ml.geo_utils import EARTH_RADIUS_KM
+from ml.user_cache import UserCache
+
+logger = logging.getLogger(__name__)
+
+
+class DepotIndex:
+    """BallTree (haversine) sobre os pontos de saída de um usuário"""
+
+    def __init__(self, depots: List[Dict]):
+        """
+        Args:
+            depots: [{'id', 'name', 'lat', 'lng', 'range_km'}, ...] (range_km opcional)
+        """
+        self.depots = list(depots)
+        self.ranges = np.array(
+            [d.get('range_km') or np.inf for d in self.depots], dtype=float
+        )
+        self.tree = None
+        if self.depots:
+            coords = np.radians([[d['lat'], d['lng']] for d in self.depots])
+            self.tree = BallTree(coords, metric='haversine')
+
+    def __len__(self):
+        return len(self.depots)
+
+    def nearest(self, lats, lngs, respect_range: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Ponto de saída mais próximo de cada coordenada
+
+        Args:
+            lats, lngs: Coordenadas dos clientes (graus)
+            respect_range: Descarta pontos de saída cujo range_km não alcança o cliente
+
+        Returns:
+            tuple: (posição em self.depots ou -1, distância em km ou inf)
+        """
+        lats = np.asarray(lats, dtype=float)
+        lngs = np.asarray(lngs, dtype=float)
+        positions = np.full(lats.shape[0], -1, dtype=np.int64)
+        distances = np.full(lats.shape[0], np.inf)
+        if self.tree is None or lats.shape[0] == 0:
+            return positions, distances
+
+        points = np.radians(np.column_stack([lats, lngs]))
+        dist, ind = self.tree.query(points, k=1)
+        positions = ind[:, 0].astype(np.int64)
+        distances = dist[:, 0] * EARTH_RADIUS_KM
+
+        if respect_range:
+            outside = np.flatnonzero(distances > self.ranges[positions])
+            if outside.size:
+                # Fora do raio do mais próximo: procura, em ordem de distância, um que cubra
+                dist_all, ind_all = self.tree.query(points[outside], k=len(self.depots))
+                dist_all = dist_all * EARTH_RADIUS_KM
+                covered = dist_all <= self.ranges[ind_all]
+                first = covered.argmax(axis=1)
+                rows = np.arange(outside.size)
+                found = covered[rows, first]
+
+                positions[outside] = np.where(found, ind_all[rows, first], -1)
+                distances[outside] = np.where(found, dist_all[rows, first], np.inf)
+
+        return positions, distances
+
+    def assign_clients(self, clients: List[Dict], respect_range: bool = False) -> List[Dict]:
+        """
+        Grava 'depot_id' em cada cliente ({'lat', 'lng', ...}); a distância até o
+        ponto de saída (seller_distance_km) vem depois da matriz de distâncias
+
+        Returns:
+            list: Clientes que ficaram sem ponto de saída (fora de todos os raios)
+        """
+        if not clients:
+            return []
+
+        lats = np.fromiter((c['lat'] for c in clients), dtype=float, count=len(clients))
+        lngs = np.fromiter((c['lng'] for c in clients), dtype=float, count=len(clients))
+        positions, _ = self.nearest(lats, lngs, respect_range)
+
+        unassigned = []
+        for client, position in zip(clients, positions):
+            if position < 0:
+                client['depot_id'] = None
+                unassigned.append(client)
+            else:
+                client['depot_id'] = self.depots[position]['id']
+
+        return unassigned
+
+    def assign_batch(self, batch: ClientBatch, respect_range: bool = False) -> np.ndarray:
+        """
+        Grava o ponto de saída de cada cliente do lote (batch.depot_ids)
+
+        Returns:
+            np.ndarray: Posições, no lote, dos clientes sem ponto de saída (fora de todos os raios)
+        """
+        if len(batch) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        positions, _ = self.nearest(batch.lats, batch.lngs, respect_range)
+        # Posição -1 (sem ponto de saída) vira MISSING_ID pela coluna extra ao final
+        depot_ids = np.array([d['id'] for d in self.depots] + [MISSING_ID], dtype=np.int64)
+        batch.set_depots(depot_ids[positions])
+        return np.flatnonzero(positions < 0)
+
+    def get_depots(self) -> List[Dict]:
+        """Pontos de saída indexados"""
+        return list(self.depots)
+
+
+# ============================================================================
+# CACHE POR USUÁRIO
+# ============================================================================
+
+_depot_cache = UserCache()
+
+
+def load_user_depots(user_id) -> List[Dict]:
+    """Pontos de saída do usuário no formato aceito por DepotIndex"""
+    pontos = LatLong.query.filter_by(id_user=user_id, user_point=True).order_by(LatLong.id).all()
+    return [{
+        'id': p.id,
+        'name': p.hash_client or f'Ponto Base {p.id}',
+        'lat': p.latitude,
+        'lng': p.longitude,
+        'range_km': p.range_km
+    } for p in pontos]
+
+
+def depot_data_version(user_id) -> tuple:
+    """
+    Versão dos pontos de saída do usuário: as próprias linhas (id, nome,
+    coordenadas, raio). São poucos pontos por usuário e o PUT os edita no
+    lugar, então contagem e max(id) não bastariam.
+    """
+    return tuple(tuple(row) for row in db.session.query(
+        LatLong.id, LatLong.hash_client, LatLong.latitude, LatLong.longitude, LatLong.range_km
+    ).filter(
+        LatLong.id_user == user_id,
+        LatLong.user_point == True  # noqa: E712
+    ).order_by(LatLong.id).all())
+
+
+def get_depot_index(user_id) -> DepotIndex:
+    """Índice de pontos de saída do usuário, em cache até a versão dos pontos mudar"""
+    def build():
+        index = DepotIndex(load_user_depots(user_id))
+        logger.info(f"🏭 Índice de pontos de saída construído: user={user_id} pontos={len(index)}")
+        return index
+    return _depot_cache.get(user_id, build, depot_data_version(user_id))
+
+
+def invalidate_depot_index(user_id) -> None:
+    """Descarta o índice do usuário (chamar após criar/alterar/excluir ponto de saída)"""
+    _depot_cache.invalidate(user_id)
+
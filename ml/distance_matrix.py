@@ -0,0 +1,343 @@
+"""
+Distance Matrix - Matriz de distâncias de grande círculo (haversine) com cache
+=============================================================================
+
+Calcula distâncias em km entre clientes, e entre ponto de saída e clientes,
+por broadcasting em NumPy:
+
+- float32, em blocos de linhas (BLOCK_ROWS), para limitar a memória temporária
+- a matriz pronta fica em cache em memória (LRU), com chave pelo conjunto de
+  coordenadas (arredondadas a 6 casas ≈ 0.1 m)
+- só matrizes a partir de MIN_DISK_CELLS células vão também para o disco (.npy
+  em CACHE_DIR): a chave quase nunca se repete entre roteirizações diferentes
+  (e as repetidas já saem de ml/route_cache.py), então gravar matrizes pequenas,
+  que se recalculam em milissegundos, seria escrita sem leitura
+- o disco é limitado a MAX_DISK_BYTES: cada leitura renova o mtime do arquivo e,
+  a cada max_disk_bytes / EVICT_FRACTION bytes gravados, os arquivos menos
+  usados recentemente são apagados (uma varredura da pasta, não uma por gravação)
+
+A roteirização lê daqui as distâncias do ponto de saída até cada cliente
+(seller_distance_km) e o comprimento de cada rota (sum_distance_km).
+
+Autor: SynapseLog
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from ml.geo_utils import EARTH_RADIUS_KM
+
+logger = logging.getLogger(__name__)
+
+# Linhas calculadas por bloco (BLOCK_ROWS x colunas float32 de memória temporária)
+BLOCK_ROWS = 1024
+
+# Pasta do cache em disco
+CACHE_DIR = os.environ.get('DISTANCE_CACHE_DIR') or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'databases', 'distance_cache'
+)
+
+# Matrizes maiores que isso (células) não vão para o disco (~200 MB em float32)
+MAX_CACHED_CELLS = 50_000_000
+
+# Matrizes menores que isso (células) ficam só em memória; ~1000 pontos (4 MB),
+# onde recalcular já custa bem mais que ler o arquivo
+MIN_DISK_CELLS = int(os.environ.get('DISTANCE_CACHE_MIN_DISK_CELLS', 1_000_000))
+
+# Espaço máximo do cache em disco (MB)
+MAX_DISK_BYTES = int(float(os.environ.get('DISTANCE_CACHE_MAX_MB', 512)) * 1024 * 1024)
+
+# Varredura do disco a cada max_disk_bytes / EVICT_FRACTION bytes gravados
+# (o disco pode passar do limite em até essa fração entre varreduras)
+EVICT_FRACTION = 8
+
+# Matrizes mantidas em memória
+MEMORY_CACHE_SIZE = 32
+
+# Casas decimais das coordenadas na chave do cache
+KEY_DECIMALS = 6
+
+# Rotas com mais pontos que isso não montam matriz (memória quadrática):
+# as distâncias são calculadas só entre paradas consecutivas
+MAX_ROUTE_MATRIX_POINTS = 5000
+
+
+def haversine_matrix(lats_a, lngs_a, lats_b=None, lngs_b=None, block_rows: int = BLOCK_ROWS) -> np.ndarray:
+    """
+    Distâncias de grande círculo (km) entre dois conjuntos de pontos
+
+    Args:
+        lats_a, lngs_a: Pontos das linhas (graus)
+        lats_b, lngs_b: Pontos das colunas (None = os mesmos das linhas)
+        block_rows: Linhas calculadas por vez
+
+    Returns:
+        np.ndarray: Matriz float32 (len(a), len(b))
+    """
+    lat_a = np.radians(np.asarray(lats_a, dtype=np.float64)).astype(np.float32)
+    lng_a = np.radians(np.asarray(lngs_a, dtype=np.float64)).astype(np.float32)
+    if lats_b is None:
+        lat_b, lng_b = lat_a, lng_a
+    else:
+        lat_b = np.radians(np.asarray(lats_b, dtype=np.float64)).astype(np.float32)
+        lng_b = np.radians(np.asarray(lngs_b, dtype=np.float64)).astype(np.float32)
+
+    cos_b = np.cos(lat_b)
+    result = np.empty((lat_a.shape[0], lat_b.shape[0]), dtype=np.float32)
+
+    for start in range(0, lat_a.shape[0], block_rows):
+        stop = min(start + block_rows, lat_a.shape[0])
+        block_lat = lat_a[start:stop, None]
+        block_lng = lng_a[start:stop, None]
+
+        h = (np.sin((lat_b - block_lat) * np.float32(0.5)) ** 2 +
+             np.cos(block_lat) * cos_b * np.sin((lng_b - block_lng) * np.float32(0.5)) ** 2)
+        np.clip(h, 0.0, 1.0, out=h)
+        result[start:stop] = np.float32(2 * EARTH_RADIUS_KM) * np.arcsin(np.sqrt(h))
+
+    if lats_b is None:
+        np.fill_diagonal(result, 0.0)
+    return result
+
+
+def haversine_pairs_km(lats_a, lngs_a, lats_b, lngs_b) -> np.ndarray:
+    """Distâncias (km, float64) entre pares de pontos (a[i], b[i])"""
+    lat_a, lng_a, lat_b, lng_b = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lats_a, lngs_a, lats_b, lngs_b))
+    h = np.sin((lat_b - lat_a) / 2) ** 2 + np.cos(lat_a) * np.cos(lat_b) * np.sin((lng_b - lng_a) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+def coordinates_key(lats_a, lngs_a, lats_b=None, lngs_b=None) -> str:
+    """Chave do cache: hash das coordenadas (arredondadas) e das dimensões"""
+    digest = hashlib.sha1()
+    for values in (lats_a, lngs_a, lats_b, lngs_b):
+        if values is None:
+            digest.update(b'-')
+            continue
+        array = np.round(np.asarray(values, dtype=np.float64), KEY_DECIMALS)
+        digest.update(str(array.shape).encode())
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+
+class DistanceMatrixCache:
+    """Cache LRU de matrizes em memória, com as matrizes grandes também em disco (.npy)"""
+
+    def __init__(self, cache_dir: Optional[str] = CACHE_DIR, memory_size: int = MEMORY_CACHE_SIZE,
+                 max_cached_cells: int = MAX_CACHED_CELLS, max_disk_bytes: int = MAX_DISK_BYTES,
+                 min_disk_cells: int = MIN_DISK_CELLS):
+        """
+        Args:
+            cache_dir: Pasta dos arquivos (None = apenas memória)
+            memory_size: Matrizes mantidas em memória
+            max_cached_cells: Matrizes maiores não são gravadas em disco
+            max_disk_bytes: Espaço máximo dos arquivos em disco
+            min_disk_cells: Matrizes menores ficam só em memória (0 = todas vão para o disco)
+        """
+        self.cache_dir = cache_dir
+        self.memory_size = memory_size
+        self.max_cached_cells = max_cached_cells
+        self.max_disk_bytes = max_disk_bytes
+        self.min_disk_cells = min_disk_cells
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._written_bytes = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f'{key}.npy')
+
+    def get(self, lats_a, lngs_a, lats_b=None, lngs_b=None) -> np.ndarray:
+        """Matriz de distâncias (km, float32), do cache ou calculada e guardada"""
+        key = coordinates_key(lats_a, lngs_a, lats_b, lngs_b)
+
+        with self._lock:
+            matrix = self._memory.get(key)
+            if matrix is not None:
+                self._memory.move_to_end(key)
+                return matrix
+
+        on_disk = bool(self.cache_dir) and self.min_disk_cells <= _cells(lats_a, lats_b) <= self.max_cached_cells
+
+        matrix = None
+        if on_disk and os.path.exists(self._path(key)):
+            try:
+                matrix = np.load(self._path(key))
+                # Marca como usado recentemente para a remoção por LRU
+                os.utime(self._path(key))
+            except (OSError, ValueError) as e:
+                logger.warning(f"⚠️ Cache de distâncias ilegível ({key}): {e}")
+
+        if matrix is None:
+            matrix = haversine_matrix(lats_a, lngs_a, lats_b, lngs_b)
+            if on_disk:
+                self._save(key, matrix)
+
+        with self._lock:
+            self._memory[key] = matrix
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+        return matrix
+
+    def _save(self, key: str, matrix: np.ndarray) -> None:
+        """Grava o .npy de forma atômica (arquivo temporário + rename)"""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f'{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.save(f, matrix)
+                size = f.tell()
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            logger.warning(f"⚠️ Não foi possível gravar cache de distâncias: {e}")
+            return
+
+        with self._lock:
+            self._written_bytes += size
+            due = self._written_bytes >= self.max_disk_bytes // EVICT_FRACTION
+            if due:
+                self._written_bytes = 0
+        if due:
+            self._evict()
+
+    def _evict(self) -> None:
+        """Apaga os arquivos menos usados recentemente até o disco caber em max_disk_bytes"""
+        files = []
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.npy'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # Apagado por outro processo
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+            total -= size
+
+        if removed:
+            logger.info(f"🧹 Cache de distâncias: {removed} arquivo(s) removido(s), {total / 1024 / 1024:.1f} MB em disco")
+
+    def clear(self) -> None:
+        """Esvazia a camada em memória (os arquivos em disco continuam válidos)"""
+        with self._lock:
+            self._memory.clear()
+
+
+def _cells(lats_a, lats_b=None) -> int:
+    """Células da matriz a ser calculada (sem calculá-la)"""
+    rows = len(lats_a)
+    return rows * (rows if lats_b is None else len(lats_b))
+
+
+_default_cache = DistanceMatrixCache()
+
+
+def get_distance_matrix(lats_a, lngs_a, lats_b=None, lngs_b=None) -> np.ndarray:
+    """Matriz de distâncias (km) pelo cache padrão do processo"""
+    return _default_cache.get(lats_a, lngs_a, lats_b, lngs_b)
+
+
+# ============================================================================
+# DISTÂNCIAS DE ROTA
+# ============================================================================
+
+def route_matrix(clients: List[Dict], depot: Optional[Dict] = None,
+                 cache: Optional[DistanceMatrixCache] = None) -> np.ndarray:
+    """
+    Matriz entre os pontos de uma rota ({'lat', 'lng'}); com ponto de saída,
+    ele é o índice 0 e os clientes vêm a partir do índice 1
+    """
+    points = ([depot] if depot else []) + list(clients)
+    lats = [p['lat'] for p in points]
+    lngs = [p['lng'] for p in points]
+    return (cache or _default_cache).get(lats, lngs)
+
+
+def path_length_km(matrix: np.ndarray, order: Sequence[int], closed: bool = False) -> float:
+    """
+    Comprimento (km) do caminho que visita os índices em `order`
+
+    Args:
+        closed: Soma também o retorno do último ao primeiro índice
+    """
+    order = np.asarray(order, dtype=np.int64)
+    if order.shape[0] < 2:
+        return 0.0
+    total = float(matrix[order[:-1], order[1:]].astype(np.float64).sum())
+    if closed:
+        total += float(matrix[order[-1], order[0]])
+    return total
+
+
+def annotate_route_distances(group: Dict, cache: Optional[DistanceMatrixCache] = None) -> Dict:
+    """
+    Grava as distâncias de um grupo de roteirização a partir da matriz em cache:
+
+    - client['seller_distance_km']: ponto de saída → cliente (com group['depot'])
+    - group['depot_distance_km']: ponto de saída → centro do grupo (com group['depot'])
+    - group['sum_distance_km']: percurso na ordem de group['clients'], saindo do
+      ponto de saída e voltando a ele (sem ponto de saída: caminho aberto)
+    """
+    clients = group.get('clients') or []
+    depot = group.get('depot')
+    if not clients:
+        group['sum_distance_km'] = 0.0
+        return group
+
+    center = group.get('center')
+    if depot and center:
+        group['depot_distance_km'] = round(float(haversine_pairs_km(
+            [depot['lat']], [depot['lng']], [center['lat']], [center['lng']]
+        )[0]), 3)
+
+    if len(clients) + 1 > MAX_ROUTE_MATRIX_POINTS:
+        return _annotate_without_matrix(group)
+
+    matrix = route_matrix(clients, depot, cache)
+    if depot:
+        for client, distance in zip(clients, matrix[0, 1:]):
+            client['seller_distance_km'] = round(float(distance), 3)
+        order = range(len(clients) + 1)
+        group['sum_distance_km'] = round(path_length_km(matrix, order, closed=True), 3)
+    else:
+        group['sum_distance_km'] = round(path_length_km(matrix, range(len(clients))), 3)
+    return group
+
+
+def _annotate_without_matrix(group: Dict) -> Dict:
+    """annotate_route_distances para rotas grandes: só trechos consecutivos, O(N) em memória"""
+    points = ([group['depot']] if group.get('depot') else []) + list(group['clients'])
+    if group.get('depot'):
+        points.append(group['depot'])
+    lats = np.array([p['lat'] for p in points], dtype=np.float64)
+    lngs = np.array([p['lng'] for p in points], dtype=np.float64)
+
+    if group.get('depot'):
+        depot = group['depot']
+        seller = haversine_pairs_km(
+            np.full(len(group['clients']), depot['lat']), np.full(len(group['clients']), depot['lng']),
+            lats[1:-1], lngs[1:-1]
+        )
+        for client, distance in zip(group['clients'], seller):
+            client['seller_distance_km'] = round(float(distance), 3)
+
+    legs = haversine_pairs_km(lats[:-1], lngs[:-1], lats[1:], lngs[1:])
+    group['sum_distance_km'] = round(float(legs.sum()), 3)
+    return group
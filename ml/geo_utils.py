@@ -1,9 +1,35 @@
 import json
+import os
 import numpy as np
+import shapely
+from concurrent.futures import ProcessPoolExecutor
 from shapely.geometry import Point, Polygon as ShapelyPolygon
 from shapely.prepared import prep
 from functools import lru_cache
 
+# Grade fixa usada na coluna LatLong.geocell (células de 0.05° ≈ 5.5 km)
+GEOCELL_SIZE_DEG = 0.05
+GEOCELL_COLS = 7200  # 360 / GEOCELL_SIZE_DEG
+
+# Tolerâncias (graus) das versões simplificadas das áreas: ≈ 11 m, 110 m e 1.1 km
+SIMPLIFY_TOLERANCES_DEG = (0.0001, 0.001, 0.01)
+
+# Versão usada nas listas enviadas ao frontend
+LIST_TOLERANCE_DEG = 0.0001
+
+# Grade de classificação da faixa de borda (células por lado, sobre o bbox da área)
+BAND_GRID_SIZE = 64
+
+# Abaixo desse número de pontos o teste exato direto é mais barato que montar a grade
+BAND_MIN_POINTS = 5000
+
+# Modo paralelo da atribuição ponto → polígono (processos, por blocos de pontos)
+PARALLEL_MIN_POINTS = 200000
+PARALLEL_CHUNK_SIZE = 100000
+
+# Raio médio da Terra (km) usado nas distâncias de grande círculo (haversine)
+EARTH_RADIUS_KM = 6371.0088
+
 
 class GeoUtils:    
     @staticmethod
@@ -140,37 +166,42 @@ class GeoUtils:
                 bbox['min_lon'] <= lon <= bbox['max_lon'])
     
     @staticmethod
-    def filter_clients_by_polygons_optimized(clients, polygons):
+    def prepare_polygon_geometries(polygons):
         """
-        Versão otimizada com bounding box pré-filtro
-        Reduz drasticamente o número de verificações precisas
+        Valida as coordenadas e monta as geometrias preparadas usadas pelo motor vetorizado
         
         Args:
-            clients (list): Lista de clientes com {latitude, longitude, ...}
-            polygons (list): Lista de polígonos com {coordinates: [[lat, lng], ...], ...}
+            polygons (list): Lista de polígonos com {id, coordinates: [[lat, lng], ...], ...}
         
         Returns:
-            dict: {polygon_id: [clientes], ...}
+            list: Lista de dicts {id, bbox, geometry, simplified} na mesma ordem dos polígonos válidos
+                  (a faixa de borda 'band' é montada sob demanda por contains_points)
         """
-        result = {poly['id']: [] for poly in polygons}
-        
-        # Prepara polígonos e calcula bounding boxes
-        polygon_data = {}
+        prepared = []
         for poly in polygons:
+            # Geometria já compilada (ex.: carregada do WKB salvo): só prepara
+            if poly.get('geometry') is not None:
+                geometry = poly['geometry']
+                shapely.prepare(geometry)
+                prepared.append({
+                    'id': poly['id'],
+                    'bbox': poly.get('bbox') or GeoUtils.bounds_to_bbox(geometry.bounds),
+                    'geometry': geometry,
+                    'simplified': poly.get('simplified') or {}
+                })
+                continue
+            
             coords = poly.get('coordinates', [])
             if not coords:
                 continue
             
             # Validação: garante que coords é uma lista de listas com 2 elementos numéricos
             try:
-                # Filtra apenas coordenadas válidas
                 valid_coords = []
                 for c in coords:
                     if isinstance(c, (list, tuple)) and len(c) >= 2:
                         try:
-                            lat = float(c[0])
-                            lon = float(c[1])
-                            valid_coords.append([lat, lon])
+                            valid_coords.append([float(c[0]), float(c[1])])
                         except (ValueError, TypeError):
                             continue
                 
@@ -178,46 +209,437 @@ class GeoUtils:
                     print(f"⚠️ Polígono {poly.get('id')} tem menos de 3 coordenadas válidas")
                     continue
                 
-                bbox = GeoUtils.calculate_bbox(valid_coords)
                 # Shapely espera (longitude, latitude), mas coords são [lat, lng]
-                # Então invertemos: c[1] é lng, c[0] é lat
-                shapely_poly = ShapelyPolygon([(c[1], c[0]) for c in valid_coords])
-                prepared_poly = prep(shapely_poly)
+                geometry = ShapelyPolygon([(c[1], c[0]) for c in valid_coords])
+                # shapely.prepare acelera contains_xy sem trocar o tipo da geometria
+                shapely.prepare(geometry)
                 
-                polygon_data[poly['id']] = {
-                    'bbox': bbox,
-                    'geometry': prepared_poly,
-                    'raw': shapely_poly
-                }
+                prepared.append({
+                    'id': poly['id'],
+                    'bbox': GeoUtils.calculate_bbox(valid_coords),
+                    'geometry': geometry,
+                    'simplified': {}
+                })
             except Exception as e:
                 print(f"❌ Erro ao processar polígono {poly.get('id')}: {e}")
                 continue
         
-        # Filtra clientes usando bounding box primeiro (muito rápido)
-        # Depois verifica com polígono preciso apenas os candidatos
-        for client in clients:
-            lat = client.get('latitude')
-            lon = client.get('longitude')
-            
-            if lat is None or lon is None:
+        return prepared
+    
+    @staticmethod
+    def simplify_levels(geometry, tolerances=SIMPLIFY_TOLERANCES_DEG):
+        """
+        Versões simplificadas (preservando topologia) de uma área, uma por tolerância
+        
+        Returns:
+            dict: {tolerância: geometria simplificada}
+        """
+        levels = {}
+        for tolerance in tolerances:
+            simplified = shapely.simplify(geometry, tolerance, preserve_topology=True)
+            # Mantém a original se a simplificação não gerar um polígono válido
+            levels[tolerance] = simplified if simplified.geom_type == 'Polygon' and not simplified.is_empty else geometry
+        return levels
+    
+    @staticmethod
+    def boundary_band(geometry, simplified=None, grid_size=BAND_GRID_SIZE):
+        """
+        Grade de classificação grosseira da área (faixa de borda)
+        
+        O bbox da área é dividido em grid_size x grid_size células, classificadas uma
+        única vez com a versão simplificada mais grossa que cabe na célula. Como ela
+        fica a no máximo `t` da original:
+        - célula contida na simplificada encolhida (-2t)  → totalmente dentro  (1)
+        - célula fora da simplificada expandida (+2t)     → totalmente fora    (-1)
+        - demais células (perto da borda)                 → teste exato        (0)
+        A margem de 2t cobre a aproximação dos arcos do buffer.
+        
+        Args:
+            geometry: Polígono exato
+            simplified (dict): {tolerância: geometria simplificada} (GeoUtils.simplify_levels)
+            grid_size (int): Células por lado
+        
+        Returns:
+            dict: {state: np.ndarray int8 (linhas=lat, colunas=lng), origin: (min_lng, min_lat), cell: (dx, dy)}
+        """
+        min_lng, min_lat, max_lng, max_lat = geometry.bounds
+        dx = (max_lng - min_lng) / grid_size or 1e-12
+        dy = (max_lat - min_lat) / grid_size or 1e-12
+        
+        # Versão simplificada mais grossa cuja tolerância cabe em meia célula
+        levels = [t for t in (simplified or {}) if t <= min(dx, dy) / 2]
+        if levels:
+            tolerance = max(levels)
+            margin = 2 * tolerance
+            inner = shapely.buffer(simplified[tolerance], -margin, quad_segs=2)
+            outer = shapely.buffer(simplified[tolerance], margin, quad_segs=2)
+            shapely.prepare(inner)
+            shapely.prepare(outer)
+        else:
+            inner = outer = geometry
+        
+        xs = min_lng + dx * np.arange(grid_size)
+        ys = min_lat + dy * np.arange(grid_size)
+        cell_x, cell_y = np.meshgrid(xs, ys)
+        cell_x = cell_x.ravel()
+        cell_y = cell_y.ravel()
+        # Células levemente ampliadas: erro de arredondamento na indexação nunca classifica errado
+        eps = 1e-9
+        cells = shapely.box(cell_x - eps, cell_y - eps, cell_x + dx + eps, cell_y + dy + eps)
+        
+        state = np.zeros(grid_size * grid_size, dtype=np.int8)
+        state[shapely.contains_properly(inner, cells)] = 1
+        state[~shapely.intersects(outer, cells)] = -1
+        
+        return {
+            'state': state.reshape(grid_size, grid_size),
+            'origin': (min_lng, min_lat),
+            'cell': (dx, dy)
+        }
+    
+    @staticmethod
+    def contains_points(pdata, lngs, lats):
+        """
+        Contenção vetorizada de pontos em uma área preparada (saída de prepare_polygon_geometries)
+        
+        Para lotes grandes usa a faixa de borda (montada na primeira chamada e guardada em
+        pdata['band']): a classificação das células resolve a maioria dos pontos com
+        indexação NumPy e só os pontos perto da borda passam pelo anel exato.
+        
+        Returns:
+            np.ndarray: Array booleano com o resultado por ponto
+        """
+        lngs = np.asarray(lngs, dtype=float)
+        lats = np.asarray(lats, dtype=float)
+        if lngs.shape[0] < BAND_MIN_POINTS:
+            return shapely.contains_xy(pdata['geometry'], lngs, lats)
+        
+        band = pdata.get('band')
+        if band is None:
+            band = GeoUtils.boundary_band(pdata['geometry'], pdata.get('simplified'))
+            pdata['band'] = band
+        
+        state = band['state']
+        rows, cols = state.shape
+        ix = np.floor((lngs - band['origin'][0]) / band['cell'][0])
+        iy = np.floor((lats - band['origin'][1]) / band['cell'][1])
+        inside_grid = (ix >= 0) & (ix < cols) & (iy >= 0) & (iy < rows)
+        
+        point_state = np.full(lngs.shape[0], -1, dtype=np.int8)
+        point_state[inside_grid] = state[iy[inside_grid].astype(np.int64), ix[inside_grid].astype(np.int64)]
+        
+        result = point_state == 1
+        near = point_state == 0
+        if near.any():
+            result[near] = shapely.contains_xy(pdata['geometry'], lngs[near], lats[near])
+        return result
+    
+    @staticmethod
+    def bounds_to_bbox(bounds):
+        """Converte bounds do Shapely (minx, miny, maxx, maxy) para o formato de bbox do GeoUtils"""
+        min_lon, min_lat, max_lon, max_lat = bounds
+        return {
+            'min_lat': min_lat,
+            'max_lat': max_lat,
+            'min_lon': min_lon,
+            'max_lon': max_lon
+        }
+    
+    @staticmethod
+    def geojson_to_coordinates(geojson):
+        """
+        Extrai o anel externo de um GeoJSON salvo (Feature ou Polygon)
+        
+        Args:
+            geojson (dict | str): GeoJSON com coordenadas [[[lon, lat], ...]]
+        
+        Returns:
+            list: Coordenadas [[lat, lon], ...] como esperado pelo GeoUtils ([] se inválido)
+        """
+        if isinstance(geojson, str):
+            geojson = json.loads(geojson)
+        
+        if not isinstance(geojson, dict):
+            return []
+        
+        if geojson.get('type') == 'Feature':
+            geometry = geojson.get('geometry') or {}
+            # Retângulo também tem formato similar ao Polygon
+            if geometry.get('type') not in ('Polygon', 'Rectangle'):
+                print(f"⚠️  Tipo de geometria não suportado: {geometry.get('type')}")
+                return []
+            coords_array = (geometry.get('coordinates') or [[]])[0]
+        elif geojson.get('type') == 'Polygon':
+            coords_array = (geojson.get('coordinates') or [[]])[0]
+        else:
+            print(f"⚠️  Tipo de GeoJSON não suportado: {geojson.get('type')}")
+            return []
+        
+        # Converte [lon, lat] para [lat, lon]
+        return [[c[1], c[0]] for c in coords_array] if coords_array else []
+    
+    @staticmethod
+    def compile_geojson(geojson):
+        """
+        Compila o GeoJSON de uma área para WKB + bounding box (gravados junto do polígono)
+        
+        Args:
+            geojson (dict | str): GeoJSON da área
+        
+        Returns:
+            dict: {wkb: bytes, bbox: {min_lat, max_lat, min_lon, max_lon},
+                   simplified: {tolerância: wkb}} ou None se inválido
+        """
+        coords = GeoUtils.geojson_to_coordinates(geojson)
+        prepared = GeoUtils.prepare_polygon_geometries([{'id': None, 'coordinates': coords}])
+        if not prepared:
+            return None
+        
+        geometry = prepared[0]['geometry']
+        return {
+            'wkb': shapely.to_wkb(geometry),
+            'bbox': prepared[0]['bbox'],
+            'simplified': {
+                tolerance: shapely.to_wkb(simplified)
+                for tolerance, simplified in GeoUtils.simplify_levels(geometry).items()
+            }
+        }
+    
+    @staticmethod
+    def parse_bbox(value):
+        """
+        Converte o parâmetro bbox "oeste,sul,leste,norte" (Leaflet toBBoxString) para o formato do GeoUtils
+        
+        Args:
+            value (str): "min_lon,min_lat,max_lon,max_lat"
+        
+        Returns:
+            dict: {min_lat, max_lat, min_lon, max_lon}
+        
+        Raises:
+            ValueError: Se o bbox não tiver 4 números válidos
+        """
+        parts = [float(v) for v in str(value).split(',')]
+        if len(parts) != 4 or not all(np.isfinite(parts)):
+            raise ValueError(f"bbox inválido: {value}")
+        
+        min_lon, min_lat, max_lon, max_lat = parts
+        return {
+            'min_lat': max(min(min_lat, max_lat), -90.0),
+            'max_lat': min(max(min_lat, max_lat), 90.0),
+            'min_lon': max(min(min_lon, max_lon), -180.0),
+            'max_lon': min(max(min_lon, max_lon), 180.0)
+        }
+    
+    @staticmethod
+    def geocell(lat, lon):
+        """
+        Célula da grade fixa (linha * GEOCELL_COLS + coluna) que contém o ponto
+        
+        A mesma fórmula (truncamento de valores positivos) é usada no backfill em SQL,
+        então o resultado é idêntico nos dois lados.
+        
+        Returns:
+            int: Código da célula ou None se as coordenadas forem inválidas
+        """
+        try:
+            lat = float(lat)
+            lon = float(lon)
+        except (TypeError, ValueError):
+            return None
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            return None
+        return int((lat + 90) / GEOCELL_SIZE_DEG) * GEOCELL_COLS + int((lon + 180) / GEOCELL_SIZE_DEG)
+    
+    @staticmethod
+    def geocell_ranges(bbox, max_ranges=64):
+        """
+        Faixas contíguas de células que cobrem o bounding box (uma por linha da grade)
+        
+        Acima de max_ranges linhas (zoom muito afastado) retorna uma única faixa que
+        cobre todo o bbox; o filtro exato por latitude/longitude continua sendo aplicado.
+        
+        Args:
+            bbox (dict): {min_lat, max_lat, min_lon, max_lon}
+            max_ranges (int): Número máximo de faixas geradas
+        
+        Returns:
+            list: [(célula_inicial, célula_final), ...] inclusivas
+        """
+        first = GeoUtils.geocell(bbox['min_lat'], bbox['min_lon'])
+        last = GeoUtils.geocell(bbox['max_lat'], bbox['max_lon'])
+        if first is None or last is None:
+            return []
+        
+        row0, col0 = divmod(first, GEOCELL_COLS)
+        row1, col1 = divmod(last, GEOCELL_COLS)
+        
+        if row1 - row0 + 1 > max_ranges:
+            return [(first, last)]
+        
+        return [
+            (row * GEOCELL_COLS + col0, row * GEOCELL_COLS + col1)
+            for row in range(row0, row1 + 1)
+        ]
+    
+    @staticmethod
+    def coordinates_to_arrays(clients):
+        """
+        Extrai latitude/longitude de uma lista de clientes para arrays NumPy
+        Valores ausentes ou inválidos viram NaN (e nunca caem dentro de um polígono)
+        
+        Args:
+            clients (list): Lista de clientes com {latitude, longitude, ...}
+        
+        Returns:
+            tuple: (lats, lngs) como np.ndarray float64
+        """
+        def to_float(value):
+            try:
+                return float(value) if value is not None else np.nan
+            except (ValueError, TypeError):
+                return np.nan
+        
+        lats = np.fromiter((to_float(c.get('latitude')) for c in clients), dtype=float, count=len(clients))
+        lngs = np.fromiter((to_float(c.get('longitude')) for c in clients), dtype=float, count=len(clients))
+        return lats, lngs
+    
+    @staticmethod
+    def points_in_polygons(lats, lngs, polygon_geometries):
+        """
+        Motor vetorizado de ponto-em-polígono (Shapely 2)
+        
+        Para cada polígono aplica um pré-filtro de bounding box em NumPy sobre todos os
+        pontos e só então chama GeoUtils.contains_points nos candidatos, sem criar um Point
+        por cliente.
+        
+        Args:
+            lats (array-like): Latitudes dos pontos
+            lngs (array-like): Longitudes dos pontos
+            polygon_geometries (list): Saída de prepare_polygon_geometries
+        
+        Returns:
+            np.ndarray: Matriz booleana (n_pontos, n_poligonos); membership[i, j] indica
+                        se o ponto i está dentro do polígono j
+        """
+        lats = np.asarray(lats, dtype=float)
+        lngs = np.asarray(lngs, dtype=float)
+        membership = np.zeros((lats.shape[0], len(polygon_geometries)), dtype=bool)
+        
+        if lats.shape[0] == 0:
+            return membership
+        
+        valid = np.isfinite(lats) & np.isfinite(lngs)
+        
+        for j, pdata in enumerate(polygon_geometries):
+            bbox = pdata['bbox']
+            candidates = np.flatnonzero(
+                valid &
+                (lats >= bbox['min_lat']) & (lats <= bbox['max_lat']) &
+                (lngs >= bbox['min_lon']) & (lngs <= bbox['max_lon'])
+            )
+            if candidates.size == 0:
                 continue
-            
-            # Shapely espera Point(longitude, latitude)
-            point = Point(lon, lat)
-            
-            for poly_id, pdata in polygon_data.items():
-                if not GeoUtils.point_in_bbox(lat, lon, pdata['bbox']):
-                    continue
-                try:
-                    if pdata['geometry'].contains(point):
-                        result[poly_id].append(client)
-                except Exception:
-                    if pdata['raw'].contains(point):
-                        result[poly_id].append(client)
+            # Shapely espera (x=longitude, y=latitude)
+            membership[candidates, j] = GeoUtils.contains_points(
+                pdata, lngs[candidates], lats[candidates]
+            )
+        
+        return membership
+    
+    @staticmethod
+    def points_in_polygons_chunked(lats, lngs, polygons, max_workers=None,
+                                   chunk_size=PARALLEL_CHUNK_SIZE, min_points=PARALLEL_MIN_POINTS):
+        """
+        Mesmo resultado de points_in_polygons, dividindo os pontos entre processos
+        
+        Cada processo prepara os polígonos uma única vez (initializer) e calcula a
+        pertinência dos blocos de pontos que recebe. Abaixo de `min_points` (ou com
+        um único worker) roda no processo atual.
+        
+        Args:
+            lats, lngs (array-like): Coordenadas dos pontos
+            polygons (list): Polígonos no formato do GeoUtils ({id, coordinates} ou {id, geometry})
+            max_workers (int): Número de processos (padrão: número de CPUs)
+            chunk_size (int): Pontos por bloco
+            min_points (int): Limite abaixo do qual não paraleliza
+        
+        Returns:
+            tuple: (membership, ids) - matriz booleana (n_pontos, n_poligonos_validos) e
+                   os ids dos polígonos na ordem das colunas
+        """
+        lats = np.asarray(lats, dtype=float)
+        lngs = np.asarray(lngs, dtype=float)
+        workers = max_workers or os.cpu_count() or 1
+        
+        if lats.shape[0] < min_points or workers <= 1:
+            polygon_geometries = GeoUtils.prepare_polygon_geometries(polygons)
+            return GeoUtils.points_in_polygons(lats, lngs, polygon_geometries), [p['id'] for p in polygon_geometries]
+        
+        bounds = range(0, lats.shape[0], chunk_size)
+        workers = min(workers, len(bounds))
+        
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_membership_worker,
+                                 initargs=(polygons,)) as executor:
+            results = list(executor.map(
+                _membership_worker,
+                ((lats[i:i + chunk_size], lngs[i:i + chunk_size]) for i in bounds)
+            ))
+        
+        ids = results[0][1]
+        membership = np.concatenate([
+            np.unpackbits(packed, axis=0, count=n).astype(bool) for (packed, n), _ in results
+        ])
+        return membership, ids
+    
+    @staticmethod
+    def filter_clients_by_polygons_optimized(clients, polygons):
+        """
+        Versão otimizada com bounding box pré-filtro
+        Usa o motor vetorizado (points_in_polygons) em vez de um Point por cliente
+        
+        Args:
+            clients (list): Lista de clientes com {latitude, longitude, ...}
+            polygons (list): Lista de polígonos com {coordinates: [[lat, lng], ...], ...}
+        
+        Returns:
+            dict: {polygon_id: [clientes], ...}
+        """
+        result = {poly['id']: [] for poly in polygons}
+        
+        polygon_geometries = GeoUtils.prepare_polygon_geometries(polygons)
+        if not polygon_geometries or not clients:
+            return result
+        
+        lats, lngs = GeoUtils.coordinates_to_arrays(clients)
+        membership = GeoUtils.points_in_polygons(lats, lngs, polygon_geometries)
+        
+        for j, pdata in enumerate(polygon_geometries):
+            result[pdata['id']] = [clients[i] for i in np.flatnonzero(membership[:, j])]
         
         return result
 
 
+# ============================================================================
+# WORKERS DO MODO PARALELO (funções de módulo para serem serializáveis)
+# ============================================================================
+
+_worker_geometries = None
+
+
+def _init_membership_worker(polygons):
+    """Prepara os polígonos uma única vez em cada processo"""
+    global _worker_geometries
+    _worker_geometries = GeoUtils.prepare_polygon_geometries(polygons)
+
+
+def _membership_worker(chunk):
+    """Pertinência de um bloco de pontos; devolve a matriz compactada em bits"""
+    lats, lngs = chunk
+    membership = GeoUtils.points_in_polygons(lats, lngs, _worker_geometries)
+    return (np.packbits(membership, axis=0), membership.shape[0]), [p['id'] for p in _worker_geometries]
+
+
 def batch_assign_clients_to_polygons(clients_data, polygons_data):
     """
     Função auxiliar para processar em lote a atribuição de clientes a polígonos
@@ -0,0 +1,240 @@
+"""
+Incremental Routing - Replanejamento a partir de um calendário salvo
+====================================================================
+
+Quando poucos clientes entram (ou saem), roteirizar do zero com
+create_routes_knn pode embaralhar a semana inteira. Aqui o calendário salvo
+(SavedCalendar.alocacoes) é o ponto de partida:
+
+1. Cada dia salvo mantém os clientes que ainda existem, na ordem salva
+2. O centro de cada dia vem de 'centro' da alocação (ou da média dos seus
+   clientes) e serve de semente
+3. Clientes novos vão para o dia de centro mais próximo que ainda tem
+   capacidade (max_clients_per_day) e, com pontos de saída, que é do mesmo
+   ponto de saída do cliente; os que não cabem em nenhum dia formam
+   dias novos ao final do calendário, separados por ponto de saída
+   ('depot_id') e agrupados com k-means com capacidade dentro de cada um
+4. Só os dias alterados (com clientes novos ou removidos) são reordenados
+   (vizinho mais próximo + 2-opt); os demais mantêm a ordem de visita
+
+Cada grupo traz 'rerouted', 'new_clients' e 'removed_clients'.
+
+Autor: SynapseLog
+"""
+
+import logging
+import math
+from collections import Counter
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ml.clustering import BACKEND_KMEANS, balanced_kmeans
+from ml.distance_matrix import haversine_matrix, annotate_route_distances
+from ml.route_optimizer import calculate_center
+from ml.sequencing import sequence_group, build_stops, TWO_OPT_TIME_BUDGET_S
+
+logger = logging.getLogger(__name__)
+
+
+def load_calendar_days(alocacoes: List[Dict]) -> List[Dict]:
+    """
+    Dias de um calendário salvo
+
+    Args:
+        alocacoes: SavedCalendar.alocacoes (lista de {'dia', 'clientes', 'centro'?, 'depot'?, ...})
+
+    Returns:
+        list: [{'day', 'hashes': [hash_cliente, ...], 'center': {'lat', 'lng'} | None,
+                'depot_id': id do ponto de saída salvo | None}, ...] por dia
+    """
+    days = {}
+    for alocacao in alocacoes or []:
+        try:
+            day = int(alocacao.get('dia'))
+        except (TypeError, ValueError):
+            continue
+        entry = days.setdefault(day, {'day': day, 'hashes': [], 'center': None, 'depot_id': None, 'coordinates': []})
+
+        for cliente in alocacao.get('clientes') or []:
+            if cliente.get('hash_cliente'):
+                entry['hashes'].append(cliente['hash_cliente'])
+            if cliente.get('latitude') is not None and cliente.get('longitude') is not None:
+                entry['coordinates'].append((float(cliente['latitude']), float(cliente['longitude'])))
+
+        centro = alocacao.get('centro') or {}
+        if centro.get('lat') is not None and centro.get('lng') is not None:
+            entry['center'] = {'lat': float(centro['lat']), 'lng': float(centro['lng'])}
+
+        depot = alocacao.get('depot') or {}
+        if depot.get('id') is not None:
+            entry['depot_id'] = depot['id']
+
+    for entry in days.values():
+        coordinates = entry.pop('coordinates')
+        if entry['center'] is None and coordinates:
+            lat, lng = np.mean(coordinates, axis=0)
+            entry['center'] = {'lat': float(lat), 'lng': float(lng)}
+
+    return [days[day] for day in sorted(days)]
+
+
+def reroute_incremental(
+    clients_data: List[Dict],
+    saved_days: List[Dict],
+    max_clients_per_day: Optional[int] = None,
+    depots: Optional[List[Dict]] = None,
+    sequence: bool = True,
+    sequencing_time_budget: float = TWO_OPT_TIME_BUDGET_S
+) -> List[Dict]:
+    """
+    Replaneja mantendo os dias de um calendário salvo
+
+    Args:
+        clients_data: Clientes atuais no formato do route_optimizer (com 'hash_client')
+        saved_days: Saída de load_calendar_days
+        max_clients_per_day: Capacidade de cada dia (None = sem limite)
+        depots: Pontos de saída (clientes com 'depot_id', ml/depots.py)
+        sequence: Reordena os dias alterados
+        sequencing_time_budget: Tempo máximo do 2-opt por dia, em segundos
+
+    Returns:
+        list: Grupos no formato de create_routes_knn, em ordem de dia
+    """
+    by_hash = {c['hash_client']: c for c in clients_data if c.get('hash_client')}
+    placed = set()
+
+    days = []
+    for saved in saved_days:
+        kept = []
+        for hash_client in saved['hashes']:
+            client = by_hash.get(hash_client)
+            if client is not None and hash_client not in placed:
+                kept.append(client)
+                placed.add(hash_client)
+        removed = len(saved['hashes']) - len(kept)
+        center = saved.get('center') or (calculate_center(kept) if kept else None)
+        # Ponto de saída do dia: o salvo ou, sem ele, o da maioria dos clientes mantidos
+        depot_id = saved.get('depot_id')
+        if depot_id is None and kept:
+            depot_id = _majority_depot(kept)
+        days.append({'day': saved['day'], 'clients': kept, 'seed': center, 'depot_id': depot_id,
+                     'new_clients': 0, 'removed_clients': removed})
+
+    new_clients = [c for c in clients_data if c.get('hash_client') not in placed]
+    overflow = _insert_nearest_with_capacity(new_clients, days, max_clients_per_day, by_depot=bool(depots))
+    days.extend(_overflow_days(overflow, max_clients_per_day, days[-1]['day'] if days else 0))
+
+    logger.info(f"🔁 Replanejamento incremental: {len(days)} dias, {len(new_clients)} clientes novos "
+                f"({len(overflow)} em dias novos), {sum(d['removed_clients'] for d in days)} removidos")
+
+    depots_by_id = {d['id']: d for d in depots or []}
+    groups = []
+    for day in days:
+        if not day['clients']:
+            continue
+        group = {
+            'group_number': len(groups) + 1,
+            'day': day['day'],
+            'clients': day['clients'],
+            'total_clients': len(day['clients']),
+            'center': calculate_center(day['clients']),
+            'is_split': False,
+            'clustering_backend': BACKEND_KMEANS,
+            'rerouted': bool(day['new_clients'] or day['removed_clients']),
+            'new_clients': day['new_clients'],
+            'removed_clients': day['removed_clients']
+        }
+        if depots_by_id:
+            depot = depots_by_id.get(day['depot_id'])
+            group['depot'] = (
+                {'id': depot['id'], 'name': depot.get('name'), 'lat': depot['lat'], 'lng': depot['lng']}
+                if depot else None
+            )
+
+        # Só os dias alterados são reordenados; os outros mantêm a ordem salva
+        if group['rerouted'] and sequence:
+            sequence_group(group, sequencing_time_budget)
+        else:
+            build_stops(group)
+        annotate_route_distances(group)
+        groups.append(group)
+
+    return groups
+
+
+def _majority_depot(clients: List[Dict]):
+    """'depot_id' mais frequente entre os clientes (empate: o que aparece primeiro)"""
+    return Counter(c.get('depot_id') for c in clients).most_common(1)[0][0]
+
+
+def _insert_nearest_with_capacity(new_clients: List[Dict], days: List[Dict],
+                                  max_clients_per_day: Optional[int], by_depot: bool = False) -> List[Dict]:
+    """
+    Coloca cada cliente novo no dia de semente mais próxima com vaga; os mais
+    próximos de alguma semente escolhem primeiro. Com by_depot, só os dias do
+    mesmo 'depot_id' do cliente são candidatos
+
+    Returns:
+        list: Clientes que não couberam em nenhum dia
+    """
+    seeded = [day for day in days if day['seed'] is not None]
+    if not new_clients or not seeded:
+        return list(new_clients)
+
+    distances = haversine_matrix(
+        [c['lat'] for c in new_clients], [c['lng'] for c in new_clients],
+        [d['seed']['lat'] for d in seeded], [d['seed']['lng'] for d in seeded]
+    )
+    if by_depot:
+        # Dias de outro ponto de saída ficam fora do alcance do cliente
+        client_depots = np.array([c.get('depot_id') for c in new_clients], dtype=object)
+        day_depots = np.array([d['depot_id'] for d in seeded], dtype=object)
+        distances[client_depots[:, None] != day_depots[None, :]] = np.inf
+    if max_clients_per_day is None:
+        capacity = np.full(len(seeded), np.iinfo(np.int64).max)
+    else:
+        capacity = np.array([max(0, max_clients_per_day - len(d['clients'])) for d in seeded], dtype=np.int64)
+
+    overflow = []
+    for k in np.argsort(distances.min(axis=1), kind='stable'):
+        candidates = np.argsort(distances[k], kind='stable')
+        open_days = candidates[(capacity[candidates] > 0) & np.isfinite(distances[k, candidates])]
+        if open_days.size == 0:
+            overflow.append(new_clients[k])
+            continue
+        target = int(open_days[0])
+        seeded[target]['clients'].append(new_clients[k])
+        seeded[target]['new_clients'] += 1
+        capacity[target] -= 1
+
+    return overflow
+
+
+def _overflow_days(clients: List[Dict], max_clients_per_day: Optional[int], last_day: int) -> List[Dict]:
+    """
+    Dias novos, ao final do calendário, para os clientes que não couberam nos
+    existentes. Cada ponto de saída ('depot_id') tem os seus próprios dias, como
+    em create_routes_knn: um dia nunca mistura clientes de pontos diferentes.
+    """
+    by_depot = {}
+    for client in clients:
+        by_depot.setdefault(client.get('depot_id'), []).append(client)
+
+    days = []
+    for depot_clients in by_depot.values():
+        n_days = math.ceil(len(depot_clients) / max_clients_per_day) if max_clients_per_day else 1
+        if n_days == 1:
+            labels = np.zeros(len(depot_clients), dtype=int)
+        else:
+            # KMeans com capacidade: nenhum dia novo passa do limite
+            coordinates = np.array([[c['lat'], c['lng']] for c in depot_clients])
+            labels = balanced_kmeans(coordinates, n_days, max_clients_per_day)
+
+        for label in range(n_days):
+            members = [c for c, l in zip(depot_clients, labels) if l == label]
+            if members:
+                days.append({'day': last_day + len(days) + 1, 'clients': members, 'seed': calculate_center(members),
+                             'depot_id': members[0].get('depot_id'), 'new_clients': len(members),
+                             'removed_clients': 0})
+    return days
@@ -0,0 +1,266 @@
+"""
+Membership - Pertinência cliente → área materializada
+======================================================
+
+Persiste na tabela KNN (bind 'KNN') a qual área (Polygon) cada ponto de cliente
+(LatLong com user_point=False) pertence, no mesmo formato produzido por
+batch_assign_clients_to_polygons: uma linha (id_client, polygon_id) por par.
+
+Conjuntos muito grandes de pontos (PARALLEL_MIN_POINTS) são divididos entre
+processos pelo motor em blocos do GeoUtils.
+
+A tabela é mantida de forma incremental:
+- Área criada/alterada  → refresh_polygon_membership (só a área alterada)
+- Área excluída         → remove_polygon_membership
+- Clientes importados   → refresh_clients_membership (só os pontos novos)
+
+Assim o painel, os filtros de área e a roteirização leem a pertinência com uma
+consulta indexada em vez de recalcular a contenção de todos os clientes.
+
+Autor: SynapseLog
+"""
+
+import logging
+import numpy as np
+from sqlalchemy import func, distinct
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from base.models import db, KNN, LatLong
+from ml.geo_utils import GeoUtils, PARALLEL_MIN_POINTS
+
+logger = logging.getLogger(__name__)
+
+# Tamanho dos lotes de IN (...) - respeita o limite de variáveis do SQLite
+CHUNK_SIZE = 500
+
+
+def _chunks(values: List, size: int = CHUNK_SIZE):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _load_client_points(user_id, client_ids: Optional[List[int]] = None,
+                        bbox: Optional[Dict] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Carrega (ids, lats, lngs) dos pontos de cliente do usuário como arrays
+
+    Se `bbox` for informado ({min_lat, max_lat, min_lon, max_lon}), o pré-filtro
+    por bounding box roda no próprio SQL e só os pontos candidatos são carregados.
+    """
+    base_query = db.session.query(LatLong.id, LatLong.latitude, LatLong.longitude).filter(
+        LatLong.id_user == user_id,
+        LatLong.user_point == False  # noqa: E712
+    )
+
+    if bbox is not None:
+        base_query = base_query.filter(
+            LatLong.latitude.between(bbox['min_lat'], bbox['max_lat']),
+            LatLong.longitude.between(bbox['min_lon'], bbox['max_lon'])
+        )
+
+    if client_ids is None:
+        rows = base_query.all()
+    else:
+        rows = []
+        for chunk in _chunks(list(client_ids)):
+            rows.extend(base_query.filter(LatLong.id.in_(chunk)).all())
+
+    if not rows:
+        empty = np.array([], dtype=float)
+        return np.array([], dtype=np.int64), empty, empty
+
+    ids, lats, lngs = zip(*rows)
+    return (
+        np.asarray(ids, dtype=np.int64),
+        np.asarray(lats, dtype=float),
+        np.asarray(lngs, dtype=float)
+    )
+
+
+def _query_membership(lats, lngs, polygon_index, polygon_ids: List[int]) -> Tuple[np.ndarray, Dict[int, int]]:
+    """
+    Matriz de pertinência ponto x área e a coluna de cada área
+
+    Até PARALLEL_MIN_POINTS pontos usa o STRtree do índice no próprio processo;
+    acima disso divide os pontos entre processos (GeoUtils.points_in_polygons_chunked),
+    só com as áreas pedidas.
+    """
+    if lats.shape[0] < PARALLEL_MIN_POINTS:
+        return polygon_index.query_membership(lats, lngs), polygon_index.position
+
+    polygons = []
+    for pid in polygon_ids:
+        geometry = polygon_index.geometries[polygon_index.position[pid]]
+        polygons.append({
+            'id': pid,
+            'geometry': geometry['geometry'],
+            'bbox': geometry['bbox'],
+            'simplified': geometry['simplified']
+        })
+    membership, columns = GeoUtils.points_in_polygons_chunked(lats, lngs, polygons, min_points=PARALLEL_MIN_POINTS)
+    return membership, {pid: j for j, pid in enumerate(columns)}
+
+
+def _build_rows(ids, lats, lngs, polygon_index, polygon_ids: Iterable[int]) -> Dict[int, List[Dict]]:
+    """Calcula as linhas da tabela KNN por polígono usando o índice espacial"""
+    polygon_ids = list(polygon_ids)
+    membership, position = _query_membership(lats, lngs, polygon_index, polygon_ids)
+    rows_by_polygon = {}
+    for pid in polygon_ids:
+        column = membership[:, position[pid]]
+        rows_by_polygon[pid] = [
+            {'id_client': int(client_id), 'polygon_id': pid}
+            for client_id in ids[column]
+        ]
+    return rows_by_polygon
+
+
+def _union_bbox(polygon_index, polygon_ids: Iterable[int]) -> Optional[Dict]:
+    """Bounding box que cobre todas as áreas informadas (None se nenhuma)"""
+    bboxes = [polygon_index.geometries[polygon_index.position[pid]]['bbox'] for pid in polygon_ids]
+    if not bboxes:
+        return None
+    return {
+        'min_lat': min(b['min_lat'] for b in bboxes),
+        'max_lat': max(b['max_lat'] for b in bboxes),
+        'min_lon': min(b['min_lon'] for b in bboxes),
+        'max_lon': max(b['max_lon'] for b in bboxes)
+    }
+
+
+def _delete_polygon_rows(polygon_ids: List[int]) -> None:
+    for chunk in _chunks(list(polygon_ids)):
+        KNN.query.filter(KNN.polygon_id.in_(chunk)).delete(synchronize_session=False)
+
+
+def refresh_polygon_membership(user_id, polygon_ids: List[int], polygon_index) -> int:
+    """
+    Recalcula a pertinência de algumas áreas contra todos os clientes do usuário
+
+    Args:
+        user_id: Dono das áreas e dos clientes
+        polygon_ids: Áreas criadas/alteradas
+        polygon_index: PolygonIndex atualizado do usuário
+
+    Returns:
+        int: Número de linhas gravadas
+    """
+    polygon_ids = list(polygon_ids)
+    indexed = [pid for pid in polygon_ids if pid in polygon_index.position]
+
+    _delete_polygon_rows(polygon_ids)
+
+    rows_by_polygon = {}
+    if indexed:
+        ids, lats, lngs = _load_client_points(user_id, bbox=_union_bbox(polygon_index, indexed))
+        rows_by_polygon = _build_rows(ids, lats, lngs, polygon_index, indexed)
+
+    rows = [row for pid in indexed for row in rows_by_polygon[pid]]
+    if rows:
+        db.session.bulk_insert_mappings(KNN, rows)
+    db.session.commit()
+
+    logger.info(f"🗺️ Pertinência recalculada: user={user_id} áreas={polygon_ids} linhas={len(rows)}")
+    return len(rows)
+
+
+def remove_polygon_membership(polygon_ids: List[int]) -> None:
+    """Remove a pertinência de áreas excluídas"""
+    _delete_polygon_rows(list(polygon_ids))
+    db.session.commit()
+
+
+def refresh_clients_membership(user_id, client_ids: List[int], polygon_index) -> int:
+    """
+    Calcula a pertinência apenas dos pontos de cliente informados (ex.: recém-importados)
+
+    Args:
+        user_id: Dono dos pontos
+        client_ids: IDs de LatLong novos ou alterados
+        polygon_index: PolygonIndex do usuário
+
+    Returns:
+        int: Número de linhas gravadas
+    """
+    client_ids = [int(cid) for cid in client_ids]
+    if not client_ids:
+        return 0
+
+    for chunk in _chunks(client_ids):
+        KNN.query.filter(KNN.id_client.in_(chunk)).delete(synchronize_session=False)
+
+    rows = []
+    if len(polygon_index):
+        ids, lats, lngs = _load_client_points(user_id, client_ids)
+        rows_by_polygon = _build_rows(ids, lats, lngs, polygon_index, polygon_index.ids)
+        for polygon_rows in rows_by_polygon.values():
+            rows.extend(polygon_rows)
+
+    if rows:
+        db.session.bulk_insert_mappings(KNN, rows)
+    db.session.commit()
+
+    logger.info(f"🗺️ Pertinência de {len(client_ids)} clientes atualizada: user={user_id} linhas={len(rows)}")
+    return len(rows)
+
+
+def ensure_user_membership(user_id, polygon_index) -> None:
+    """
+    Materializa as áreas do usuário que ainda não têm pertinência gravada
+    (ex.: áreas criadas antes da tabela passar a ser mantida)
+
+    Áreas sem nenhum cliente não têm linhas e são conferidas de novo a cada
+    chamada; o pré-filtro por bbox no SQL mantém essa conferência barata. Não há
+    estado em memória: outro worker pode ter importado clientes nessas áreas.
+    """
+    polygon_ids = list(polygon_index.ids)
+    if not polygon_ids:
+        return
+
+    present = set()
+    for chunk in _chunks(polygon_ids):
+        present.update(
+            pid for (pid,) in db.session.query(KNN.polygon_id).filter(KNN.polygon_id.in_(chunk)).distinct()
+        )
+
+    missing = [pid for pid in polygon_ids if pid not in present]
+    if missing:
+        refresh_polygon_membership(user_id, missing, polygon_index)
+
+
+def count_clients_by_polygon(polygon_ids: List[int]) -> Tuple[Dict[int, int], int]:
+    """
+    Conta clientes por área com uma consulta agregada
+
+    Returns:
+        tuple: ({polygon_id: quantidade}, total de clientes distintos em alguma das áreas)
+    """
+    polygon_ids = list(polygon_ids)
+    counts = {pid: 0 for pid in polygon_ids}
+    if not polygon_ids:
+        return counts, 0
+
+    if len(polygon_ids) <= CHUNK_SIZE:
+        in_any_area = db.session.query(func.count(distinct(KNN.id_client))).filter(
+            KNN.polygon_id.in_(polygon_ids)
+        ).scalar() or 0
+    else:
+        in_any_area = len({cid for cid, _ in get_client_polygon_pairs(polygon_ids)})
+
+    for chunk in _chunks(polygon_ids):
+        rows = db.session.query(KNN.polygon_id, func.count(KNN.id)).filter(
+            KNN.polygon_id.in_(chunk)
+        ).group_by(KNN.polygon_id).all()
+        counts.update({pid: count for pid, count in rows})
+
+    return counts, in_any_area
+
+
+def get_client_polygon_pairs(polygon_ids: List[int]) -> List[Tuple[int, int]]:
+    """Retorna os pares (id_client, polygon_id) das áreas informadas"""
+    pairs = []
+    for chunk in _chunks(list(polygon_ids)):
+        pairs.extend(
+            db.session.query(KNN.id_client, KNN.polygon_id).filter(KNN.polygon_id.in_(chunk)).all()
+        )
+    return pairs
@@ -0,0 +1,217 @@
+"""
+Point Clusters - Agrupamento de marcadores por nível de zoom
+============================================================
+
+Pré-agrega os pontos de cliente (LatLong com user_point=False) de um usuário em
+clusters hierárquicos, um nível por zoom (estilo supercluster):
+
+- Zoom > MAX_CLUSTER_ZOOM: pontos individuais
+- Zoom z: os clusters do zoom z+1 são agrupados numa grade de CLUSTER_RADIUS_PX
+  pixels (Web Mercator); cada cluster guarda a contagem e o centróide ponderado
+
+A hierarquia é calculada uma vez por usuário (vetorizada em NumPy) e fica em
+cache enquanto a versão dos pontos (client_data_version, lida do banco a cada
+uso) não mudar. Cada consulta devolve apenas os
+clusters do zoom pedido dentro do bbox visível.
+
+Autor: SynapseLog
+"""
+
+import logging
+import numpy as np
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+
+from base.models import db, LatLong
+from ml.user_cache import UserCache
+
+logger = logging.getLogger(__name__)
+
+# Zoom a partir do qual os pontos são devolvidos individualmente
+MAX_CLUSTER_ZOOM = 16
+
+# Raio de agrupamento em pixels de tela
+CLUSTER_RADIUS_PX = 60
+
+# Tamanho do tile em pixels (Web Mercator)
+TILE_SIZE = 256
+
+MAX_MERCATOR_LAT = 85.05112878
+
+
+def _lng_to_x(lngs):
+    return np.asarray(lngs, dtype=float) / 360.0 + 0.5
+
+
+def _lat_to_y(lats):
+    sin = np.sin(np.radians(np.clip(np.asarray(lats, dtype=float), -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT)))
+    return 0.5 - 0.25 * np.log((1 + sin) / (1 - sin)) / np.pi
+
+
+def _x_to_lng(xs):
+    return (np.asarray(xs, dtype=float) - 0.5) * 360.0
+
+
+def _y_to_lat(ys):
+    return np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * np.asarray(ys, dtype=float)))))
+
+
+class PointClusterIndex:
+    """Hierarquia de clusters por zoom sobre os pontos de um usuário"""
+
+    def __init__(self, ids, hashes, lats, lngs,
+                 radius: int = CLUSTER_RADIUS_PX, max_zoom: int = MAX_CLUSTER_ZOOM):
+        """
+        Args:
+            ids, hashes, lats, lngs: Dados dos pontos (mesma ordem)
+            radius: Raio de agrupamento em pixels
+            max_zoom: Último zoom com agrupamento (acima dele, pontos individuais)
+        """
+        lats = np.asarray(lats, dtype=float)
+        lngs = np.asarray(lngs, dtype=float)
+        valid = np.isfinite(lats) & np.isfinite(lngs)
+
+        self.ids = np.asarray(ids)[valid]
+        self.hashes = [h for h, ok in zip(hashes, valid) if ok]
+        self.lats = lats[valid]
+        self.lngs = lngs[valid]
+        self.max_zoom = max_zoom
+
+        x = _lng_to_x(lngs[valid])
+        y = _lat_to_y(lats[valid])
+        count = np.ones(x.shape[0])
+        first = np.arange(x.shape[0])  # Um ponto representante de cada cluster
+
+        # Nível max_zoom + 1 = pontos individuais
+        self.levels = {max_zoom + 1: (x, y, count, first)}
+
+        for z in range(max_zoom, -1, -1):
+            if x.shape[0] == 0:
+                self.levels[z] = self.levels[z + 1]
+                continue
+
+            cell = radius / (TILE_SIZE * 2.0 ** z)
+            cols = int(np.ceil(1.0 / cell)) + 1
+            keys = np.floor(y / cell).astype(np.int64) * cols + np.floor(x / cell).astype(np.int64)
+            _, inverse = np.unique(keys, return_inverse=True)
+            inverse = inverse.ravel()
+
+            weight = np.bincount(inverse, weights=count)
+            new_x = np.bincount(inverse, weights=x * count) / weight
+            new_y = np.bincount(inverse, weights=y * count) / weight
+            new_first = np.empty(weight.shape[0], dtype=np.int64)
+            new_first[inverse[::-1]] = first[::-1]
+
+            x, y, count, first = new_x, new_y, weight, new_first
+            self.levels[z] = (x, y, count, first)
+
+    def __len__(self):
+        return int(self.ids.shape[0])
+
+    def get_clusters(self, bbox: Optional[Dict], zoom: int) -> List[Dict]:
+        """
+        Clusters do zoom informado dentro do bbox
+
+        Args:
+            bbox: {min_lat, max_lat, min_lon, max_lon} (None = mundo todo)
+            zoom: Zoom do mapa
+
+        Returns:
+            list: [{'latitude', 'longitude', 'count', 'id', 'hash_client'}, ...]
+                  ('id' e 'hash_client' apenas quando count == 1)
+        """
+        zoom = int(min(max(zoom, 0), self.max_zoom + 1))
+        x, y, _, _ = self.levels[zoom]
+
+        mask = np.ones(x.shape[0], dtype=bool)
+        if bbox is not None:
+            min_x, max_x = _lng_to_x([bbox['min_lon'], bbox['max_lon']])
+            # Em Mercator o y cresce para o sul
+            min_y, max_y = _lat_to_y([bbox['max_lat'], bbox['min_lat']])
+            mask = (x >= min_x) & (x <= max_x) & (y >= min_y) & (y <= max_y)
+
+        return self._to_dicts(zoom, np.flatnonzero(mask))
+
+    def get_clusters_in_tile(self, z: int, tx: int, ty: int) -> List[Dict]:
+        """
+        Clusters do zoom z dentro do tile XYZ (tx, ty)
+
+        O retângulo do tile é semiaberto ([x0, x1) x [y0, y1) em Mercator), então cada
+        cluster aparece em exatamente um tile.
+        """
+        zoom = int(min(max(z, 0), self.max_zoom + 1))
+        x, y, _, _ = self.levels[zoom]
+        n = 2.0 ** z
+        mask = (x >= tx / n) & (x < (tx + 1) / n) & (y >= ty / n) & (y < (ty + 1) / n)
+        return self._to_dicts(zoom, np.flatnonzero(mask))
+
+    def _to_dicts(self, zoom: int, selected: np.ndarray) -> List[Dict]:
+        x, y, count, first = self.levels[zoom]
+        lats = _y_to_lat(y[selected])
+        lngs = _x_to_lng(x[selected])
+
+        clusters = []
+        for k, i in enumerate(selected):
+            cluster = {
+                'latitude': float(lats[k]),
+                'longitude': float(lngs[k]),
+                'count': int(count[i])
+            }
+            if count[i] == 1:
+                # Ponto isolado: coordenadas originais (sem ida e volta pela projeção)
+                point = first[i]
+                cluster['latitude'] = float(self.lats[point])
+                cluster['longitude'] = float(self.lngs[point])
+                cluster['id'] = int(self.ids[point])
+                cluster['hash_client'] = self.hashes[point]
+            clusters.append(cluster)
+
+        return clusters
+
+
+# ============================================================================
+# CACHE POR USUÁRIO
+# ============================================================================
+
+_cluster_cache = UserCache()
+
+
+def load_point_clusters(user_id) -> PointClusterIndex:
+    """Constrói a hierarquia de clusters a partir dos pontos de cliente do usuário"""
+    rows = db.session.query(
+        LatLong.id, LatLong.hash_client, LatLong.latitude, LatLong.longitude
+    ).filter(
+        LatLong.id_user == user_id,
+        LatLong.user_point == False  # noqa: E712
+    ).all()
+
+    if rows:
+        ids, hashes, lats, lngs = zip(*rows)
+    else:
+        ids, hashes, lats, lngs = (), (), (), ()
+
+    index = PointClusterIndex(ids, list(hashes), lats, lngs)
+    logger.info(f"🔵 Clusters de pontos construídos: user={user_id} pontos={len(index)}")
+    return index
+
+
+def client_data_version(user_id) -> tuple:
+    """
+    Versão dos pontos de cliente do usuário: (quantidade, max(id)). A importação
+    só insere pontos novos, então qualquer importação muda a versão.
+    """
+    return tuple(db.session.query(func.count(LatLong.id), func.max(LatLong.id)).filter(
+        LatLong.id_user == user_id,
+        LatLong.user_point == False  # noqa: E712
+    ).one())
+
+
+def get_point_clusters(user_id) -> PointClusterIndex:
+    """Hierarquia de clusters do usuário, em cache até a versão dos pontos mudar"""
+    return _cluster_cache.get(user_id, lambda: load_point_clusters(user_id), client_data_version(user_id))
+
+
+def invalidate_point_clusters(user_id) -> None:
+    """Descarta os clusters do usuário (chamar após importar/alterar pontos de cliente)"""
+    _cluster_cache.invalidate(user_id)
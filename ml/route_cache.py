@@ -0,0 +1,152 @@
+"""
+Route Cache - Resultados de roteirização memorizados pela impressão digital da entrada
+=====================================================================================
+
+Processar de novo as mesmas áreas com os mesmos dias e capacidade devolve os
+grupos já calculados, sem refazer agrupamento, divisões e 2-opt.
+
+A chave (routing_fingerprint) é um hash de tudo que define a saída de
+create_routes_knn:
+
+- clientes filtrados: id, hash, coordenadas, área e ponto de saída atribuídos
+  e score (quando carregado, na prioridade por score)
+- áreas selecionadas com sua geometry_version
+- pontos de saída (id, coordenadas, raio)
+- dias, max_clients_per_day, agrupamento, respeitar_range, priorizar_score,
+  algoritmo e tempo_limite_s
+- calendário salvo de partida (id e updated_at), no replanejamento incremental
+- ALGORITHM_VERSION (ml/route_optimizer.py)
+
+Qualquer mudança nos dados gera outra chave; além disso, importar clientes ou
+alterar áreas/pontos de saída descarta as entradas do usuário
+(invalidate_route_cache), liberando memória. As entradas são limitadas por
+LRU (ROUTE_CACHE_SIZE) e os grupos guardados são tratados como somente leitura.
+
+Autor: SynapseLog
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from ml.client_batch import ClientBatch
+from ml.route_optimizer import ALGORITHM_VERSION
+
+logger = logging.getLogger(__name__)
+
+# Resultados mantidos em memória (todos os usuários)
+ROUTE_CACHE_SIZE = int(os.environ.get('ROUTE_CACHE_SIZE', 64))
+
+
+def routing_fingerprint(clients: Union[List[Dict], ClientBatch], polygons: List[Dict], params: Dict,
+                        depots: Optional[List[Dict]] = None) -> str:
+    """
+    Impressão digital da entrada da roteirização
+
+    Args:
+        clients: ClientBatch ou clientes no formato do route_optimizer (após filtro e
+                 atribuição de ponto de saída)
+        polygons: Áreas selecionadas ({'id', 'geometry_version'})
+        params: Parâmetros validados (ml/routing_service.validate_routing_params)
+        depots: Pontos de saída do usuário
+
+    Returns:
+        str: sha1 em hexadecimal
+    """
+    digest = hashlib.sha1()
+    digest.update(f"v{ALGORITHM_VERSION}|{params['dias']}|{params.get('max_clients_per_day')}|"
+                  f"{params.get('agrupamento')}|{bool(params.get('respeitar_range'))}|"
+                  f"{params.get('calendario_id')}|{params.get('calendario_version')}|"
+                  f"{bool(params.get('priorizar_score'))}|{params.get('algoritmo')}|"
+                  f"{params.get('tempo_limite_s')}".encode())
+
+    for p in sorted(polygons, key=lambda p: p['id']):
+        digest.update(f"|p{p['id']}:{p.get('geometry_version') or 0}".encode())
+
+    for d in sorted(depots or [], key=lambda d: d['id']):
+        digest.update(f"|d{d['id']}:{d['lat']:.6f}:{d['lng']:.6f}:{d.get('range_km')}".encode())
+
+    # Colunas numéricas dos clientes em bloco (rápido para dezenas de milhares de pontos)
+    batch = clients if isinstance(clients, ClientBatch) else ClientBatch.from_records(clients)
+    numeric = np.column_stack([
+        batch.ids, batch.lats, batch.lngs, batch.polygon_ids, batch.depot_ids, batch.scores
+    ]).astype(np.float64).reshape(-1, 6)
+    digest.update(str(numeric.shape).encode())
+    digest.update(np.round(numeric, 6).tobytes())
+    digest.update('\x1f'.join(str(h) for h in batch.hashes).encode())
+
+    return digest.hexdigest()
+
+
+class RouteResultCache:
+    """LRU de resultados (user_id, impressão digital) -> valor, com invalidação por usuário"""
+
+    def __init__(self, max_entries: int = ROUTE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._values: OrderedDict = OrderedDict()
+        self._generation: Dict = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id, key: str, builder: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Valor em cache ou construído com `builder`
+
+        Returns:
+            tuple: (valor, True se veio do cache)
+        """
+        with self._lock:
+            value = self._values.get((user_id, key))
+            if value is not None:
+                self._values.move_to_end((user_id, key))
+                return value, True
+            generation = self._generation.get(user_id, 0)
+
+        value = builder()
+
+        with self._lock:
+            # Só guarda se os dados do usuário não foram invalidados durante a construção
+            if value and self._generation.get(user_id, 0) == generation:
+                self._values[(user_id, key)] = value
+                self._values.move_to_end((user_id, key))
+                while len(self._values) > self.max_entries:
+                    self._values.popitem(last=False)
+
+        return value, False
+
+    def invalidate(self, user_id) -> None:
+        """Descarta os resultados do usuário"""
+        with self._lock:
+            for entry in [entry for entry in self._values if entry[0] == user_id]:
+                del self._values[entry]
+            self._generation[user_id] = self._generation.get(user_id, 0) + 1
+
+    def clear(self) -> None:
+        """Descarta os resultados de todos os usuários"""
+        with self._lock:
+            for user_id, _ in self._values:
+                self._generation[user_id] = self._generation.get(user_id, 0) + 1
+            self._values.clear()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+
+_route_cache = RouteResultCache()
+
+
+def get_cached_routes(user_id, key: str, builder: Callable[[], List[Dict]]) -> Tuple[List[Dict], bool]:
+    """Grupos da roteirização pelo cache padrão do processo: (grupos, veio do cache)"""
+    groups, hit = _route_cache.get(user_id, key, builder)
+    if hit:
+        logger.info(f"⚡ Roteirização em cache para user {user_id} ({key[:10]})")
+    return groups, hit
+
+
+def invalidate_route_cache(user_id) -> None:
+    """Descarta as roteirizações do usuário (chamar quando clientes, áreas ou pontos de saída mudarem)"""
+    _route_cache.invalidate(user_id)
@@ -0,0 +1,126 @@
+"""
+Route Metrics - Métricas de qualidade dos grupos da roteirização
+================================================================
+
+Para cada grupo/dia produzido por create_routes_knn (ou pelo replanejamento
+incremental) calcula, de forma vetorizada sobre todos os clientes do plano:
+
+- intra_cluster_km: percurso entre clientes consecutivos, na ordem de visita,
+  sem as pernas do ponto de saída
+- centroid_spread_km: distância média dos clientes ao centro do grupo
+- depot_distance_km: ponto de saída → centro do grupo (ml/distance_matrix.py)
+- time_moved: tempo estimado de direção, em minutos, para sum_distance_km a
+  AVERAGE_SPEED_KMH
+
+save_route_metrics grava uma linha por grupo em NDBOut (bind
+neuraldatabaserout) numa única inserção, para acompanhar a qualidade dos
+planos e regressões do otimizador sem recalcular.
+
+Autor: SynapseLog
+"""
+
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from base.models import db, NDBOut
+from ml.distance_matrix import haversine_pairs_km
+from ml.route_optimizer import ALGORITHM_VERSION
+
+logger = logging.getLogger(__name__)
+
+# Velocidade média de deslocamento usada no tempo estimado (km/h)
+AVERAGE_SPEED_KMH = float(os.environ.get('ROUTE_AVERAGE_SPEED_KMH', 30))
+
+
+def compute_route_metrics(groups: List[Dict]) -> List[Dict]:
+    """
+    Métricas de qualidade de cada grupo
+
+    Args:
+        groups: Grupos no formato de create_routes_knn ('clients' na ordem de visita, 'center')
+
+    Returns:
+        list: [{'rout_number', 'num_clients', 'depot_id', 'sum_distance_km', 'intra_cluster_km',
+                'centroid_spread_km', 'depot_distance_km', 'time_moved'}, ...] na ordem dos grupos
+    """
+    if not groups:
+        return []
+
+    sizes = np.array([len(g['clients']) for g in groups], dtype=np.int64)
+    total = int(sizes.sum())
+    lats = np.fromiter((c['lat'] for g in groups for c in g['clients']), dtype=np.float64, count=total)
+    lngs = np.fromiter((c['lng'] for g in groups for c in g['clients']), dtype=np.float64, count=total)
+    group_of = np.repeat(np.arange(len(groups)), sizes)
+
+    # Pernas entre clientes consecutivos do mesmo grupo
+    legs = haversine_pairs_km(lats[:-1], lngs[:-1], lats[1:], lngs[1:])
+    same_group = group_of[1:] == group_of[:-1]
+    intra = np.bincount(group_of[1:][same_group], weights=legs[same_group], minlength=len(groups))
+
+    # Distância de cada cliente ao centro do seu grupo
+    center_lats = np.array([g['center']['lat'] for g in groups], dtype=np.float64)
+    center_lngs = np.array([g['center']['lng'] for g in groups], dtype=np.float64)
+    spread = haversine_pairs_km(lats, lngs, center_lats[group_of], center_lngs[group_of])
+    spread = np.bincount(group_of, weights=spread, minlength=len(groups)) / np.maximum(sizes, 1)
+
+    metrics = []
+    for i, group in enumerate(groups):
+        sum_distance = group.get('sum_distance_km')
+        if sum_distance is None:
+            sum_distance = float(intra[i])
+        metrics.append({
+            'rout_number': group['group_number'],
+            'num_clients': int(sizes[i]),
+            'depot_id': (group.get('depot') or {}).get('id'),
+            'sum_distance_km': round(float(sum_distance), 3),
+            'intra_cluster_km': round(float(intra[i]), 3),
+            'centroid_spread_km': round(float(spread[i]), 3),
+            'depot_distance_km': group.get('depot_distance_km'),
+            'time_moved': round(float(sum_distance) / AVERAGE_SPEED_KMH * 60, 1)
+        })
+    return metrics
+
+
+def save_route_metrics(user_id, groups: List[Dict], plan_key: Optional[str] = None,
+                       scores: Optional[Sequence[float]] = None) -> int:
+    """
+    Grava as métricas dos grupos em NDBOut, em bloco
+
+    Args:
+        user_id: ID do usuário
+        groups: Grupos da roteirização
+        plan_key: Impressão digital da entrada (ml/route_cache.routing_fingerprint)
+        scores: Score RFM médio de cada grupo (na ordem dos grupos)
+
+    Returns:
+        int: Número de linhas gravadas
+    """
+    metrics = compute_route_metrics(groups)
+    if not metrics:
+        return 0
+
+    timestamp = datetime.utcnow()
+    rows = [{
+        'user_id': user_id,
+        'plan_key': plan_key,
+        'rout_number': m['rout_number'],
+        'model_version': f'v{ALGORITHM_VERSION}',
+        'score': scores[i] if scores is not None else None,
+        'num_cliets': m['num_clients'],
+        'depot_id': m['depot_id'],
+        'sum_distance_km': m['sum_distance_km'],
+        'intra_cluster_km': m['intra_cluster_km'],
+        'centroid_spread_km': m['centroid_spread_km'],
+        'depot_distance_km': m['depot_distance_km'],
+        'time_moved': m['time_moved'],
+        'timestamp': timestamp
+    } for i, m in enumerate(metrics)]
+
+    db.session.bulk_insert_mappings(NDBOut, rows)
+    db.session.commit()
+    logger.info(f"📈 Métricas de roteirização gravadas: user={user_id} grupos={len(rows)}")
+    return len(rows)
@@ -11,21 +11,60 @@ Data: 2025-11-12
 """
 
 import pandas as pd
-from sklearn.cluster import KMeans
 from sklearn.exceptions import ConvergenceWarning
 import numpy as np
 import math
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Union
 import logging
+import os
 import warnings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from threadpoolctl import threadpool_limits
+
+from ml.client_batch import ClientBatch, MISSING_ID
+from ml.clustering import (
+    make_kmeans, choose_backend, BACKEND_KMEANS, BACKEND_MINIBATCH,
+    ALGORITHM_AUTO, ALGORITHM_BALANCED, ALGORITHMS, ClusteringAlgorithm, get_algorithm, collapse_duplicates
+)
+from ml.distance_matrix import annotate_route_distances
+from ml.sequencing import sequence_group, TWO_OPT_TIME_BUDGET_S
 
 logger = logging.getLogger(__name__)
 
+# Modos de agrupamento aceitos por create_routes_knn
+CLUSTERING_KMEANS = 'kmeans'      # KMeans + divisão recursiva dos grupos grandes
+CLUSTERING_BALANCED = ALGORITHM_BALANCED  # KMeans com capacidade: grupos do mesmo tamanho, em uma passada
+CLUSTERING_MODES = (CLUSTERING_KMEANS, CLUSTERING_BALANCED)
+
+# Processos do pool que divide os clusters acima do limite (0 ou 1 = sequencial)
+SPLIT_WORKERS = int(os.environ.get('ROUTE_SPLIT_WORKERS', 0))
+
+# Abaixo disso (pontos a dividir num nível da recursão) o pool não compensa
+SPLIT_PARALLEL_MIN_POINTS = 2000
+
+# Pontos de saída planejados ao mesmo tempo (threads; o KMeans do scikit-learn
+# roda fora do GIL). 0 ou 1 = um ponto de saída por vez. Em paralelo, os núcleos
+# são repartidos: cada thread usa no máximo cpu_count // workers threads de
+# OpenMP/BLAS, em vez de cada KMeans tentar usar a máquina inteira
+DEPOT_WORKERS = int(os.environ.get('ROUTE_DEPOT_WORKERS', 4))
+
+# Versão da saída de create_routes_knn; incrementar quando o algoritmo mudar
+# (faz parte da chave das roteirizações em cache, ml/route_cache.py)
+ALGORITHM_VERSION = 4
+
 
 def create_routes_knn(
-    clients_data: List[Dict], 
+    clients_data: Union[List[Dict], ClientBatch], 
     n_days: int = 5, 
-    max_clients_per_day: Optional[int] = None
+    max_clients_per_day: Optional[int] = None,
+    depots: Optional[List[Dict]] = None,
+    clustering: str = ALGORITHM_AUTO,
+    sequence: bool = True,
+    sequencing_time_budget: float = TWO_OPT_TIME_BUDGET_S,
+    split_workers: Optional[int] = None,
+    priority: bool = False,
+    depot_workers: Optional[int] = None,
+    time_budget: Optional[float] = None
 ) -> List[Dict]:
     """
     Cria rotas usando KNN com filtro de tamanho por dia.
@@ -34,22 +73,162 @@ def create_routes_knn(
     1. Clustering inicial com n_days clusters
     2. Filtro: se cluster > max_clients_per_day, divide em sub-clusters
     
+    O agrupamento da fase 1 vem do registro de ml/clustering.py (kmeans,
+    minibatch, grid, balanced ou 'auto', escolhido pelo número de clientes e
+    por time_budget). Com clustering='balanced' as duas fases são substituídas por um KMeans com
+    capacidade (ml.clustering.balanced_kmeans): max(n_days, ceil(N / max_clients_per_day))
+    grupos com no máximo ceil(N / grupos) clientes cada, sem divisões.
+    
+    Com pontos de saída (depots), os clientes são separados pelo 'depot_id'
+    atribuído (ml/depots.py) e cada ponto de saída recebe sua parte dos dias,
+    proporcional ao número de clientes (ao menos 1 cada, soma n_days); o fluxo
+    acima roda por ponto de saída, em paralelo (depot_workers), e os
+    calendários são unidos na ordem dos pontos.
+    
+    Internamente os clientes ficam num ClientBatch (ml/client_batch.py) e o
+    agrupamento e a divisão trabalham com arrays de índices; os dicts dos
+    clientes só são montados nos grupos finais.
+    
+    Com priority=True os dias são numerados pelo score RFM médio do grupo
+    (batch.scores), do maior para o menor: grupos com mais clientes VIP e de
+    alto valor caem nos primeiros dias. O score não muda a composição dos
+    grupos (a ordem é por grupo, não por cliente). Para descartar os de menor
+    score quando a capacidade não comporta todos, use select_by_priority antes.
+    
     Args:
-        clients_data: Lista de dicionários com dados dos clientes
+        clients_data: ClientBatch ou lista de dicionários com dados dos clientes
                      Formato esperado: [{'hash_client': str, 'name': str, 'lat': float, 'lng': float}, ...]
         n_days: Número de dias/grupos desejados
         max_clients_per_day: Máximo de clientes por dia (None = sem limite)
+        depots: Pontos de saída [{'id', 'name', 'lat', 'lng'}, ...] (None = origem única)
+        clustering: Nome de um algoritmo do registro (ml/clustering.ALGORITHMS) ou
+                    ALGORITHM_AUTO (padrão)
+        sequence: Ordena os clientes de cada dia (vizinho mais próximo + 2-opt, ml/sequencing.py)
+        sequencing_time_budget: Tempo máximo do 2-opt por grupo, em segundos
+        split_workers: Processos para dividir os clusters grandes (None = SPLIT_WORKERS;
+                       0 ou 1 = sequencial). O resultado é o mesmo em qualquer caso
+        priority: Ordena os dias por score médio decrescente
+        depot_workers: Pontos de saída planejados em paralelo (None = DEPOT_WORKERS;
+                       0 ou 1 = sequencial). O resultado é o mesmo em qualquer caso
+        time_budget: Tempo limite do agrupamento para ALGORITHM_AUTO, em segundos
+                     (None = CLUSTERING_TIME_BUDGET_S)
     
     Returns:
         Lista de dicionários representando os grupos/rotas
         Formato: [{'group_number': int, 'day': int, 'clients': List[Dict], 
                    'total_clients': int, 'center': Dict, 'is_split': bool}, ...]
+        Com depots, cada grupo traz também 'depot' (ponto de saída da rota ou None)
+        e 'depot_distance_km' (ponto de saída → centro do grupo)
+        Todo grupo traz 'clustering_backend' ('kmeans' ou 'minibatch', ml/clustering.py),
+        'algorithm' (algoritmo usado na fase 1)
+        e 'sum_distance_km' (ml/distance_matrix.py); com sequence=True,
+        'clients' vem na ordem de visita e 'stops' traz as paradas numeradas
+    
+    Raises:
+        ValueError: Modo de agrupamento inválido, ou menos dias que pontos de
+                    saída com clientes
     """
-    if not clients_data:
+    if clustering != ALGORITHM_AUTO and clustering not in ALGORITHMS:
+        raise ValueError(f"Modo de agrupamento inválido: {clustering}")
+    
+    batch = clients_data if isinstance(clients_data, ClientBatch) else ClientBatch.from_records(clients_data)
+    if len(batch) == 0:
         logger.warning("create_routes_knn: Lista de clientes vazia")
         return []
     
-    total_clients = len(clients_data)
+    indices = np.arange(len(batch))
+    if depots:
+        groups = _create_routes_by_depot(
+            batch, indices, n_days, max_clients_per_day, depots, clustering, split_workers, depot_workers, time_budget
+        )
+    else:
+        groups = _create_routes_single_origin(
+            batch, indices, n_days, max_clients_per_day, clustering, split_workers, time_budget
+        )
+    
+    if priority:
+        groups = _order_groups_by_score(batch, groups)
+    
+    for group in groups:
+        # Os dicts dos clientes são montados só aqui, a partir dos índices do grupo
+        positions = group.pop('indices')
+        group['clients'] = batch.to_records(positions)
+        group['center'] = batch.center(positions)
+        
+        # Ordem de visita e distâncias (ponto de saída → cliente e total da rota)
+        if sequence:
+            sequence_group(group, sequencing_time_budget)
+        annotate_route_distances(group)
+    
+    return groups
+
+
+def select_by_priority(
+    batch: ClientBatch,
+    n_days: int,
+    max_clients_per_day: Optional[int]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Corta os clientes que não cabem em n_days × max_clients_per_day, começando
+    pelos de menor score (clientes sem score saem antes de todos). O corte é
+    por cliente; a divisão em dias que vem depois é só geográfica.
+    
+    Returns:
+        tuple: (posições mantidas, posições adiadas), ambas em ordem crescente
+    """
+    positions = np.arange(len(batch))
+    if max_clients_per_day is None or len(batch) <= n_days * max_clients_per_day:
+        return positions, np.empty(0, dtype=np.int64)
+    
+    capacity = n_days * max_clients_per_day
+    scores = np.where(np.isnan(batch.scores), -np.inf, batch.scores)
+    # Estável: entre scores iguais, fica quem vem antes no lote
+    order = np.argsort(-scores, kind='stable')
+    logger.info(f"⭐ Prioridade por score: {len(batch) - capacity} clientes adiados (capacidade {capacity})")
+    return np.sort(order[:capacity]), np.sort(order[capacity:])
+
+
+def _order_groups_by_score(batch: ClientBatch, groups: List[Dict]) -> List[Dict]:
+    """
+    Renumera os dias pelo score médio do grupo, do maior para o menor; clientes
+    sem score não entram na média e grupos sem nenhum score vão para o final
+
+    A ordem é por grupo, não por cliente: os grupos continuam sendo os da
+    divisão geográfica, e um cliente VIP num grupo de média baixa fica no dia
+    do seu grupo. Mover clientes entre dias pelo score desfaria a proximidade
+    das rotas; a prioridade individual fica no corte de select_by_priority.
+    """
+    def mean_score(group):
+        scores = batch.scores[group['indices']]
+        scores = scores[~np.isnan(scores)]
+        return float(scores.mean()) if scores.size else -np.inf
+    
+    # sorted é estável: empates mantêm a ordem do agrupamento
+    ordered = sorted(groups, key=mean_score, reverse=True)
+    for number, group in enumerate(ordered, 1):
+        group['group_number'] = number
+        group['day'] = number
+    return ordered
+
+
+def _create_routes_single_origin(
+    batch: ClientBatch,
+    indices: np.ndarray,
+    n_days: int,
+    max_clients_per_day: Optional[int],
+    clustering: str = ALGORITHM_AUTO,
+    split_workers: Optional[int] = None,
+    time_budget: Optional[float] = None
+) -> List[Dict]:
+    """
+    Fluxo de 2 fases (agrupamento + filtro de tamanho) para os clientes `indices` do lote.
+    Os grupos trazem 'indices' (posições no lote) no lugar de 'clients'.
+    """
+    total_clients = len(indices)
+    algorithm = get_algorithm(clustering, total_clients, min(n_days, total_clients), time_budget)
+    if algorithm.capacitated:
+        return _create_routes_balanced(batch, indices, n_days, max_clients_per_day, algorithm)
+    
     logger.info(f"🎯 Iniciando roteirização: {total_clients} clientes, {n_days} dias, limite: {max_clients_per_day}")
     
     # Se não definiu limite, usa todos os clientes divididos pelos dias
@@ -57,22 +236,22 @@ def create_routes_knn(
         max_clients_per_day = math.ceil(total_clients / n_days)
         logger.info(f"📊 Sem limite definido, usando {max_clients_per_day} clientes/dia")
     
-    # Preparar coordenadas para clustering
-    coordinates = np.array([[c['lat'], c['lng']] for c in clients_data])
+    # Coordenadas para clustering, direto das colunas do lote
+    coordinates = batch.coordinates[indices]
     
     # Fase 1: Clustering inicial com n_days clusters
     n_clusters = min(n_days, total_clients)
-    logger.info(f"🔵 Fase 1: Criando {n_clusters} clusters iniciais")
+    logger.info(f"🔵 Fase 1: Criando {n_clusters} clusters iniciais ({algorithm.name}, {algorithm.complexity})")
     
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-    cluster_labels = kmeans.fit_predict(coordinates)
+    # Algoritmo do registro (ml/clustering.py); 'auto' escolhe KMeans ou MiniBatchKMeans pelo tamanho
+    cluster_labels = _fit_weighted(algorithm, coordinates, n_clusters)
+    backend = algorithm.backend
     
-    # Organizar clientes por cluster inicial
-    initial_clusters = {}
-    for idx, label in enumerate(cluster_labels):
-        if label not in initial_clusters:
-            initial_clusters[label] = []
-        initial_clusters[label].append(clients_data[idx])
+    # Organizar clientes por cluster inicial (na ordem em que cada rótulo aparece)
+    initial_clusters = {
+        int(label): indices[cluster_labels == label]
+        for label in _labels_in_order(cluster_labels)
+    }
     
     logger.info(f"✅ Fase 1 concluída: {len(initial_clusters)} clusters criados")
     for cluster_id, clients in initial_clusters.items():
@@ -85,6 +264,12 @@ def create_routes_knn(
     group_number = 1
     split_count = 0
     
+    # Os clusters acima do limite são divididos de uma vez (em paralelo com split_workers > 1)
+    oversized = [cluster_id for cluster_id, clients in initial_clusters.items() if len(clients) > max_clients_per_day]
+    splits = dict(zip(oversized, _split_index_sets(
+        batch.coordinates, [initial_clusters[cluster_id] for cluster_id in oversized], max_clients_per_day, split_workers
+    )))
+    
     for cluster_id, cluster_clients in initial_clusters.items():
         if len(cluster_clients) <= max_clients_per_day:
             # Cluster OK - adiciona direto
@@ -92,17 +277,18 @@ def create_routes_knn(
             final_groups.append({
                 'group_number': group_number,
                 'day': group_number,
-                'clients': cluster_clients,
+                'indices': cluster_clients,
                 'total_clients': len(cluster_clients),
-                'center': _calculate_center(cluster_clients),
                 'is_split': False,
-                'original_cluster': cluster_id
+                'original_cluster': cluster_id,
+                'clustering_backend': backend,
+                'algorithm': algorithm.name
             })
             group_number += 1
         else:
             # Cluster excede limite - aplicar filtro de divisão
             logger.info(f"   ⚠️ Cluster {cluster_id}: {len(cluster_clients)} clientes (EXCEDE limite)")
-            sub_clusters = _apply_size_filter(cluster_clients, max_clients_per_day)
+            sub_clusters = splits[cluster_id]
             logger.info(f"      → Dividido em {len(sub_clusters)} sub-clusters")
             split_count += 1
             
@@ -110,12 +296,13 @@ def create_routes_knn(
                 final_groups.append({
                     'group_number': group_number,
                     'day': group_number,
-                    'clients': sub_cluster,
+                    'indices': sub_cluster,
                     'total_clients': len(sub_cluster),
-                    'center': _calculate_center(sub_cluster),
                     'is_split': True,
                     'original_cluster': cluster_id,
-                    'sub_cluster_index': idx
+                    'sub_cluster_index': idx,
+                    'clustering_backend': backend,
+                    'algorithm': algorithm.name
                 })
                 logger.info(f"         Sub-cluster {idx + 1}: {len(sub_cluster)} clientes")
                 group_number += 1
@@ -125,6 +312,152 @@ def create_routes_knn(
     return final_groups
 
 
+def _split_days_by_depot(client_counts: Dict, n_days: int) -> Dict:
+    """
+    Distribui os dias entre os pontos de saída proporcionalmente aos clientes
+    (maiores restos), com exatamente n_days no total. Todo ponto de saída com
+    clientes recebe ao menos 1 dia; cada dia restante vai para o ponto cuja
+    cota (n_days x clientes / total) mais excede os dias que já tem.
+    
+    Args:
+        client_counts: {depot_id: número de clientes}
+        n_days: Total de dias
+    
+    Returns:
+        Dicionário {depot_id: dias}, com soma n_days
+    
+    Raises:
+        ValueError: Menos dias que pontos de saída com clientes
+    """
+    if n_days < len(client_counts):
+        raise ValueError(
+            f"{n_days} dias não bastam para {len(client_counts)} pontos de saída com clientes "
+            f"(cada ponto precisa de ao menos 1 dia)"
+        )
+    
+    total = sum(client_counts.values())
+    quotas = {key: n_days * count / total for key, count in client_counts.items()}
+    days = {key: 1 for key in client_counts}
+    
+    # max é estável: em empate, o ponto de saída que aparece primeiro
+    for _ in range(n_days - len(days)):
+        key = max(days, key=lambda key: quotas[key] - days[key])
+        days[key] += 1
+    
+    return days
+
+
+def _create_routes_by_depot(
+    batch: ClientBatch,
+    indices: np.ndarray,
+    n_days: int,
+    max_clients_per_day: Optional[int],
+    depots: List[Dict],
+    clustering: str = ALGORITHM_AUTO,
+    split_workers: Optional[int] = None,
+    depot_workers: Optional[int] = None,
+    time_budget: Optional[float] = None
+) -> List[Dict]:
+    """
+    Roteirização por ponto de saída: agrupa os clientes pelo 'depot_id', planeja
+    os dias de cada ponto de saída de forma independente (em paralelo com
+    depot_workers > 1) e une os calendários numerando os dias em sequência.
+    """
+    workers = DEPOT_WORKERS if depot_workers is None else depot_workers
+    depots_by_id = {d['id']: d for d in depots}
+    
+    depot_ids = batch.depot_ids[indices]
+    clients_by_depot = {
+        (None if depot_id == MISSING_ID else int(depot_id)): indices[depot_ids == depot_id]
+        for depot_id in _labels_in_order(depot_ids)
+    }
+    
+    days_by_depot = _split_days_by_depot(
+        {key: len(clients) for key, clients in clients_by_depot.items()}, n_days
+    )
+    logger.info(f"🏭 Roteirização por ponto de saída: {len(clients_by_depot)} pontos, dias={days_by_depot}")
+    
+    def plan_depot(depot_id):
+        return _create_routes_single_origin(
+            batch, clients_by_depot[depot_id], days_by_depot[depot_id], max_clients_per_day,
+            clustering, split_workers, time_budget
+        )
+    
+    depot_keys = list(clients_by_depot)
+    if workers > 1 and len(depot_keys) > 1:
+        workers = min(workers, len(depot_keys))
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        
+        def plan_depot_limited(depot_id):
+            # O limite do OpenMP vale por thread: precisa ser aplicado dentro de cada uma
+            with threadpool_limits(limits=threads, user_api='openmp'):
+                return plan_depot(depot_id)
+        
+        # Monta o array de coordenadas (preguiçoso) antes de repartir o lote entre as threads
+        batch.coordinates
+        # O do BLAS é global ao processo: aplicado uma vez, em volta do pool
+        with threadpool_limits(limits=threads, user_api='blas'):
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                planned = list(pool.map(plan_depot_limited, depot_keys))
+    else:
+        planned = [plan_depot(depot_id) for depot_id in depot_keys]
+    
+    # União dos calendários, na ordem em que os pontos de saída aparecem
+    final_groups = []
+    for depot_id, groups in zip(depot_keys, planned):
+        depot = depots_by_id.get(depot_id)
+        for group in groups:
+            group['group_number'] = len(final_groups) + 1
+            group['day'] = group['group_number']
+            group['depot'] = (
+                {'id': depot['id'], 'name': depot.get('name'), 'lat': depot['lat'], 'lng': depot['lng']}
+                if depot else None
+            )
+            final_groups.append(group)
+    
+    return final_groups
+
+
+def _create_routes_balanced(
+    batch: ClientBatch,
+    indices: np.ndarray,
+    n_days: int,
+    max_clients_per_day: Optional[int],
+    algorithm: Optional[ClusteringAlgorithm] = None
+) -> List[Dict]:
+    """
+    Grupos de tamanho equilibrado, já limitados a max_clients_per_day, em uma passada
+    (algorithm: entrada capacitated do registro; padrão 'balanced')
+    """
+    algorithm = algorithm or ALGORITHMS[ALGORITHM_BALANCED]
+    total_clients = len(indices)
+    n_clusters = min(n_days, total_clients)
+    if max_clients_per_day is not None:
+        n_clusters = max(n_clusters, math.ceil(total_clients / max_clients_per_day))
+    
+    # Capacidade ceil(N / grupos), a mesma que o algoritmo capacitado deriva de n_clusters
+    logger.info(f"⚖️ Agrupamento balanceado: {total_clients} clientes, {n_clusters} grupos "
+                f"de até {math.ceil(total_clients / n_clusters)}")
+    
+    labels = algorithm.fit(batch.coordinates[indices], n_clusters)
+    
+    final_groups = []
+    for cluster_id in np.unique(labels):
+        cluster_clients = indices[labels == cluster_id]
+        final_groups.append({
+            'group_number': len(final_groups) + 1,
+            'day': len(final_groups) + 1,
+            'indices': cluster_clients,
+            'total_clients': len(cluster_clients),
+            'is_split': False,
+            'original_cluster': int(cluster_id),
+            'clustering_backend': choose_backend(total_clients),
+            'algorithm': algorithm.name
+        })
+    
+    return final_groups
+
+
 def _apply_size_filter(clients: List[Dict], max_size: int, depth: int = 0) -> List[List[Dict]]:
     """
     Filtro: divide cluster grande em sub-clusters respeitando max_size.
@@ -138,61 +471,160 @@ def _apply_size_filter(clients: List[Dict], max_size: int, depth: int = 0) -> Li
     Returns:
         Lista de sub-clusters
     """
-    # ⚠️ PROTEÇÃO: Limite de recursão para evitar stack overflow
+    coordinates = np.array([[c['lat'], c['lng']] for c in clients]).reshape(-1, 2)
+    leaves = _split_index_sets(coordinates, [np.arange(len(clients))], max_size, workers=1, depth=depth)[0]
+    return [[clients[i] for i in leaf] for leaf in leaves]
+
+
+def _split_index_sets(
+    coordinates: np.ndarray,
+    index_sets: List[np.ndarray],
+    max_size: int,
+    workers: Optional[int] = None,
+    depth: int = 0
+) -> List[List[np.ndarray]]:
+    """
+    Aplica o filtro de tamanho a vários clusters, em paralelo quando workers > 1.
+    
+    As divisões são independentes: a cada nível da recursão, todos os
+    (sub-)clusters acima de max_size são divididos de uma vez, num pool de
+    processos. Cada divisão usa a mesma semente do modo sequencial e as folhas
+    são lidas em profundidade, na ordem dos rótulos, então o resultado (e a
+    numeração dos grupos) é idêntico ao sequencial.
+    
+    Args:
+        coordinates: Array (N, 2) de [lat, lng] de todos os clientes
+        index_sets: Posições (em `coordinates`) de cada cluster a dividir
+        max_size: Tamanho máximo permitido
+        workers: Processos do pool (None = SPLIT_WORKERS; 0 ou 1 = sequencial)
+        depth: Profundidade inicial da recursão
+    
+    Returns:
+        Para cada cluster, as posições de cada sub-cluster
+    """
+    workers = SPLIT_WORKERS if workers is None else workers
+    
+    roots = [{'indices': np.asarray(index_set, dtype=np.int64), 'depth': depth, 'children': None}
+             for index_set in index_sets]
+    pending = [node for node in roots if len(node['indices']) > max_size]
+    
+    pool = None
+    try:
+        while pending:
+            tasks = [coordinates[node['indices']] for node in pending]
+            depths = [node['depth'] for node in pending]
+            
+            if workers > 1 and len(tasks) > 1 and sum(len(t) for t in tasks) >= SPLIT_PARALLEL_MIN_POINTS:
+                if pool is None:
+                    pool = ProcessPoolExecutor(max_workers=workers)
+                    logger.info(f"⚙️ Filtro de tamanho em paralelo: {workers} processos")
+                results = list(pool.map(_split_once, tasks, [max_size] * len(tasks), depths))
+            else:
+                results = [_split_once(t, max_size, d) for t, d in zip(tasks, depths)]
+            
+            next_pending = []
+            for node, parts in zip(pending, results):
+                node['children'] = [
+                    {'indices': node['indices'][part], 'depth': node['depth'] + 1, 'children': None}
+                    for part in parts
+                ]
+                next_pending.extend(child for child in node['children'] if len(child['indices']) > max_size)
+            pending = next_pending
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    
+    return [_leaf_indices(root) for root in roots]
+
+
+def _labels_in_order(labels: np.ndarray) -> np.ndarray:
+    """Valores distintos de `labels` na ordem em que aparecem pela primeira vez"""
+    found, first_index = np.unique(labels, return_index=True)
+    return found[np.argsort(first_index)]
+
+
+def _leaf_indices(node: Dict) -> List[np.ndarray]:
+    """Índices das folhas da árvore de divisões, em profundidade"""
+    if node['children'] is None:
+        return [node['indices']]
+    leaves = []
+    for child in node['children']:
+        leaves.extend(_leaf_indices(child))
+    return leaves
+
+
+def _fit_weighted(algorithm: ClusteringAlgorithm, coordinates: np.ndarray, n_clusters: int) -> np.ndarray:
+    """
+    Rótulos de algorithm.fit com os clientes repetidos unidos em pontos com peso
+    (collapse_duplicates); sem repetição, roda direto sobre as coordenadas
+    """
+    points, weights, inverse = collapse_duplicates(coordinates)
+    if len(points) == len(coordinates):
+        return algorithm.fit(coordinates, n_clusters)
+    
+    logger.info(f"   📍 {len(coordinates)} clientes em {len(points)} pontos distintos (pesos por ponto)")
+    return algorithm.fit(points, min(n_clusters, len(points)), sample_weight=weights)[inverse]
+
+
+def _split_once(coordinates: np.ndarray, max_size: int, depth: int = 0) -> List[np.ndarray]:
+    """
+    Uma divisão do filtro de tamanho (executada no pool de processos).
+    
+    Returns:
+        Índices (em `coordinates`) de cada sub-cluster; os que ainda excedem
+        max_size são divididos de novo pelo chamador
+    """
+    n_points = len(coordinates)
+    
+    def chunks():
+        return [np.arange(i, min(i + max_size, n_points)) for i in range(0, n_points, max_size)]
+    
+    # ⚠️ PROTEÇÃO: Limite de recursão para evitar loop infinito
     if depth > 10:
-        logger.warning(f"⚠️ Limite de recursão atingido! Dividindo {len(clients)} clientes em chunks de {max_size}")
-        return [clients[i:i + max_size] for i in range(0, len(clients), max_size)]
+        logger.warning(f"⚠️ Limite de recursão atingido! Dividindo {n_points} clientes em chunks de {max_size}")
+        return chunks()
     
-    if len(clients) <= max_size:
-        return [clients]
+    if n_points <= max_size:
+        return [np.arange(n_points)]
     
     # Calcular quantos sub-clusters são necessários
-    n_subclusters = math.ceil(len(clients) / max_size)
-    logger.debug(f"      _apply_size_filter (depth={depth}): {len(clients)} clientes → {n_subclusters} sub-clusters")
+    n_subclusters = math.ceil(n_points / max_size)
+    logger.debug(f"      _split_once (depth={depth}): {n_points} clientes → {n_subclusters} sub-clusters")
     
-    # ⚠️ PROTEÇÃO: Verificar se há coordenadas únicas suficientes
-    coordinates = np.array([[c['lat'], c['lng']] for c in clients])
-    unique_coords = np.unique(coordinates, axis=0)
+    # Clientes repetidos viram um ponto com peso: o KMeans vê os pontos distintos
+    # e o tamanho de cada sub-cluster é a soma exata dos pesos
+    points, weights, inverse = collapse_duplicates(coordinates)
     
-    if len(unique_coords) < n_subclusters:
-        logger.warning(f"⚠️ Apenas {len(unique_coords)} coordenadas únicas para {n_subclusters} clusters!")
-        logger.warning(f"   Usando divisão simples por chunks para evitar convergência")
-        return [clients[i:i + max_size] for i in range(0, len(clients), max_size)]
+    # ⚠️ PROTEÇÃO: todos no mesmo ponto, qualquer divisão é igualmente boa
+    if len(points) == 1:
+        logger.warning(f"⚠️ {n_points} clientes na mesma coordenada, dividindo em chunks de {max_size}")
+        return chunks()
+    
+    # Com menos pontos distintos que sub-clusters, cada ponto vira um sub-cluster e
+    # os que ainda passam do limite são divididos no próximo nível
+    n_subclusters = min(n_subclusters, len(points))
     
     # Aplicar KNN para dividir mantendo proximidade (suprimindo warnings)
     with warnings.catch_warnings():
         warnings.filterwarnings('ignore', category=ConvergenceWarning)
-        kmeans = KMeans(n_clusters=n_subclusters, random_state=42, n_init=10)
-        labels = kmeans.fit_predict(coordinates)
+        kmeans, _ = make_kmeans(n_subclusters, len(points))
+        if len(points) == n_points:
+            labels = kmeans.fit_predict(coordinates)
+        else:
+            labels = kmeans.fit_predict(points, sample_weight=weights)[inverse]
     
     # ⚠️ PROTEÇÃO: Verificar se KMeans realmente dividiu
-    n_clusters_found = len(np.unique(labels))
-    if n_clusters_found < n_subclusters:
-        logger.warning(f"⚠️ KMeans retornou apenas {n_clusters_found} clusters (esperava {n_subclusters})")
+    found_labels, first_index = np.unique(labels, return_index=True)
+    if len(found_labels) < n_subclusters:
+        logger.warning(f"⚠️ KMeans retornou apenas {len(found_labels)} clusters (esperava {n_subclusters})")
         logger.warning(f"   Usando divisão simples por chunks")
-        return [clients[i:i + max_size] for i in range(0, len(clients), max_size)]
-    
-    # Organizar em sub-clusters
-    subclusters = {}
-    for idx, label in enumerate(labels):
-        if label not in subclusters:
-            subclusters[label] = []
-        subclusters[label].append(clients[idx])
-    
-    # Garantir que nenhum sub-cluster excede max_size
-    final_subclusters = []
-    for subcluster in subclusters.values():
-        if len(subcluster) <= max_size:
-            final_subclusters.append(subcluster)
-        else:
-            # Recursão se ainda estiver grande (incrementando depth)
-            logger.debug(f"         Recursão necessária: sub-cluster com {len(subcluster)} clientes")
-            final_subclusters.extend(_apply_size_filter(subcluster, max_size, depth + 1))
+        return chunks()
     
-    return final_subclusters
+    # Sub-clusters na ordem em que cada rótulo aparece pela primeira vez
+    return [np.flatnonzero(labels == label) for label in found_labels[np.argsort(first_index)]]
 
 
-def _calculate_center(clients: List[Dict]) -> Dict[str, float]:
+def calculate_center(clients: List[Dict]) -> Dict[str, float]:
     """
     Calcula o centro geográfico (centroide) de um grupo de clientes.
     
@@ -264,6 +696,12 @@ def format_result_for_api(groups: List[Dict], scores_map: Dict = None, polygons_
         'total_groups': len(groups),
         'total_clients': sum(g['total_clients'] for g in groups),
         'split_groups': sum(1 for g in groups if g['is_split']),
+        'sum_distance_km': round(sum(g.get('sum_distance_km') or 0 for g in groups), 3),
+        # MiniBatchKMeans se algum grupo de clientes passou do limite de ml/clustering.py
+        'clustering_backend': (
+            BACKEND_MINIBATCH if any(g.get('clustering_backend') == BACKEND_MINIBATCH for g in groups)
+            else BACKEND_KMEANS
+        ),
         'groups': []
     }
     
@@ -305,7 +743,11 @@ def format_result_for_api(groups: List[Dict], scores_map: Dict = None, polygons_
             'center': group['center'],
             'clients': group['clients'],
             'original_polygon_id': original_polygon_id,
-            'original_polygon_name': original_polygon_name
+            'original_polygon_name': original_polygon_name,
+            'depot': group.get('depot'),
+            'depot_distance_km': group.get('depot_distance_km'),
+            'stops': group.get('stops', []),
+            'sum_distance_km': group.get('sum_distance_km')
         })
     
     return result
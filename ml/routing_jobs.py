@@ -0,0 +1,264 @@
+"""
+Routing Jobs - Roteirização em segundo plano
+============================================
+
+Roteirizações grandes passam do tempo limite dos workers HTTP. Com
+async=true, /autenticado/roteirizacao/processar só valida os parâmetros,
+grava um RoutingJob (banco routs) e devolve o id; o pipeline
+(ml/routing_service.plan_routes) roda num pool de threads do processo.
+
+- Estado, progresso, erro e resultado ficam na tabela routing_jobs_data, então
+  qualquer worker do servidor responde às consultas da interface
+- Cancelamento cooperativo: o job é marcado como cancelado no banco e a
+  execução é interrompida na próxima etapa do pipeline (checagem a cada
+  chamada de progresso); um resultado que chegue depois é descartado
+- Cada etapa grava heartbeat_at. Um job na fila ou em execução sem sinal há
+  mais de JOB_STALE_MINUTES (processo reiniciado, deploy) é marcado como
+  falho na próxima submissão ou consulta, para a interface não esperar para
+  sempre
+- Jobs com mais de JOB_RETENTION_HOURS são apagados a cada nova submissão
+
+O pool é de cada processo: com N workers do gunicorn podem rodar até
+N x ROUTING_JOB_WORKERS roteirizações ao mesmo tempo no servidor. Dimensione
+os dois juntos.
+
+Autor: SynapseLog
+"""
+
+import json
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from flask import current_app
+
+from base.models import RoutingJob, db
+from ml.routing_service import RoutingError, plan_routes
+
+logger = logging.getLogger(__name__)
+
+# Roteirizações simultâneas por processo (não é um limite global: multiplica
+# pelo número de workers do servidor)
+ROUTING_JOB_WORKERS = int(os.environ.get('ROUTING_JOB_WORKERS', 2))
+
+# Tempo que jobs (e resultados) ficam guardados
+JOB_RETENTION_HOURS = int(os.environ.get('ROUTING_JOB_RETENTION_HOURS', 24))
+
+# Sem heartbeat por mais que isso, um job não finalizado é considerado abandonado
+JOB_STALE_MINUTES = int(os.environ.get('ROUTING_JOB_STALE_MINUTES', 30))
+
+STALE_ERROR = 'Execução interrompida (servidor reiniciado); processe novamente'
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_futures: Dict = {}
+
+
+class JobCancelled(Exception):
+    """Job cancelado durante a execução"""
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=ROUTING_JOB_WORKERS, thread_name_prefix='routing-job')
+        return _executor
+
+
+def submit_job(user_id, params: Dict, task: Optional[Callable] = None) -> str:
+    """
+    Cria o job e agenda a execução no pool
+
+    Args:
+        user_id: ID do usuário
+        params: Parâmetros validados (validate_routing_params)
+        task: Função (user_id, params, progress) -> dict; padrão plan_routes
+
+    Returns:
+        str: ID do job
+    """
+    app = current_app._get_current_object()
+    _purge_old_jobs()
+
+    job = RoutingJob(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        status=RoutingJob.STATUS_QUEUED,
+        progress=0.0,
+        message='Na fila',
+        params=json.dumps(params),
+        heartbeat_at=datetime.utcnow()
+    )
+    db.session.add(job)
+    db.session.commit()
+    job_id = job.id
+
+    future = _get_executor().submit(_run_job, app, job_id, user_id, params, task or plan_routes)
+    _futures[job_id] = future
+    future.add_done_callback(lambda _: _futures.pop(job_id, None))
+
+    logger.info(f"📨 Job de roteirização {job_id} criado (user {user_id})")
+    return job_id
+
+
+def _run_job(app, job_id: str, user_id, params: Dict, task: Callable) -> None:
+    """Executa o job num thread do pool, com contexto próprio da aplicação"""
+    with app.app_context():
+        try:
+            job = db.session.get(RoutingJob, job_id)
+            if job is None or job.is_finished():
+                return  # Cancelado enquanto estava na fila
+
+            job.status = RoutingJob.STATUS_RUNNING
+            job.started_at = job.heartbeat_at = datetime.utcnow()
+            job.message = 'Iniciando'
+            db.session.commit()
+
+            result = task(user_id, params, _progress_reporter(job_id))
+            _finish(job_id, RoutingJob.STATUS_DONE, message='Concluído', result=app.json.dumps(result))
+            logger.info(f"✅ Job de roteirização {job_id} concluído")
+
+        except JobCancelled:
+            logger.info(f"🛑 Job de roteirização {job_id} cancelado")
+
+        except RoutingError as e:
+            _finish(job_id, RoutingJob.STATUS_FAILED, error=e.message, status_code=e.status_code)
+
+        except Exception as e:
+            logger.error(f"Erro no job de roteirização {job_id}: {e}", exc_info=True)
+            db.session.rollback()
+            _finish(job_id, RoutingJob.STATUS_FAILED, error=f'Erro interno: {str(e)}', status_code=500)
+
+        finally:
+            db.session.remove()
+
+
+def _progress_reporter(job_id: str) -> Callable[[float, str], None]:
+    """
+    Callback de progresso do pipeline: grava a etapa e o heartbeat, e interrompe
+    jobs já finalizados por fora (cancelados, ou marcados como abandonados)
+    """
+    def report(fraction: float, message: str) -> None:
+        job = db.session.get(RoutingJob, job_id, populate_existing=True)
+        if job is None or job.is_finished():
+            raise JobCancelled(job_id)
+        job.progress = max(0.0, min(1.0, float(fraction)))
+        job.message = message[:200]
+        job.heartbeat_at = datetime.utcnow()
+        db.session.commit()
+    return report
+
+
+def _finish(job_id: str, status: str, message: Optional[str] = None, result: Optional[str] = None,
+            error: Optional[str] = None, status_code: Optional[int] = None) -> None:
+    """Grava o estado final (um job já finalizado, ex.: cancelado, não muda)"""
+    job = db.session.get(RoutingJob, job_id, populate_existing=True)
+    if job is None or job.is_finished():
+        return
+
+    job.status = status
+    job.finished_at = datetime.utcnow()
+    job.message = message
+    job.error = error
+    job.status_code = status_code
+    if status == RoutingJob.STATUS_DONE:
+        job.progress = 1.0
+        job.result = result
+    db.session.commit()
+
+
+def get_job(user_id, job_id: str) -> Optional[RoutingJob]:
+    """Job do usuário (None se não existir ou for de outro usuário)"""
+    job = RoutingJob.query.filter_by(id=job_id, user_id=user_id).first()
+    if job is not None and not job.is_finished() and _is_stale(job):
+        _mark_stale(job)
+        db.session.commit()
+    return job
+
+
+def cancel_job(user_id, job_id: str) -> Optional[RoutingJob]:
+    """
+    Cancela um job na fila ou em execução (jobs finalizados não mudam)
+
+    Returns:
+        RoutingJob | None: Job atualizado, None se não existir
+    """
+    job = get_job(user_id, job_id)
+    if job is None or job.is_finished():
+        return job
+
+    job.status = RoutingJob.STATUS_CANCELLED
+    job.message = 'Cancelado'
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+    future = _futures.get(job_id)
+    if future is not None:
+        future.cancel()  # Só tem efeito se ainda não começou
+
+    logger.info(f"🛑 Cancelamento do job {job_id} solicitado")
+    return job
+
+
+def wait_job(job_id: str, timeout: Optional[float] = None) -> bool:
+    """Aguarda a execução de um job deste processo; True se terminou"""
+    future = _futures.get(job_id)
+    if future is None:
+        return True
+    done, _ = wait([future], timeout=timeout)
+    return bool(done)
+
+
+def _stale_limit() -> datetime:
+    return datetime.utcnow() - timedelta(minutes=JOB_STALE_MINUTES)
+
+
+def _is_stale(job: RoutingJob) -> bool:
+    return (job.heartbeat_at or job.created_at or datetime.utcnow()) < _stale_limit()
+
+
+def _mark_stale(job: RoutingJob) -> None:
+    job.status = RoutingJob.STATUS_FAILED
+    job.error = STALE_ERROR
+    job.status_code = 500
+    job.message = None
+    job.finished_at = datetime.utcnow()
+
+
+def fail_stale_jobs() -> int:
+    """
+    Marca como falhos os jobs na fila ou em execução sem heartbeat há mais de
+    JOB_STALE_MINUTES (o processo que os executava não existe mais)
+
+    Returns:
+        int: Número de jobs marcados
+    """
+    stale = RoutingJob.query.filter(
+        RoutingJob.status.in_([RoutingJob.STATUS_QUEUED, RoutingJob.STATUS_RUNNING]),
+        db.func.coalesce(RoutingJob.heartbeat_at, RoutingJob.created_at) < _stale_limit()
+    ).all()
+    for job in stale:
+        _mark_stale(job)
+    if stale:
+        db.session.commit()
+        logger.warning(f"⚠️ {len(stale)} jobs de roteirização abandonados marcados como falhos")
+    return len(stale)
+
+
+def _purge_old_jobs() -> None:
+    """Marca jobs abandonados como falhos e apaga jobs (e resultados) com mais de JOB_RETENTION_HOURS"""
+    limit = datetime.utcnow() - timedelta(hours=JOB_RETENTION_HOURS)
+    try:
+        fail_stale_jobs()
+        removed = RoutingJob.query.filter(RoutingJob.created_at < limit).delete(synchronize_session=False)
+        if removed:
+            db.session.commit()
+            logger.info(f"🧹 {removed} jobs de roteirização antigos removidos")
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"⚠️ Não foi possível limpar jobs antigos: {e}")
@@ -0,0 +1,348 @@
+"""
+Routing Service - Pipeline de roteirização fora da camada HTTP
+=============================================================
+
+Executa as etapas de /autenticado/roteirizacao/processar a partir de
+parâmetros já validados, para que a mesma função sirva à requisição síncrona
+e aos jobs em segundo plano (ml/routing_jobs.py):
+
+1. Clientes do usuário
+2. Pertinência cliente → área (tabela KNN materializada)
+3. Ponto de saída mais próximo (BallTree haversine)
+4. Agrupamento por dia, divisão por tamanho e ordem de visita
+5. Scores RFM e formatação do resultado
+6. Métricas de qualidade por grupo gravadas em NDBOut (ml/route_metrics.py)
+
+Com priorizar_score, os scores RFM entram no lote antes da etapa 4: com
+max_clients_per_day, os clientes que não cabem nos dias (os de menor score)
+ficam de fora (clients_deferred), cliente a cliente; os dias continuam
+geográficos e só a ordem deles segue o score médio de cada grupo. Sem
+priorizar_score, os scores são carregados no lote na etapa 5, uma única
+consulta em qualquer caso.
+
+Com calendario_id, a etapa 4 parte de um calendário salvo
+(ml/incremental_routing.py): os dias salvos são mantidos e só os clientes
+novos são encaixados.
+
+Os clientes circulam como um ClientBatch (ml/client_batch.py), em colunas
+NumPy; os dicts por cliente só são montados nos grupos finais.
+
+Os grupos da etapa 4 ficam em cache pela impressão digital da entrada
+(ml/route_cache.py): repetir a mesma roteirização pula o agrupamento.
+
+Entre as etapas a função chama `progress(fração, mensagem)`; o job usa esse
+ponto para gravar o progresso e interromper a execução quando cancelado.
+
+Autor: SynapseLog
+"""
+
+import json
+import logging
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+from base.models import db, LatLong, ClientScore, SavedCalendar
+from ml.client_batch import ClientBatch
+from ml.clustering import ALGORITHM_AUTO, ALGORITHM_BALANCED, available_algorithms
+from ml.depots import get_depot_index
+from ml.incremental_routing import load_calendar_days, reroute_incremental
+from ml.membership import ensure_user_membership, get_client_polygon_pairs
+from ml.route_cache import routing_fingerprint, get_cached_routes
+from ml.route_metrics import save_route_metrics
+from ml.route_optimizer import CLUSTERING_MODES, create_routes_knn, format_result_for_api, select_by_priority
+from ml.spatial_index import get_user_polygon_index
+
+logger = logging.getLogger(__name__)
+
+MAX_DAYS = 30
+MAX_CLIENTS_PER_DAY = 100
+
+
+class RoutingError(Exception):
+    """Erro de entrada ou de dados da roteirização (mensagem exibida ao usuário)"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def validate_routing_params(data: Optional[Dict]) -> Dict:
+    """
+    Valida o corpo de /roteirizacao/processar
+
+    Returns:
+        dict: {dias, grupos_selecionados (ints), max_clients_per_day, respeitar_range, agrupamento,
+               calendario_id (calendário salvo para replanejamento incremental ou None),
+               priorizar_score (ignorado no replanejamento incremental),
+               algoritmo (registro de ml/clustering.py ou 'auto'; padrão pelo agrupamento),
+               tempo_limite_s (tempo limite do agrupamento para 'auto' ou None)}
+
+    Raises:
+        RoutingError: Parâmetro inválido
+    """
+    data = data or {}
+    dias = data.get('dias')
+    grupos_selecionados = data.get('grupos_selecionados', [])
+    max_clients_per_day = data.get('max_clients_per_day')  # Opcional
+    respeitar_range = bool(data.get('respeitar_range', False))  # Limita clientes ao raio de cada ponto de saída
+    agrupamento = data.get('agrupamento', 'kmeans')  # 'kmeans' ou 'balanced' (grupos do mesmo tamanho)
+    calendario_id = data.get('calendario_id')  # Opcional: replaneja a partir de um calendário salvo
+    priorizar_score = bool(data.get('priorizar_score', False))  # Dias de maior score RFM primeiro
+    algoritmo = data.get('algoritmo')  # Opcional: algoritmo do agrupamento (ml/clustering.py) ou 'auto'
+    tempo_limite_s = data.get('tempo_limite_s')  # Opcional: orçamento de tempo para 'auto'
+
+    if not dias or not isinstance(dias, int) or dias <= 0:
+        raise RoutingError('Número de dias inválido')
+
+    if dias > MAX_DAYS:
+        raise RoutingError(f'Número máximo de dias é {MAX_DAYS}')
+
+    if max_clients_per_day is not None:
+        if not isinstance(max_clients_per_day, int) or max_clients_per_day < 1 or max_clients_per_day > MAX_CLIENTS_PER_DAY:
+            raise RoutingError(f'Máximo de clientes por dia deve estar entre 1 e {MAX_CLIENTS_PER_DAY}')
+
+    if agrupamento not in CLUSTERING_MODES:
+        raise RoutingError(f"Agrupamento inválido (use {', '.join(CLUSTERING_MODES)})")
+
+    # Sem algoritmo explícito: 'balanced' segue o agrupamento, o resto escolhe pelo tamanho
+    if algoritmo is None:
+        algoritmo = ALGORITHM_BALANCED if agrupamento == ALGORITHM_BALANCED else ALGORITHM_AUTO
+    elif algoritmo not in available_algorithms():
+        raise RoutingError(f"Algoritmo inválido (use {', '.join(available_algorithms())})")
+
+    if tempo_limite_s is not None:
+        if isinstance(tempo_limite_s, bool) or not isinstance(tempo_limite_s, (int, float)) or tempo_limite_s <= 0:
+            raise RoutingError('Tempo limite deve ser um número positivo de segundos')
+        tempo_limite_s = float(tempo_limite_s)
+
+    if not grupos_selecionados:
+        raise RoutingError('Nenhum grupo selecionado')
+
+    try:
+        grupos_selecionados = [int(pid) for pid in grupos_selecionados]
+    except (TypeError, ValueError):
+        raise RoutingError('IDs de grupos inválidos')
+
+    if calendario_id is not None:
+        try:
+            calendario_id = int(calendario_id)
+        except (TypeError, ValueError):
+            raise RoutingError('ID de calendário inválido')
+
+    return {
+        'dias': dias,
+        'grupos_selecionados': grupos_selecionados,
+        'max_clients_per_day': max_clients_per_day,
+        'respeitar_range': respeitar_range,
+        'agrupamento': agrupamento,
+        'calendario_id': calendario_id,
+        'priorizar_score': priorizar_score,
+        'algoritmo': algoritmo,
+        'tempo_limite_s': tempo_limite_s
+    }
+
+
+def _no_progress(fraction: float, message: str) -> None:
+    pass
+
+
+def _load_calendar(uid, calendario_id: Optional[int]) -> Optional[SavedCalendar]:
+    """Calendário salvo do usuário para o replanejamento incremental (None sem calendario_id)"""
+    if calendario_id is None:
+        return None
+    calendario = SavedCalendar.query.filter_by(id=calendario_id, user_id=uid).first()
+    if calendario is None:
+        raise RoutingError('Calendário não encontrado', 404)
+    return calendario
+
+
+def _load_scores(uid, batch: ClientBatch) -> None:
+    """Scores RFM do usuário alinhados ao lote (só hash e score, sem montar objetos do ORM)"""
+    try:
+        score_rows = (ClientScore.query.filter_by(user_id=uid)
+                      .with_entities(ClientScore.hash_cliente, ClientScore.score_total).all())
+        batch.set_scores([row[0] for row in score_rows], [row[1] for row in score_rows])
+    except Exception as e:
+        logger.warning(f"Erro ao buscar scores: {e}")
+
+
+def plan_routes(uid, params: Dict, progress: Optional[Callable[[float, str], None]] = None) -> Dict:
+    """
+    Roteirização completa de um usuário
+
+    Args:
+        uid: ID do usuário
+        params: Saída de validate_routing_params
+        progress: Chamada entre etapas com (fração 0..1, mensagem); pode lançar
+                  exceção para interromper (cancelamento do job)
+
+    Returns:
+        dict: Resultado no formato de format_result_for_api, com os campos extras da API
+
+    Raises:
+        RoutingError: Sem clientes, áreas ou grupos para roteirizar
+    """
+    progress = progress or _no_progress
+    dias = params['dias']
+    max_clients_per_day = params['max_clients_per_day']
+    respeitar_range = params['respeitar_range']
+    agrupamento = params['agrupamento']
+
+    # 1. Apenas os clientes do usuário (só as colunas usadas, sem instanciar o ORM)
+    progress(0.05, 'Carregando clientes')
+    batch = ClientBatch.from_rows(
+        LatLong.query.filter_by(id_user=uid, user_point=False)
+        .with_entities(LatLong.id, LatLong.latitude, LatLong.longitude, LatLong.hash_client)
+        .all()
+    )
+    if len(batch) == 0:
+        raise RoutingError('Nenhum cliente cadastrado')
+
+    # 2. Polígonos selecionados (índice em cache) e pertinência materializada
+    progress(0.15, 'Filtrando clientes pelas áreas')
+    polygon_index = get_user_polygon_index(uid)
+    polygons_data = polygon_index.get_polygons(params['grupos_selecionados'])
+    if not polygons_data:
+        raise RoutingError('Grupos selecionados não encontrados')
+
+    logger.info(f"📊 Total de polígonos preparados: {len(polygons_data)}")
+
+    ensure_user_membership(uid, polygon_index)
+    selected_ids = [p['id'] for p in polygons_data]
+    pairs = get_client_polygon_pairs(selected_ids)
+    clients_count = {pid: 0 for pid in selected_ids}
+    clients_count.update(Counter(polygon_id for _, polygon_id in pairs))
+
+    # Cliente em áreas sobrepostas fica com a última área selecionada
+    filtered = batch.select_polygons(pairs)
+    if len(filtered) == 0:
+        raise RoutingError('Nenhum cliente encontrado nas áreas selecionadas')
+
+    # 3. Cada cliente sai do ponto de saída mais próximo
+    progress(0.25, 'Associando pontos de saída')
+    depot_index = get_depot_index(uid)
+    depots = depot_index.get_depots()
+    clientes_fora_do_range = []
+    if depots:
+        unassigned = depot_index.assign_batch(filtered, respect_range=respeitar_range)
+        clientes_fora_do_range = filtered.to_records(unassigned)
+        if respeitar_range and unassigned.size:
+            filtered = filtered.take(np.setdiff1d(np.arange(len(filtered)), unassigned))
+            logger.warning(f"⚠️ {unassigned.size} clientes fora do raio de todos os pontos de saída")
+
+        if len(filtered) == 0:
+            raise RoutingError('Nenhum cliente dentro do raio de atuação dos pontos de saída')
+
+    calendario = _load_calendar(uid, params.get('calendario_id'))
+    priorizar_score = bool(params.get('priorizar_score')) and calendario is None
+    clientes_adiados = []
+    if priorizar_score:
+        # Scores RFM alinhados ao lote; os de menor score saem se não couberem nos dias
+        progress(0.3, 'Aplicando prioridade por score')
+        _load_scores(uid, filtered)
+        kept, deferred = select_by_priority(filtered, dias, max_clients_per_day)
+        if deferred.size:
+            clientes_adiados = filtered.to_records(deferred)
+            filtered = filtered.take(kept)
+
+    # Cada ponto de saída com clientes tem dias próprios (create_routes_knn)
+    if depots and calendario is None:
+        n_depots = len(np.unique(filtered.depot_ids))
+        if n_depots > dias:
+            raise RoutingError(f'{dias} dias não bastam para {n_depots} pontos de saída com clientes '
+                               f'(ao menos 1 dia por ponto)')
+
+    # 4. Agrupamento por dia com filtro de tamanho (em cache pela impressão digital da entrada)
+    progress(0.35, f'Agrupando {len(filtered)} clientes em {dias} dias')
+    fingerprint_params = dict(params)
+    if calendario is not None:
+        fingerprint_params['calendario_version'] = calendario.updated_at.isoformat() if calendario.updated_at else None
+    fingerprint = routing_fingerprint(filtered, polygons_data, fingerprint_params, depots)
+
+    def build_groups():
+        if calendario is not None:
+            configuracao = json.loads(calendario.configuracao) if calendario.configuracao else {}
+            return reroute_incremental(
+                filtered.to_records(),
+                load_calendar_days(json.loads(calendario.alocacoes) if calendario.alocacoes else []),
+                max_clients_per_day=max_clients_per_day or configuracao.get('max_clientes_dia'),
+                depots=depots or None
+            )
+        logger.info(f"🎯 Iniciando route_optimizer: {len(filtered)} clientes, {dias} dias, "
+                    f"limite: {max_clients_per_day}, pontos de saída: {len(depots)}")
+        return create_routes_knn(
+            filtered,
+            n_days=dias,
+            max_clients_per_day=max_clients_per_day,
+            depots=depots or None,
+            clustering=params.get('algoritmo') or agrupamento,
+            priority=priorizar_score,
+            time_budget=params.get('tempo_limite_s')
+        )
+
+    groups, cached = get_cached_routes(uid, fingerprint, build_groups)
+    if not groups:
+        raise RoutingError('Erro ao criar grupos de roteirização', 500)
+
+    # 5. Scores dos clientes (os do lote, já carregados com priorizar_score) e formatação
+    progress(0.85, 'Buscando scores dos clientes')
+    if not priorizar_score:
+        _load_scores(uid, filtered)
+    has_score = ~np.isnan(filtered.scores)
+    scores_map = {
+        hash_client: {'score_total': float(score)}
+        for hash_client, score in zip(filtered.hashes[has_score], filtered.scores[has_score])
+    }
+
+    progress(0.95, 'Formatando resultado')
+    polygons_map = {p['id']: p['name'] for p in polygons_data}
+    result = format_result_for_api(groups, scores_map, polygons_map)
+
+    # 6. Métricas de qualidade (só para planos calculados agora; os do cache já foram gravados)
+    if not cached:
+        try:
+            save_route_metrics(uid, groups, fingerprint, [g['score_medio'] for g in result['groups']])
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"Erro ao gravar métricas da roteirização: {e}")
+
+    result['clients_count_by_polygon'] = clients_count
+    result['requested_days'] = dias
+    result['max_clients_per_day'] = max_clients_per_day
+    result['depots'] = depots
+    result['clustering'] = agrupamento
+    result['algoritmo'] = params.get('algoritmo') or agrupamento
+    result['algoritmos_usados'] = sorted({g['algorithm'] for g in groups if g.get('algorithm')})
+    result['cached'] = cached
+    result['priorizar_score'] = priorizar_score
+    if clientes_adiados:
+        result['clients_deferred'] = [
+            {'hash_client': c.get('hash_client'), 'lat': c['lat'], 'lng': c['lng']}
+            for c in clientes_adiados
+        ]
+    if calendario is not None:
+        result['incremental'] = {
+            'calendario_id': calendario.id,
+            'rerouted_days': [g['day'] for g in groups if g.get('rerouted')],
+            'new_clients': sum(g.get('new_clients', 0) for g in groups),
+            'removed_clients': sum(g.get('removed_clients', 0) for g in groups)
+        }
+    if respeitar_range:
+        result['clients_out_of_range'] = [
+            {'hash_client': c.get('hash_client'), 'lat': c['lat'], 'lng': c['lng']}
+            for c in clientes_fora_do_range
+        ]
+
+    if result['split_groups'] > 0:
+        result['message'] = (f"{result['total_groups']} grupos criados para {dias} dias! "
+                             f"({result['split_groups']} grupos foram divididos pelo filtro de tamanho)")
+    else:
+        result['message'] = f"{result['total_groups']} grupos criados para {dias} dias!"
+    if clientes_adiados:
+        result['message'] += f" {len(clientes_adiados)} clientes de menor score ficaram fora da capacidade."
+
+    logger.info(f"✅ Roteirização concluída: {result['total_groups']} grupos ({result['split_groups']} divididos)")
+    return result
@@ -0,0 +1,223 @@
+"""
+Sequencing - Ordem de visita dos clientes de cada dia
+=====================================================
+
+Ordena os clientes de um grupo de roteirização saindo do ponto de saída e
+voltando a ele:
+
+1. Construção por vizinho mais próximo (argmin vetorizado por passo)
+2. Melhoria 2-opt: a cada passo avalia todas as trocas de arestas (ganhos em
+   float32, TWO_OPT_BLOCK_ROWS linhas por vez, para a memória temporária não
+   crescer com n²) e aplica a melhor, até não haver ganho ou o orçamento de
+   tempo acabar. Acima de TWO_OPT_MAX_POINTS paradas fica só o vizinho mais
+   próximo: cada passo do 2-opt é O(n²) e, com vários grupos sequenciados ao
+   mesmo tempo (um por ponto de saída), a memória se multiplica
+
+Sem ponto de saída o percurso é aberto (começa e termina em clientes): um nó
+fictício com distância zero a todos faz o papel do ponto de saída.
+
+As distâncias vêm da matriz em cache de ml/distance_matrix.py.
+
+Autor: SynapseLog
+"""
+
+import logging
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ml.distance_matrix import (
+    DistanceMatrixCache, route_matrix, haversine_pairs_km, MAX_ROUTE_MATRIX_POINTS
+)
+
+logger = logging.getLogger(__name__)
+
+# Orçamento de tempo do 2-opt por grupo (segundos)
+TWO_OPT_TIME_BUDGET_S = 0.5
+
+# Ganho mínimo (km) para aceitar uma troca
+TWO_OPT_MIN_GAIN_KM = 1e-6
+
+# Paradas acima disso não passam pelo 2-opt (fica o percurso do vizinho mais próximo)
+TWO_OPT_MAX_POINTS = 1000
+
+# Linhas da matriz de ganhos calculadas por vez (TWO_OPT_BLOCK_ROWS x n float32)
+TWO_OPT_BLOCK_ROWS = 256
+
+
+def nearest_neighbour_tour(matrix: np.ndarray, start: int = 0) -> List[int]:
+    """
+    Percurso pelo vizinho mais próximo a partir de `start`
+
+    Returns:
+        list: Todos os índices da matriz, começando em `start`
+    """
+    n = matrix.shape[0]
+    visited = np.zeros(n, dtype=bool)
+    tour = [start]
+    visited[start] = True
+    current = start
+    for _ in range(n - 1):
+        row = np.where(visited, np.inf, matrix[current])
+        current = int(np.argmin(row))
+        visited[current] = True
+        tour.append(current)
+    return tour
+
+
+def two_opt(matrix: np.ndarray, tour: List[int], time_budget: float = TWO_OPT_TIME_BUDGET_S) -> List[int]:
+    """
+    Melhora um percurso fechado com 2-opt (o primeiro nó fica fixo na posição 0)
+
+    Args:
+        matrix: Distâncias entre os nós
+        tour: Percurso inicial (fechado: o último nó volta ao primeiro)
+        time_budget: Tempo máximo em segundos
+
+    Returns:
+        list: Percurso melhorado
+    """
+    tour = np.asarray(tour, dtype=np.int64)
+    n = tour.shape[0]
+    if n < 4:
+        return tour.tolist()
+
+    dist = np.asarray(matrix, dtype=np.float32)
+    positions = np.arange(n)
+
+    deadline = time.perf_counter() + time_budget
+    while time.perf_counter() < deadline:
+        a = tour
+        b = np.roll(tour, -1)
+        edge = dist[a, b]
+
+        best_i, best_j, best_gain = -1, -1, 0.0
+        for start in range(0, n, TWO_OPT_BLOCK_ROWS):
+            rows = positions[start:start + TWO_OPT_BLOCK_ROWS]
+            # Ganho de trocar (a_i, b_i) + (a_j, b_j) por (a_i, a_j) + (b_i, b_j)
+            delta = dist[a[rows, None], a[None, :]]
+            delta += dist[b[rows, None], b[None, :]]
+            delta -= edge[rows, None]
+            delta -= edge[None, :]
+            # Pares (i, j) válidos: j > i + 1 e as duas arestas não são vizinhas no ciclo
+            delta[positions[None, :] <= rows[:, None] + 1] = 0.0
+            if start == 0:
+                delta[0, n - 1] = 0.0
+
+            k = int(np.argmin(delta))
+            if delta.flat[k] < best_gain:
+                best_i, best_j, best_gain = start + k // n, k % n, float(delta.flat[k])
+
+        if best_i < 0:
+            break
+        # Confirma o ganho em float64 (o arredondamento do float32 não pode gerar trocas sem ganho)
+        i, j = best_i, best_j
+        exact = (float(dist[a[i], a[j]]) + float(dist[b[i], b[j]])) - (float(edge[i]) + float(edge[j]))
+        if exact > -TWO_OPT_MIN_GAIN_KM:
+            break
+        tour[i + 1:j + 1] = tour[i + 1:j + 1][::-1].copy()
+
+    return tour.tolist()
+
+
+def sequence_clients(clients: List[Dict], depot: Optional[Dict] = None,
+                     time_budget: float = TWO_OPT_TIME_BUDGET_S,
+                     cache: Optional[DistanceMatrixCache] = None) -> List[int]:
+    """
+    Ordem de visita dos clientes ({'lat', 'lng'})
+
+    Args:
+        clients: Clientes do dia
+        depot: Ponto de saída ({'lat', 'lng'}); None = percurso aberto
+        time_budget: Tempo máximo do 2-opt em segundos
+
+    Returns:
+        list: Índices em `clients` na ordem de visita
+    """
+    n = len(clients)
+    if n <= 1:
+        return list(range(n))
+
+    lats = np.array([c['lat'] for c in clients])
+    lngs = np.array([c['lng'] for c in clients])
+
+    if n + 1 > MAX_ROUTE_MATRIX_POINTS:
+        # Grupo grande demais para matriz: varredura angular em volta do ponto de saída (ou do centro)
+        center = (depot['lat'], depot['lng']) if depot else (lats.mean(), lngs.mean())
+        logger.info(f"🧭 {n} paradas: ordem por varredura angular (sem 2-opt)")
+        return np.argsort(np.arctan2(lats - center[0], lngs - center[1]), kind='stable').tolist()
+
+    matrix = route_matrix(clients, depot, cache)
+    improve = n <= TWO_OPT_MAX_POINTS
+    if not improve:
+        logger.info(f"🧭 {n} paradas: vizinho mais próximo (sem 2-opt acima de {TWO_OPT_MAX_POINTS})")
+    if depot:
+        tour = nearest_neighbour_tour(matrix, 0)
+        order = two_opt(matrix, tour, time_budget) if improve else tour
+        return [k - 1 for k in order[1:]]
+
+    # Percurso aberto: nó fictício (índice 0) a distância zero de todos os clientes;
+    # a construção parte do cliente mais distante do centro do grupo
+    extended = np.zeros((n + 1, n + 1), dtype=np.float32)
+    extended[1:, 1:] = matrix
+    start = int(np.argmax((lats - lats.mean()) ** 2 + (lngs - lngs.mean()) ** 2))
+
+    tour = [0] + [k + 1 for k in nearest_neighbour_tour(matrix, start)]
+    order = two_opt(extended, tour, time_budget) if improve else tour
+    return [k - 1 for k in order[1:]]
+
+
+def sequence_group(group: Dict, time_budget: float = TWO_OPT_TIME_BUDGET_S,
+                   cache: Optional[DistanceMatrixCache] = None) -> Dict:
+    """
+    Ordena os clientes de um grupo de roteirização e grava as paradas
+
+    - group['clients']: reordenados na ordem de visita
+    - group['stops']: [{'sequence', 'hash_client', 'lat', 'lng', 'leg_km'}, ...]
+      (leg_km = distância desde a parada anterior ou desde o ponto de saída)
+    - group['return_km']: volta da última parada ao ponto de saída (com depot)
+    """
+    clients = group.get('clients') or []
+    depot = group.get('depot')
+
+    order = sequence_clients(clients, depot, time_budget, cache)
+    group['clients'] = [clients[k] for k in order]
+    return build_stops(group)
+
+
+def build_stops(group: Dict) -> Dict:
+    """
+    Grava group['stops'] e group['return_km'] na ordem atual de group['clients']
+    (sem reordenar; usado por sequence_group e pelos dias mantidos no replanejamento)
+    """
+    clients = group.get('clients') or []
+    depot = group.get('depot')
+
+    group['stops'] = []
+    if not clients:
+        return group
+
+    # Trechos entre paradas consecutivas (o primeiro sai do ponto de saída, se houver)
+    points = ([depot] if depot else []) + clients + ([depot] if depot else [])
+    lats = np.array([p['lat'] for p in points])
+    lngs = np.array([p['lng'] for p in points])
+    legs = haversine_pairs_km(lats[:-1], lngs[:-1], lats[1:], lngs[1:])
+    if not depot:
+        legs = np.concatenate([[0.0], legs])
+
+    for position, client in enumerate(clients):
+        leg = float(legs[position])
+        group['stops'].append({
+            'sequence': position + 1,
+            'hash_client': client.get('hash_client'),
+            'name': client.get('name'),
+            'lat': client['lat'],
+            'lng': client['lng'],
+            'leg_km': round(leg, 3)
+        })
+    if depot:
+        group['return_km'] = round(float(legs[-1]), 3)
+
+    logger.debug(f"🧭 Grupo {group.get('group_number')}: {len(clients)} paradas, {legs.sum():.1f} km")
+    return group
@@ -0,0 +1,224 @@
+"""
+Spatial Index - Índice de polígonos por usuário
+================================================
+
+Mantém, por usuário, um STRtree com os polígonos (áreas) já preparados para
+consultas de ponto-em-polígono. O índice vive entre requisições (cache em memória
+do processo) e é reconstruído quando as áreas do usuário mudam: a versão
+(polygon_data_version) é conferida no banco a cada uso, então alterações feitas
+por outro worker também são vistas.
+
+As áreas são carregadas da geometria compilada gravada no Polygon
+(geometry_wkb + bbox_*), sem reprocessar o GeoJSON a cada requisição.
+
+Consulta de pontos:
+1. STRtree devolve os pares (ponto, polígono) cujo bounding box contém o ponto - O(log P)
+2. GeoUtils.contains_points confirma apenas esses candidatos, agrupados por polígono
+   (faixa de borda da versão simplificada + anel exato só perto da borda)
+
+Autor: SynapseLog
+"""
+
+import numpy as np
+import shapely
+from shapely.strtree import STRtree
+from sqlalchemy import func
+from typing import Callable, Dict, List, Optional
+
+from base.models import db, Polygon
+from ml.geo_utils import GeoUtils
+from ml.user_cache import UserCache
+
+
+class PolygonIndex:
+    """Índice espacial (STRtree) sobre os polígonos de um usuário"""
+
+    def __init__(self, polygons: List[Dict]):
+        """
+        Args:
+            polygons: Lista de polígonos no formato do GeoUtils
+                      [{'id': 1, 'name': 'Grupo A', 'coordinates': [[lat, lng], ...]}, ...]
+        """
+        geometries = GeoUtils.prepare_polygon_geometries(polygons)
+        valid_ids = {g['id'] for g in geometries}
+
+        # Metadados (id, nome, coordenadas) apenas dos polígonos válidos, na ordem da árvore
+        self.polygons = [p for p in polygons if p['id'] in valid_ids]
+        self.geometries = geometries
+        self.ids = [g['id'] for g in geometries]
+        self.position = {pid: j for j, pid in enumerate(self.ids)}
+        self.tree = STRtree([g['geometry'] for g in geometries]) if geometries else None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get_polygons(self, polygon_ids: Optional[List[int]] = None) -> List[Dict]:
+        """Retorna os metadados dos polígonos (todos ou apenas os ids informados)"""
+        if polygon_ids is None:
+            return list(self.polygons)
+        wanted = set(polygon_ids)
+        return [p for p in self.polygons if p['id'] in wanted]
+
+    def query_membership(self, lats, lngs) -> np.ndarray:
+        """
+        Calcula a matriz de pertinência ponto x polígono usando o STRtree
+
+        Args:
+            lats, lngs: Arrays (ou listas) com as coordenadas dos pontos
+
+        Returns:
+            np.ndarray: Matriz booleana (n_pontos, n_poligonos) na ordem de self.ids
+        """
+        lats = np.asarray(lats, dtype=float)
+        lngs = np.asarray(lngs, dtype=float)
+        membership = np.zeros((lats.shape[0], len(self.ids)), dtype=bool)
+
+        if self.tree is None or lats.shape[0] == 0:
+            return membership
+
+        valid = np.flatnonzero(np.isfinite(lats) & np.isfinite(lngs))
+        if valid.size == 0:
+            return membership
+
+        # Pares (ponto, polígono) cujo bbox contém o ponto
+        point_idx, tree_idx = self.tree.query(shapely.points(lngs[valid], lats[valid]))
+        if point_idx.size == 0:
+            return membership
+
+        point_idx = valid[point_idx]
+        order = np.argsort(tree_idx, kind='stable')
+        point_idx = point_idx[order]
+        tree_idx = tree_idx[order]
+        boundaries = np.flatnonzero(np.diff(tree_idx)) + 1
+
+        for chunk_points, chunk_tree in zip(np.split(point_idx, boundaries), np.split(tree_idx, boundaries)):
+            j = chunk_tree[0]
+            membership[chunk_points, j] = GeoUtils.contains_points(
+                self.geometries[j], lngs[chunk_points], lats[chunk_points]
+            )
+
+        return membership
+
+    def filter_clients(self, clients: List[Dict], polygon_ids: Optional[List[int]] = None) -> Dict:
+        """
+        Equivalente a GeoUtils.filter_clients_by_polygons_optimized usando o índice
+
+        Args:
+            clients: Lista de clientes com {latitude, longitude, ...}
+            polygon_ids: Restringe o resultado a estes polígonos (None = todos)
+
+        Returns:
+            dict: {polygon_id: [clientes], ...}
+        """
+        ids = self.ids if polygon_ids is None else [pid for pid in self.ids if pid in set(polygon_ids)]
+        result = {pid: [] for pid in ids}
+
+        if not ids or not clients:
+            return result
+
+        lats, lngs = GeoUtils.coordinates_to_arrays(clients)
+        membership = self.query_membership(lats, lngs)
+
+        for pid in ids:
+            result[pid] = [clients[i] for i in np.flatnonzero(membership[:, self.position[pid]])]
+
+        return result
+
+
+# ============================================================================
+# CARREGAMENTO DAS ÁREAS
+# ============================================================================
+
+def load_user_polygons(user_id) -> List[Dict]:
+    """
+    Carrega as áreas do usuário a partir da geometria compilada (WKB + bbox +
+    versões simplificadas)
+
+    Áreas antigas, salvas antes dessas colunas existirem, são compiladas uma
+    única vez aqui e gravadas de volta.
+
+    Returns:
+        list: [{'id', 'name', 'geometry', 'simplified': {tolerância: geometria}, 'bbox',
+                'coordinates': [[lat, lng], ...],
+                'geometry_version', 'max_clients_per_day', 'created_at'}, ...]
+    """
+    rows = Polygon.query.filter_by(user_id=user_id).all()
+
+    stale = [p for p in rows if p.geometry_wkb is None or p.geometry_simplified is None]
+    if stale:
+        for p in stale:
+            try:
+                if not p.compile_geometry():
+                    print(f"⚠️  Área '{p.group_name}' não tem um polígono válido")
+            except Exception as e:
+                print(f"❌ Erro ao compilar área '{p.group_name}': {e}")
+        db.session.commit()
+
+    polygons = []
+    for p in rows:
+        if p.geometry_wkb is None:
+            continue
+
+        geometry = shapely.from_wkb(p.geometry_wkb)
+        simplified = {
+            float(tolerance): shapely.from_wkb(wkb_hex)
+            for tolerance, wkb_hex in (p.geometry_simplified or {}).items()
+        }
+        polygons.append({
+            'id': p.id,
+            'name': p.group_name,
+            'geometry': geometry,
+            'simplified': simplified,
+            'bbox': p.get_bbox(),
+            # Anel externo em [lat, lng] (formato esperado pelo GeoUtils / frontend)
+            'coordinates': [[y, x] for x, y in geometry.exterior.coords],
+            'geometry_version': p.geometry_version or 0,
+            'max_clients_per_day': p.max_clients_per_day,
+            'created_at': p.created_at
+        })
+
+    return polygons
+
+
+def polygon_data_version(user_id) -> tuple:
+    """
+    Versão das áreas do usuário: (quantidade, max(id), soma de geometry_version).
+    Muda ao criar, excluir ou regravar qualquer área (set_geojson recompila e
+    incrementa geometry_version).
+    """
+    return tuple(db.session.query(
+        func.count(Polygon.id), func.max(Polygon.id), func.sum(Polygon.geometry_version)
+    ).filter(Polygon.user_id == user_id).one())
+
+
+def get_user_polygon_index(user_id) -> PolygonIndex:
+    """Índice em cache das áreas do usuário, carregado via load_user_polygons"""
+    return get_polygon_index(user_id, lambda: load_user_polygons(user_id), polygon_data_version(user_id))
+
+
+# ============================================================================
+# CACHE POR USUÁRIO
+# ============================================================================
+
+_index_cache = UserCache()
+
+
+def get_polygon_index(user_id, loader: Callable[[], List[Dict]], version=None) -> PolygonIndex:
+    """
+    Retorna o índice do usuário, construindo-o com `loader` na primeira chamada
+    ou quando `version` muda
+
+    Args:
+        user_id: ID do usuário dono das áreas
+        loader: Função sem argumentos que devolve a lista de polígonos do usuário
+        version: Versão atual das áreas (polygon_data_version)
+
+    Returns:
+        PolygonIndex em cache para o usuário
+    """
+    return _index_cache.get(user_id, lambda: PolygonIndex(loader()), version)
+
+
+def invalidate_polygon_index(user_id) -> None:
+    """Descarta o índice do usuário (chamar sempre que as áreas dele mudarem)"""
+    _index_cache.invalidate(user_id)
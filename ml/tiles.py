@@ -0,0 +1,225 @@
+"""
+Tiles - Tiles GeoJSON (z/x/y) com clientes e áreas do usuário
+=============================================================
+
+Serve os dados do mapa em tiles Web Mercator (esquema XYZ do OpenStreetMap),
+para o frontend carregar apenas os tiles visíveis:
+
+- 'clients': clusters de clientes do zoom do tile (ml/point_clusters.py),
+  selecionados pelo retângulo exato do tile (sem duplicar entre tiles vizinhos)
+- 'depots':  pontos de saída (user_point=True) dentro do tile
+- 'areas':   polígonos simplificados para o zoom (tolerância ≈ 1 pixel, a partir
+             da versão armazenada mais próxima) e recortados no retângulo do
+             tile com uma pequena margem
+
+Cada tile gerado fica em cache (LRU por usuário) junto com seu ETag; o cache do
+usuário é descartado quando a versão das áreas, dos clientes ou dos pontos de
+saída (tile_data_version, lida do banco a cada requisição) muda.
+
+Autor: SynapseLog
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import shapely
+from shapely.geometry import mapping
+
+from base.models import LatLong
+from ml.depots import depot_data_version
+from ml.point_clusters import client_data_version
+from ml.spatial_index import polygon_data_version
+from ml.user_cache import UserCache
+
+logger = logging.getLogger(__name__)
+
+# Zoom máximo aceito (Leaflet/OSM)
+MAX_TILE_ZOOM = 22
+
+# Tamanho do tile em pixels
+TILE_SIZE = 256
+
+# Tolerância de simplificação das áreas, em pixels do zoom do tile
+SIMPLIFY_TOLERANCE_PX = 1.0
+
+# Margem de recorte das áreas, em pixels (evita bordas visíveis entre tiles)
+CLIP_BUFFER_PX = 4
+
+# Tiles guardados por usuário
+MAX_TILES_PER_USER = 512
+
+
+def tile_bounds(z: int, x: int, y: int) -> Dict:
+    """
+    Bounding box geográfico de um tile XYZ
+
+    Returns:
+        dict: {min_lat, max_lat, min_lon, max_lon}
+    """
+    n = 2.0 ** z
+    return {
+        'min_lon': x / n * 360.0 - 180.0,
+        'max_lon': (x + 1) / n * 360.0 - 180.0,
+        'min_lat': float(np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y + 1) / n))))),
+        'max_lat': float(np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y / n)))))
+    }
+
+
+def validate_tile(z: int, x: int, y: int) -> None:
+    """ValueError se (z, x, y) não for um tile válido"""
+    if not 0 <= z <= MAX_TILE_ZOOM:
+        raise ValueError(f"zoom inválido: {z}")
+    if not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise ValueError(f"tile fora do mundo: {z}/{x}/{y}")
+
+
+class TileCache:
+    """LRU de tiles prontos ({(z, x, y): (etag, corpo)}) de um usuário"""
+
+    def __init__(self, maxsize: int = MAX_TILES_PER_USER):
+        self.maxsize = maxsize
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Optional[Tuple[str, str]]:
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+            return tile
+
+    def put(self, key, tile: Tuple[str, str]) -> None:
+        with self._lock:
+            self._tiles[key] = tile
+            self._tiles.move_to_end(key)
+            while len(self._tiles) > self.maxsize:
+                self._tiles.popitem(last=False)
+
+    def __len__(self):
+        return len(self._tiles)
+
+
+_tile_cache = UserCache()
+
+
+def tile_data_version(user_id) -> tuple:
+    """Versão de tudo que aparece nos tiles do usuário (áreas, clientes e pontos de saída)"""
+    return polygon_data_version(user_id), client_data_version(user_id), depot_data_version(user_id)
+
+
+def invalidate_tiles(user_id) -> None:
+    """Descarta os tiles do usuário (áreas alteradas ou clientes importados)"""
+    _tile_cache.invalidate(user_id)
+
+
+def _area_features(polygon_index, z: int, bounds: Dict) -> list:
+    """Áreas que tocam o tile, simplificadas para o zoom e recortadas no tile"""
+    degrees_per_px = 360.0 / (TILE_SIZE * 2 ** z)
+    margin = CLIP_BUFFER_PX * degrees_per_px
+
+    meta = {p['id']: p for p in polygon_index.get_polygons()}
+    tolerance = SIMPLIFY_TOLERANCE_PX * degrees_per_px
+
+    features = []
+    for polygon in polygon_index.geometries:
+        bbox = polygon['bbox']
+        if (bbox['max_lon'] < bounds['min_lon'] - margin or bbox['min_lon'] > bounds['max_lon'] + margin or
+                bbox['max_lat'] < bounds['min_lat'] - margin or bbox['min_lat'] > bounds['max_lat'] + margin):
+            continue
+
+        # Parte da versão armazenada mais simplificada que ainda cabe na tolerância do zoom
+        stored = meta.get(polygon['id'], {}).get('simplified') or {}
+        levels = [t for t in stored if t <= tolerance]
+        source = stored[max(levels)] if levels else polygon['geometry']
+
+        geometry = shapely.simplify(source, tolerance, preserve_topology=True)
+        geometry = shapely.clip_by_rect(
+            geometry,
+            bounds['min_lon'] - margin, bounds['min_lat'] - margin,
+            bounds['max_lon'] + margin, bounds['max_lat'] + margin
+        )
+        if geometry.is_empty:
+            continue
+
+        features.append({
+            'type': 'Feature',
+            'geometry': mapping(geometry),
+            'properties': {'layer': 'areas', 'id': polygon['id'], 'name': meta.get(polygon['id'], {}).get('name')}
+        })
+    return features
+
+
+def _depot_features(user_id, bounds: Dict) -> list:
+    depots = LatLong.query.filter(
+        LatLong.id_user == user_id,
+        LatLong.user_point == True,  # noqa: E712
+        LatLong.latitude.between(bounds['min_lat'], bounds['max_lat']),
+        LatLong.longitude.between(bounds['min_lon'], bounds['max_lon'])
+    ).all()
+    return [{
+        'type': 'Feature',
+        'geometry': {'type': 'Point', 'coordinates': [p.longitude, p.latitude]},
+        'properties': {'layer': 'depots', 'id': p.id, 'hash_client': p.hash_client}
+    } for p in depots]
+
+
+def build_tile(user_id, z: int, x: int, y: int, polygon_index, point_clusters) -> Dict:
+    """
+    Monta o FeatureCollection de um tile
+
+    Args:
+        user_id: Dono dos dados
+        z, x, y: Tile XYZ
+        polygon_index: PolygonIndex do usuário
+        point_clusters: PointClusterIndex do usuário
+
+    Returns:
+        dict: GeoJSON FeatureCollection (camada em properties.layer)
+    """
+    bounds = tile_bounds(z, x, y)
+
+    features = []
+    for cluster in point_clusters.get_clusters_in_tile(z, x, y):
+        properties = {'layer': 'clients', 'count': cluster['count']}
+        if 'id' in cluster:
+            properties.update(id=cluster['id'], hash_client=cluster['hash_client'])
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [cluster['longitude'], cluster['latitude']]},
+            'properties': properties
+        })
+
+    features.extend(_depot_features(user_id, bounds))
+    features.extend(_area_features(polygon_index, z, bounds))
+
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def get_tile(user_id, z: int, x: int, y: int, polygon_index_loader, point_clusters_loader,
+             version=None) -> Tuple[str, str]:
+    """
+    Retorna (etag, corpo JSON) do tile, gerando-o na primeira requisição
+
+    Args:
+        polygon_index_loader / point_clusters_loader: Funções sem argumentos que
+            devolvem os índices (em cache) do usuário
+    """
+    validate_tile(z, x, y)
+    cache = _tile_cache.get(user_id, TileCache, version)
+
+    tile = cache.get((z, x, y))
+    if tile is not None:
+        return tile
+
+    body = json.dumps(
+        build_tile(user_id, z, x, y, polygon_index_loader(), point_clusters_loader()),
+        separators=(',', ':')
+    )
+    tile = (hashlib.md5(body.encode('utf-8')).hexdigest(), body)
+    cache.put((z, x, y), tile)
+    return tile
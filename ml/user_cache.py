@@ -0,0 +1,70 @@
+"""
+User Cache - Cache em memória por usuário com invalidação segura
+================================================================
+
+Guarda estruturas derivadas dos dados de um usuário (índice de áreas, clusters
+de pontos, ...) entre requisições.
+
+O cache é do processo: com vários workers (gunicorn), uma gravação feita em
+outro worker não passa pelo invalidate deste. Por isso cada valor é guardado
+junto com a versão dos dados de origem (consulta barata ao banco, por exemplo
+contagem, max(id) e soma de geometry_version das linhas do usuário); um valor
+cuja versão difere da atual é reconstruído.
+
+invalidate continua servindo como atalho local: incrementa a geração do
+usuário, e um valor construído durante uma invalidação concorrente é devolvido
+ao chamador mas não é guardado.
+
+Autor: SynapseLog
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+
+class UserCache:
+    """Cache por usuário (um valor por user_id) protegido por lock"""
+
+    def __init__(self):
+        self._values: Dict = {}
+        self._generation: Dict = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id, builder: Callable[[], Any], version: Hashable = None) -> Any:
+        """
+        Retorna o valor do usuário, construindo-o com `builder` se não estiver em
+        cache ou se foi construído para outra versão dos dados
+
+        Args:
+            user_id: ID do usuário
+            builder: Função sem argumentos que constrói o valor
+            version: Versão atual dos dados de origem (lida do banco pelo chamador)
+        """
+        with self._lock:
+            entry = self._values.get(user_id)
+            generation = self._generation.get(user_id, 0)
+
+        if entry is not None and entry[0] == version:
+            return entry[1]
+
+        value = builder()
+
+        with self._lock:
+            # Só guarda se os dados não foram invalidados durante a construção
+            if self._generation.get(user_id, 0) == generation:
+                self._values[user_id] = (version, value)
+
+        return value
+
+    def invalidate(self, user_id) -> None:
+        """Descarta o valor do usuário (chamar sempre que os dados de origem mudarem)"""
+        with self._lock:
+            self._values.pop(user_id, None)
+            self._generation[user_id] = self._generation.get(user_id, 0) + 1
+
+    def clear(self) -> None:
+        """Descarta os valores de todos os usuários"""
+        with self._lock:
+            for user_id in list(self._values):
+                self._generation[user_id] = self._generation.get(user_id, 0) + 1
+            self._values.clear()
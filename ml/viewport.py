@@ -0,0 +1,156 @@
+"""
+Viewport - Pontos de cliente filtrados pelo bounding box do mapa
+================================================================
+
+Consulta os pontos (LatLong) de um usuário apenas dentro da área visível do mapa,
+usando a coluna LatLong.geocell (grade fixa de GeoUtils.geocell) e o índice
+(id_user, geocell):
+
+1. bbox → faixas contíguas de células (uma por linha da grade)
+2. SQL: geocell BETWEEN ... (índice) + filtro exato por latitude/longitude
+3. Opcional (zoom): pontos de cliente que caem no mesmo pixel da tela são
+   agrupados em um único marcador com 'count'
+
+Assim o tamanho da resposta e o tempo de consulta acompanham o que está na tela,
+não o tamanho da conta.
+
+Autor: SynapseLog
+"""
+
+import logging
+import numpy as np
+from sqlalchemy import or_, cast, Integer
+from typing import Dict, List, Optional
+
+from base.models import db, LatLong
+from ml.geo_utils import GeoUtils, GEOCELL_SIZE_DEG, GEOCELL_COLS
+
+logger = logging.getLogger(__name__)
+
+# Zoom máximo aceito (Leaflet/OSM)
+MAX_ZOOM = 22
+
+# Tamanho do tile em pixels (Web Mercator)
+TILE_SIZE = 256
+
+# Usuários cujos pontos antigos já tiveram o geocell preenchido neste processo
+_backfilled_users = set()
+
+
+def backfill_geocells(user_id=None) -> int:
+    """
+    Preenche geocell dos pontos gravados antes da coluna existir (UPDATE em SQL)
+
+    Args:
+        user_id: Restringe a um usuário (None = todos)
+
+    Returns:
+        int: Número de pontos atualizados
+    """
+    query = LatLong.query.filter(LatLong.geocell.is_(None))
+    if user_id is not None:
+        query = query.filter(LatLong.id_user == user_id)
+
+    # Mesma fórmula de GeoUtils.geocell (CAST trunca valores positivos)
+    geocell_expr = (
+        cast((LatLong.latitude + 90) / GEOCELL_SIZE_DEG, Integer) * GEOCELL_COLS +
+        cast((LatLong.longitude + 180) / GEOCELL_SIZE_DEG, Integer)
+    )
+    updated = query.filter(
+        LatLong.latitude.between(-90, 90),
+        LatLong.longitude.between(-180, 180)
+    ).update({LatLong.geocell: geocell_expr}, synchronize_session=False)
+    db.session.commit()
+
+    if updated:
+        logger.info(f"🧭 geocell preenchido para {updated} pontos (user={user_id})")
+    return updated
+
+
+def parse_zoom(value) -> Optional[int]:
+    """Converte o parâmetro zoom (None se ausente); ValueError se inválido"""
+    if value is None or value == '':
+        return None
+    zoom = int(value)
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise ValueError(f"zoom inválido: {value}")
+    return zoom
+
+
+def _pixel_keys(lats: np.ndarray, lngs: np.ndarray, zoom: int) -> np.ndarray:
+    """Pixel (Web Mercator) de cada ponto no zoom informado, como chave inteira única"""
+    world = TILE_SIZE * (2 ** zoom)
+    lat_rad = np.radians(np.clip(lats, -85.05112878, 85.05112878))
+    x = np.floor((lngs + 180.0) / 360.0 * world).astype(np.int64)
+    y = np.floor((1.0 - np.log(np.tan(lat_rad) + 1.0 / np.cos(lat_rad)) / np.pi) / 2.0 * world).astype(np.int64)
+    return y * world + x
+
+
+def query_viewport_points(user_id, bbox: Optional[Dict] = None, zoom: Optional[int] = None,
+                          include_user_points: bool = True) -> List[Dict]:
+    """
+    Retorna os pontos do usuário dentro do bbox
+
+    Args:
+        user_id: Dono dos pontos
+        bbox: {min_lat, max_lat, min_lon, max_lon} (None = todos os pontos)
+        zoom: Se informado, agrupa pontos de cliente no mesmo pixel da tela
+        include_user_points: Inclui pontos de saída (user_point=True)
+
+    Returns:
+        list: [{'id', 'hash_client', 'latitude', 'longitude', 'user_point', 'count'}, ...]
+    """
+    if user_id not in _backfilled_users:
+        backfill_geocells(user_id)
+        _backfilled_users.add(user_id)
+
+    query = db.session.query(
+        LatLong.id, LatLong.hash_client, LatLong.latitude, LatLong.longitude, LatLong.user_point
+    ).filter(LatLong.id_user == user_id)
+
+    if not include_user_points:
+        query = query.filter(or_(LatLong.user_point == False, LatLong.user_point.is_(None)))  # noqa: E712
+
+    if bbox is not None:
+        ranges = GeoUtils.geocell_ranges(bbox)
+        if not ranges:
+            return []
+        query = query.filter(
+            or_(*[LatLong.geocell.between(start, end) for start, end in ranges]),
+            LatLong.latitude.between(bbox['min_lat'], bbox['max_lat']),
+            LatLong.longitude.between(bbox['min_lon'], bbox['max_lon'])
+        )
+
+    rows = query.all()
+    points = [
+        {
+            'id': pid,
+            'hash_client': hash_client,
+            'latitude': lat,
+            'longitude': lng,
+            'user_point': bool(user_point),
+            'count': 1
+        }
+        for pid, hash_client, lat, lng, user_point in rows
+    ]
+
+    if zoom is None or not points:
+        return points
+
+    # Pontos de saída nunca são agrupados
+    depots = [p for p in points if p['user_point']]
+    clients = [p for p in points if not p['user_point']]
+    if not clients:
+        return depots
+
+    lats = np.fromiter((p['latitude'] for p in clients), dtype=float, count=len(clients))
+    lngs = np.fromiter((p['longitude'] for p in clients), dtype=float, count=len(clients))
+    _, first, counts = np.unique(_pixel_keys(lats, lngs, zoom), return_index=True, return_counts=True)
+
+    merged = []
+    for i, count in zip(np.sort(first), counts[np.argsort(first)]):
+        point = clients[i]
+        point['count'] = int(count)
+        merged.append(point)
+
+    return depots + merged
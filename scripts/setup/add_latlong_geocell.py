@@ -0,0 +1,61 @@
+"""
+Script para adicionar a coluna geocell (grade espacial) na tabela latlong_data
+
+Cria o índice (id_user, geocell) usado pelas consultas por viewport
+(/api/latlongs?bbox=... e /autenticado/grupos?action=get&bbox=...) e preenche
+os pontos já existentes.
+"""
+import sqlite3
+import os
+
+# Caminho do banco de dados
+db_path = os.path.join(os.path.dirname(__file__), '..', '..', 'databases', 'synapselLog_latlong.db')
+db_path = os.path.abspath(db_path)
+
+print(f"📂 Banco de dados: {db_path}")
+print(f"✓ Banco existe: {os.path.exists(db_path)}")
+
+try:
+    # Conecta ao banco
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    # Verifica tabelas existentes
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    tables = [row[0] for row in cursor.fetchall()]
+    print(f"\n📊 Tabelas encontradas: {tables}")
+    
+    if 'latlong_data' not in tables:
+        print("\n⚠️ Tabela latlong_data não existe! Rode scripts/setup/init_multiple_dbs.py primeiro.")
+    else:
+        cursor.execute("PRAGMA table_info(latlong_data)")
+        columns = [row[1] for row in cursor.fetchall()]
+        print(f"\n📋 Colunas existentes: {columns}")
+        
+        if 'geocell' in columns:
+            print("\n✓ Coluna geocell já existe!")
+        else:
+            print("\n➕ Adicionando coluna geocell...")
+            cursor.execute("ALTER TABLE latlong_data ADD COLUMN geocell INTEGER")
+        
+        print("➕ Criando índice idx_latlong_user_geocell...")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_latlong_user_geocell ON latlong_data (id_user, geocell)")
+        
+        # Mesma fórmula de GeoUtils.geocell (células de 0.05°)
+        cursor.execute("""
+            UPDATE latlong_data
+            SET geocell = CAST((latitude + 90) / 0.05 AS INTEGER) * 7200 + CAST((longitude + 180) / 0.05 AS INTEGER)
+            WHERE geocell IS NULL
+              AND latitude BETWEEN -90 AND 90
+              AND longitude BETWEEN -180 AND 180
+        """)
+        print(f"🧭 Pontos preenchidos: {cursor.rowcount}")
+        conn.commit()
+    
+    conn.close()
+    print("\n✅ Script executado com sucesso!")
+    
+except Exception as e:
+    print(f"\n❌ Erro: {e}")
+    import traceback
+    traceback.print_exc()
@@ -0,0 +1,49 @@
+"""
+Script para adicionar a coluna range_km (raio de atuação) na tabela latlong_data
+
+O raio é informado no cadastro dos pontos de saída (/autenticado/pontosSaida) e
+pode ser usado para limitar quais clientes cada ponto de saída atende na
+roteirização. Pontos antigos ficam sem raio (sem limite).
+"""
+import sqlite3
+import os
+
+# Caminho do banco de dados
+db_path = os.path.join(os.path.dirname(__file__), '..', '..', 'databases', 'synapselLog_latlong.db')
+db_path = os.path.abspath(db_path)
+
+print(f"📂 Banco de dados: {db_path}")
+print(f"✓ Banco existe: {os.path.exists(db_path)}")
+
+try:
+    # Conecta ao banco
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    # Verifica tabelas existentes
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    tables = [row[0] for row in cursor.fetchall()]
+    print(f"\n📊 Tabelas encontradas: {tables}")
+    
+    if 'latlong_data' not in tables:
+        print("\n⚠️ Tabela latlong_data não existe! Rode scripts/setup/init_multiple_dbs.py primeiro.")
+    else:
+        cursor.execute("PRAGMA table_info(latlong_data)")
+        columns = [row[1] for row in cursor.fetchall()]
+        print(f"\n📋 Colunas existentes: {columns}")
+        
+        if 'range_km' in columns:
+            print("\n✓ Coluna range_km já existe!")
+        else:
+            print("\n➕ Adicionando coluna range_km...")
+            cursor.execute("ALTER TABLE latlong_data ADD COLUMN range_km REAL")
+            conn.commit()
+            print("✅ Coluna range_km adicionada!")
+    
+    conn.close()
+    print("\n✅ Script executado com sucesso!")
+    
+except Exception as e:
+    print(f"\n❌ Erro: {e}")
+    import traceback
+    traceback.print_exc()
@@ -0,0 +1,62 @@
+"""
+Script para adicionar as colunas de métricas de roteirização na tabela ndbout_data
+
+Cada roteirização calculada grava uma linha por grupo/dia em ndbout_data
+(ml/route_metrics.py) para acompanhar a qualidade dos planos ao longo do tempo.
+Linhas antigas ficam com as colunas novas vazias.
+"""
+import sqlite3
+import os
+
+# Caminho do banco de dados
+db_path = os.path.join(os.path.dirname(__file__), '..', '..', 'databases', 'synapselLog_neuraldatabaserout.db')
+db_path = os.path.abspath(db_path)
+
+NEW_COLUMNS = [
+    ('user_id', 'INTEGER'),
+    ('plan_key', 'VARCHAR(40)'),
+    ('depot_id', 'INTEGER'),
+    ('intra_cluster_km', 'FLOAT'),
+    ('centroid_spread_km', 'FLOAT'),
+    ('depot_distance_km', 'FLOAT'),
+]
+
+print(f"📂 Banco de dados: {db_path}")
+print(f"✓ Banco existe: {os.path.exists(db_path)}")
+
+try:
+    # Conecta ao banco
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    # Verifica tabelas existentes
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    tables = [row[0] for row in cursor.fetchall()]
+    print(f"\n📊 Tabelas encontradas: {tables}")
+    
+    if 'ndbout_data' not in tables:
+        print("\n⚠️ Tabela ndbout_data não existe! Rode scripts/setup/init_multiple_dbs.py primeiro.")
+    else:
+        cursor.execute("PRAGMA table_info(ndbout_data)")
+        columns = [row[1] for row in cursor.fetchall()]
+        print(f"\n📋 Colunas existentes: {columns}")
+        
+        for name, sql_type in NEW_COLUMNS:
+            if name in columns:
+                print(f"✓ Coluna {name} já existe!")
+            else:
+                print(f"➕ Adicionando coluna {name}...")
+                cursor.execute(f"ALTER TABLE ndbout_data ADD COLUMN {name} {sql_type}")
+        
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_ndbout_data_user_id ON ndbout_data (user_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_ndbout_data_plan_key ON ndbout_data (plan_key)")
+        conn.commit()
+        print("✅ Colunas de métricas prontas!")
+    
+    conn.close()
+    print("\n✅ Script executado com sucesso!")
+    
+except Exception as e:
+    print(f"\n❌ Erro: {e}")
+    import traceback
+    traceback.print_exc()
@@ -0,0 +1,63 @@
+"""
+Script para adicionar as colunas de geometria compilada (WKB + bbox + versões simplificadas) na tabela polygon_data
+
+As colunas são preenchidas automaticamente no primeiro carregamento das áreas
+de cada usuário (ml/spatial_index.py -> load_user_polygons).
+"""
+import sqlite3
+import os
+
+# Caminho do banco de dados
+db_path = os.path.join(os.path.dirname(__file__), '..', '..', 'databases', 'synapselLog_polygon.db')
+db_path = os.path.abspath(db_path)
+
+NEW_COLUMNS = [
+    ('geometry_wkb', 'BLOB'),
+    ('bbox_min_lat', 'FLOAT'),
+    ('bbox_max_lat', 'FLOAT'),
+    ('bbox_min_lng', 'FLOAT'),
+    ('bbox_max_lng', 'FLOAT'),
+    ('geometry_simplified', 'JSON'),
+    ('geometry_version', 'INTEGER'),
+]
+
+print(f"📂 Banco de dados: {db_path}")
+print(f"✓ Banco existe: {os.path.exists(db_path)}")
+
+try:
+    # Conecta ao banco
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    # Verifica tabelas existentes
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    tables = [row[0] for row in cursor.fetchall()]
+    print(f"\n📊 Tabelas encontradas: {tables}")
+    
+    if 'polygon_data' not in tables:
+        print("\n⚠️ Tabela polygon_data não existe! Rode scripts/setup/add_column_polygon.py primeiro.")
+    else:
+        cursor.execute("PRAGMA table_info(polygon_data)")
+        columns = [row[1] for row in cursor.fetchall()]
+        print(f"\n📋 Colunas existentes: {columns}")
+        
+        for name, sql_type in NEW_COLUMNS:
+            if name in columns:
+                print(f"✓ Coluna {name} já existe!")
+            else:
+                print(f"➕ Adicionando coluna {name}...")
+                cursor.execute(f"ALTER TABLE polygon_data ADD COLUMN {name} {sql_type}")
+        conn.commit()
+        
+        # Verifica novamente
+        cursor.execute("PRAGMA table_info(polygon_data)")
+        columns_after = [row[1] for row in cursor.fetchall()]
+        print(f"\n📋 Colunas após modificação: {columns_after}")
+    
+    conn.close()
+    print("\n✅ Script executado com sucesso!")
+    
+except Exception as e:
+    print(f"\n❌ Erro: {e}")
+    import traceback
+    traceback.print_exc()
@@ -0,0 +1,65 @@
+"""
+Script para criar a tabela routing_jobs_data no banco de rotas
+
+A tabela guarda estado, progresso e resultado das roteirizações executadas em
+segundo plano (/autenticado/roteirizacao/processar com async=true).
+Em bancos que já têm a tabela, adiciona a coluna heartbeat_at se faltar.
+"""
+import sqlite3
+import os
+
+# Caminho do banco de dados
+db_path = os.path.join(os.path.dirname(__file__), '..', '..', 'databases', 'synapselLog_routs.db')
+db_path = os.path.abspath(db_path)
+
+print(f"📂 Banco de dados: {db_path}")
+print(f"✓ Banco existe: {os.path.exists(db_path)}")
+
+try:
+    # Conecta ao banco (cria o arquivo se necessário)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    tables = [row[0] for row in cursor.fetchall()]
+    print(f"\n📊 Tabelas encontradas: {tables}")
+    
+    if 'routing_jobs_data' in tables:
+        print("\n✓ Tabela routing_jobs_data já existe!")
+        cursor.execute("PRAGMA table_info(routing_jobs_data)")
+        columns = [row[1] for row in cursor.fetchall()]
+        if 'heartbeat_at' not in columns:
+            print("➕ Adicionando coluna heartbeat_at...")
+            cursor.execute("ALTER TABLE routing_jobs_data ADD COLUMN heartbeat_at DATETIME")
+            conn.commit()
+            print("✅ Coluna heartbeat_at adicionada!")
+    else:
+        print("\n➕ Criando tabela routing_jobs_data...")
+        cursor.execute("""
+            CREATE TABLE routing_jobs_data (
+                id VARCHAR(36) NOT NULL PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                status VARCHAR(20) NOT NULL,
+                progress FLOAT NOT NULL,
+                message VARCHAR(200),
+                params TEXT,
+                result TEXT,
+                error TEXT,
+                status_code INTEGER,
+                created_at DATETIME,
+                started_at DATETIME,
+                finished_at DATETIME,
+                heartbeat_at DATETIME
+            )
+        """)
+        cursor.execute("CREATE INDEX ix_routing_jobs_data_user_id ON routing_jobs_data (user_id)")
+        conn.commit()
+        print("✅ Tabela routing_jobs_data criada!")
+    
+    conn.close()
+    print("\n✅ Script executado com sucesso!")
+    
+except Exception as e:
+    print(f"\n❌ Erro: {e}")
+    import traceback
+    traceback.print_exc()
@@ -2,3 +2,13 @@
 Suite de testes v1 para SynapseLog
 Testes unitários e de integração para o sistema de roteirização
 """
+
+import atexit
+import os
+import shutil
+import tempfile
+
+# Cache em disco das matrizes de distância (ml/distance_matrix.py) fora da árvore do repositório
+if 'DISTANCE_CACHE_DIR' not in os.environ:
+    os.environ['DISTANCE_CACHE_DIR'] = tempfile.mkdtemp(prefix='synapselog-distance-cache-')
+    atexit.register(shutil.rmtree, os.environ['DISTANCE_CACHE_DIR'], ignore_errors=True)
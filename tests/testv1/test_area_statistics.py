@@ -0,0 +1,102 @@
+"""
+Testes para as estatísticas de vendas por área (ml/area_statistics.py)
+"""
+import unittest
+from datetime import datetime
+from flask import Flask
+
+from config import Config
+from base.models import db, LatLong, OrderHistory
+from ml.spatial_index import PolygonIndex
+from ml.area_statistics import get_area_statistics, aggregate_sales_by_client, summarize
+
+
+SQUARE = [[-15.7, -47.9], [-15.7, -47.8], [-15.8, -47.8], [-15.8, -47.9], [-15.7, -47.9]]
+EAST = [[-15.7, -47.8], [-15.7, -47.7], [-15.8, -47.7], [-15.8, -47.8], [-15.7, -47.8]]
+EMPTY = [[-10.0, -40.0], [-10.0, -39.9], [-10.1, -39.9], [-10.1, -40.0], [-10.0, -40.0]]
+
+
+class TestAreaStatistics(unittest.TestCase):
+    """Testes com bancos SQLite em memória"""
+
+    def setUp(self):
+        """Cria app com todos os binds em memória, clientes e vendas"""
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        self.app.config['SQLALCHEMY_BINDS'] = {key: 'sqlite://' for key in Config.SQLALCHEMY_BINDS}
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        db.session.add_all([
+            LatLong(id=1, id_user=1, hash_client='a', latitude=-15.75, longitude=-47.85, user_point=False),
+            LatLong(id=2, id_user=1, hash_client='b', latitude=-15.72, longitude=-47.88, user_point=False),
+            LatLong(id=3, id_user=1, hash_client='c', latitude=-15.75, longitude=-47.75, user_point=False),
+            LatLong(id=4, id_user=1, hash_client='d', latitude=-15.74, longitude=-47.86, user_point=False),
+        ])
+        db.session.add_all([
+            OrderHistory(id_pedido='p1', id_unico_cliente='a', hash_cliente='a', user_id=1,
+                         valor_total_pagamento=100.0, data_compra=datetime(2024, 1, 10)),
+            OrderHistory(id_pedido='p2', id_unico_cliente='a', hash_cliente='a', user_id=1,
+                         valor_total_pagamento=None, data_compra=datetime(2024, 3, 5)),
+            OrderHistory(id_pedido='p3', id_unico_cliente='b', hash_cliente='b', user_id=1,
+                         valor_total_pagamento=50.0, data_compra=datetime(2024, 2, 1)),
+            OrderHistory(id_pedido='p4', id_unico_cliente='c', hash_cliente='c', user_id=1,
+                         valor_total_pagamento=30.0, data_compra=datetime(2023, 12, 24)),
+            # Venda de outro usuário com o mesmo hash não entra
+            OrderHistory(id_pedido='p5', id_unico_cliente='a', hash_cliente='a', user_id=2,
+                         valor_total_pagamento=999.0, data_compra=datetime(2025, 1, 1)),
+        ])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_statistics_for_all_areas(self):
+        """Testa estatísticas de todas as áreas em uma chamada"""
+        index = PolygonIndex([
+            {'id': 10, 'coordinates': SQUARE},
+            {'id': 20, 'coordinates': EAST},
+            {'id': 30, 'coordinates': EMPTY}
+        ])
+
+        stats = get_area_statistics(1, index)
+
+        self.assertEqual(set(stats), {10, 20, 30})
+        self.assertEqual(stats[10]['clientes_na_area'], 3)
+        self.assertEqual(stats[10]['total_clientes'], 2)
+        self.assertEqual(stats[10]['total_pedidos'], 3)
+        self.assertAlmostEqual(stats[10]['valor_total'], 150.0)
+        self.assertAlmostEqual(stats[10]['ticket_medio'], 75.0)
+        self.assertEqual(stats[10]['ultima_compra'], '05/03/2024')
+
+        self.assertEqual(stats[20]['total_pedidos'], 1)
+        self.assertEqual(stats[20]['ultima_compra'], '24/12/2023')
+
+        self.assertEqual(stats[30]['total_clientes'], 0)
+        self.assertIsNone(stats[30]['ultima_compra'])
+
+    def test_statistics_subset_of_areas(self):
+        """Testa filtro por IDs (IDs desconhecidos são ignorados)"""
+        index = PolygonIndex([{'id': 10, 'coordinates': SQUARE}, {'id': 20, 'coordinates': EAST}])
+
+        stats = get_area_statistics(1, index, [20, 99])
+
+        self.assertEqual(list(stats), [20])
+        self.assertAlmostEqual(stats[20]['valor_total'], 30.0)
+
+    def test_summarize_hash_list(self):
+        """Testa o resumo a partir de uma lista de hashes (endpoint antigo)"""
+        stats = summarize(['a', 'c', 'x'], aggregate_sales_by_client(1))
+
+        self.assertEqual(stats['total_clientes'], 2)
+        self.assertEqual(stats['total_pedidos'], 3)
+        self.assertAlmostEqual(stats['valor_total'], 130.0)
+        self.assertAlmostEqual(stats['ticket_medio'], 65.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+"""
+Testes para o lote colunar de clientes (ml/client_batch.py)
+"""
+import unittest
+
+import numpy as np
+
+from ml.client_batch import ClientBatch, MISSING_ID
+from ml.depots import DepotIndex
+from ml.route_cache import routing_fingerprint
+from ml.route_optimizer import create_routes_knn
+
+
+ROWS = [
+    (1, -15.75, -47.85, 'a'),
+    (2, -15.72, -47.88, 'b'),
+    (3, -15.70, -47.80, 'c'),
+]
+
+DEPOTS = [
+    {'id': 7, 'name': 'Centro', 'lat': -15.79, 'lng': -47.88, 'range_km': 20},
+]
+
+
+def _grid_rows(n):
+    return [(i + 1, -15.71 - 0.008 * (i % 10), -47.81 - 0.008 * (i // 10), f'h{i}') for i in range(n)]
+
+
+class TestClientBatch(unittest.TestCase):
+    """Testes de construção, seleção e materialização do lote"""
+
+    def test_from_rows(self):
+        """Testa colunas a partir das tuplas do banco"""
+        batch = ClientBatch.from_rows(ROWS)
+
+        self.assertEqual(len(batch), 3)
+        self.assertEqual(list(batch.ids), [1, 2, 3])
+        self.assertEqual(batch.coordinates.shape, (3, 2))
+        self.assertTrue((batch.polygon_ids == MISSING_ID).all())
+        self.assertEqual(len(ClientBatch.from_rows([])), 0)
+
+    def test_select_polygons(self):
+        """Testa filtro por área mantendo a ordem do lote; área sobreposta fica com o último par"""
+        batch = ClientBatch.from_rows(ROWS)
+
+        selected = batch.select_polygons([(3, 10), (1, 10), (1, 20)])
+
+        self.assertEqual(list(selected.ids), [1, 3])
+        self.assertEqual(list(selected.polygon_ids), [20, 10])
+        self.assertEqual(len(batch.select_polygons([])), 0)
+
+    def test_to_records(self):
+        """Testa dicts no formato do route_optimizer"""
+        batch = ClientBatch.from_rows(ROWS).select_polygons([(1, 10), (2, 10)])
+
+        records = batch.to_records([1])
+
+        self.assertEqual(records, [{'hash_client': 'b', 'name': 'Cliente sem nome', 'lat': -15.72,
+                                    'lng': -47.88, 'id': 2, 'polygon_id': 10}])
+
+    def test_records_round_trip(self):
+        """Testa que um lote criado de dicts devolve os próprios dicts"""
+        clients = [{'hash_client': 'x', 'lat': -15.7, 'lng': -47.8, 'extra': 1}]
+        batch = ClientBatch.from_records(clients)
+
+        self.assertIs(batch.to_records()[0], clients[0])
+        self.assertEqual(batch.ids[0], MISSING_ID)
+
+    def test_center(self):
+        """Testa centroide das posições"""
+        center = ClientBatch.from_rows(ROWS).center([0, 1])
+
+        self.assertAlmostEqual(center['lat'], -15.735)
+        self.assertAlmostEqual(center['lng'], -47.865)
+        self.assertEqual(ClientBatch.empty().center(), {'lat': 0, 'lng': 0})
+
+    def test_set_scores(self):
+        """Testa junção vetorizada dos scores pelo hash; sem score fica NaN"""
+        batch = ClientBatch.from_rows(ROWS)
+
+        batch.set_scores(['c', 'a', 'c', 'x'], [10.0, 80.0, 30.0, 99.0])
+
+        self.assertEqual(batch.scores[0], 80.0)
+        self.assertTrue(np.isnan(batch.scores[1]))
+        self.assertEqual(batch.scores[2], 30.0)
+
+        batch.set_scores([], [])
+        self.assertTrue(np.isnan(batch.scores).all())
+
+    def test_assign_batch(self):
+        """Testa atribuição de ponto de saída nas colunas do lote"""
+        batch = ClientBatch.from_rows(ROWS + [(4, -15.30, -47.50, 'longe')])
+
+        unassigned = DepotIndex(DEPOTS).assign_batch(batch, respect_range=True)
+
+        self.assertEqual(list(unassigned), [3])
+        self.assertEqual(list(batch.depot_ids), [7, 7, 7, MISSING_ID])
+        self.assertIsNone(batch.to_records([3])[0]['depot_id'])
+
+
+class TestRoutesFromBatch(unittest.TestCase):
+    """Testes da roteirização sobre o lote"""
+
+    def test_same_groups_as_records(self):
+        """Testa que lote e lista de dicts geram os mesmos grupos"""
+        batch = ClientBatch.from_rows(_grid_rows(60))
+        records = batch.to_records()
+
+        from_batch = create_routes_knn(batch, n_days=3, max_clients_per_day=12)
+        from_records = create_routes_knn(records, n_days=3, max_clients_per_day=12)
+
+        self.assertEqual([[c['id'] for c in g['clients']] for g in from_batch],
+                         [[c['id'] for c in g['clients']] for g in from_records])
+        self.assertTrue(all(g['total_clients'] <= 12 for g in from_batch))
+        self.assertTrue(all(isinstance(g['clients'][0], dict) for g in from_batch))
+
+    def test_fingerprint_matches_records(self):
+        """Testa que a impressão digital não depende do formato dos clientes"""
+        batch = ClientBatch.from_rows(ROWS).select_polygons([(1, 10), (2, 10), (3, 10)])
+        polygons = [{'id': 10, 'geometry_version': 1}]
+        params = {'dias': 3}
+
+        self.assertEqual(routing_fingerprint(batch, polygons, params),
+                         routing_fingerprint(batch.to_records(), polygons, params))
+
+    def test_batch_with_depots(self):
+        """Testa agrupamento por ponto de saída a partir das colunas do lote"""
+        batch = ClientBatch.from_rows(_grid_rows(30))
+        DepotIndex(DEPOTS).assign_batch(batch)
+
+        groups = create_routes_knn(batch, n_days=2, depots=DEPOTS)
+
+        self.assertEqual(sum(g['total_clients'] for g in groups), 30)
+        self.assertTrue(all(g['depot']['id'] == 7 for g in groups))
+        self.assertTrue(np.array_equal(batch.depot_ids, np.full(30, 7)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+"""
+Testes para o registro de algoritmos de agrupamento (ml/clustering.py)
+"""
+import os
+import subprocess
+import sys
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from ml import clustering
+from ml.clustering import (
+    ALGORITHM_AUTO, ALGORITHM_BALANCED, ALGORITHM_GRID, ALGORITHM_KMEANS, ALGORITHM_MINIBATCH,
+    ALGORITHMS, available_algorithms, choose_algorithm, collapse_duplicates, get_algorithm
+)
+from ml.route_optimizer import create_routes_knn, format_result_for_api
+from ml.routing_service import RoutingError, validate_routing_params
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _coordinates(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.column_stack([rng.normal(-15.8, 0.05, n), rng.normal(-47.9, 0.05, n)])
+
+
+class TestRegistry(unittest.TestCase):
+    """Testes das entradas do registro e da escolha automática"""
+
+    def test_entries(self):
+        """Testa algoritmos registrados, com complexidade declarada"""
+        self.assertEqual(set(ALGORITHMS), {ALGORITHM_KMEANS, ALGORITHM_MINIBATCH, ALGORITHM_GRID, ALGORITHM_BALANCED})
+        self.assertEqual(available_algorithms()[0], ALGORITHM_AUTO)
+        self.assertTrue(all(a.complexity.startswith('O(') for a in ALGORITHMS.values()))
+        self.assertTrue(ALGORITHMS[ALGORITHM_BALANCED].capacitated)
+
+    def test_balanced_registered_by_clustering(self):
+        """Testa que o registro de ml/clustering.py já traz 'balanced', sem importar o route_optimizer"""
+        code = ("import sys, ml.clustering as c; "
+                "assert 'ml.route_optimizer' not in sys.modules; assert c.ALGORITHM_BALANCED in c.ALGORITHMS")
+        subprocess.run([sys.executable, '-c', code], check=True, cwd=ROOT)
+
+    def test_balanced_fit_contract(self):
+        """Testa fit(coordinates, n_clusters, sample_weight=None) do algoritmo balanceado"""
+        labels = ALGORITHMS[ALGORITHM_BALANCED].fit(_coordinates(103), 5)
+
+        self.assertEqual(labels.shape, (103,))
+        self.assertLessEqual(np.bincount(labels).max(), 21)
+        np.testing.assert_array_equal(ALGORITHMS[ALGORITHM_BALANCED].fit(_coordinates(103), 5, np.ones(103)), labels)
+        with self.assertRaises(ValueError):
+            ALGORITHMS[ALGORITHM_BALANCED].fit(_coordinates(103), 5, np.full(103, 2.0))
+
+    def test_auto_by_size(self):
+        """Testa escolha pelo número de clientes"""
+        self.assertEqual(choose_algorithm(1000, 5), ALGORITHM_KMEANS)
+        with patch.object(clustering, 'MINIBATCH_MIN_POINTS', 500):
+            self.assertEqual(choose_algorithm(1000, 5), ALGORITHM_MINIBATCH)
+
+    def test_auto_by_time_budget(self):
+        """Testa troca pelo mais barato quando a estimativa passa do tempo limite"""
+        n, k = 40000, 30
+        budget = ALGORITHMS[ALGORITHM_MINIBATCH].estimate_seconds(n, k) * 1.01
+        self.assertEqual(choose_algorithm(n, k, time_budget=budget), ALGORITHM_MINIBATCH)
+        self.assertEqual(choose_algorithm(n, k, time_budget=1e-9), ALGORITHM_GRID)
+
+    def test_unknown(self):
+        """Testa erro para nome fora do registro"""
+        with self.assertRaises(ValueError):
+            get_algorithm('outro')
+
+    def test_grid_weights_cells(self):
+        """Testa que pontos da mesma célula recebem o mesmo rótulo"""
+        coordinates = np.repeat(_coordinates(40), 3, axis=0)
+
+        labels = ALGORITHMS[ALGORITHM_GRID].fit(coordinates, 4)
+
+        self.assertEqual(labels.shape, (120,))
+        self.assertTrue((labels.reshape(-1, 3) == labels[::3, None]).all())
+        self.assertLessEqual(len(set(labels)), 4)
+
+
+class TestCollapseDuplicates(unittest.TestCase):
+    """Testes da união de coordenadas repetidas em pontos com peso"""
+
+    def test_exact(self):
+        """Testa coordenadas idênticas"""
+        coordinates = np.array([[-15.8, -47.9], [-15.7, -47.8], [-15.8, -47.9]])
+
+        points, weights, inverse = collapse_duplicates(coordinates, 0)
+
+        self.assertEqual(len(points), 2)
+        self.assertEqual(sorted(weights), [1.0, 2.0])
+        np.testing.assert_array_equal(points[inverse], coordinates)
+
+    def test_epsilon(self):
+        """Testa união de pontos a poucos metros com epsilon em km"""
+        coordinates = np.array([[-15.80000, -47.90000], [-15.80001, -47.90001], [-15.70, -47.80]])
+
+        points, weights, inverse = collapse_duplicates(coordinates, 0.5)
+
+        self.assertEqual(len(points), 2)
+        self.assertEqual(inverse[0], inverse[1])
+        self.assertEqual(weights[inverse[0]], 2.0)
+        self.assertAlmostEqual(points[inverse[0]][0], -15.800005)
+
+
+class TestRoutesWithAlgorithm(unittest.TestCase):
+    """Testes da roteirização com algoritmo escolhido"""
+
+    def test_grid_respects_limit(self):
+        """Testa pré-agrupamento em grade seguido do filtro de tamanho"""
+        clients = [{'hash_client': f'h{i}', 'lat': lat, 'lng': lng} for i, (lat, lng) in enumerate(_coordinates(200))]
+
+        groups = create_routes_knn(clients, n_days=4, max_clients_per_day=30, clustering=ALGORITHM_GRID, sequence=False)
+
+        self.assertEqual(sum(g['total_clients'] for g in groups), 200)
+        self.assertLessEqual(max(g['total_clients'] for g in groups), 30)
+        self.assertEqual({g['algorithm'] for g in groups}, {ALGORITHM_GRID})
+        self.assertEqual(format_result_for_api(groups)['total_clients'], 200)
+
+    def test_invalid_algorithm(self):
+        """Testa erro em create_routes_knn"""
+        with self.assertRaises(ValueError):
+            create_routes_knn([{'lat': -15.8, 'lng': -47.9}], n_days=1, clustering='outro')
+
+    def test_params(self):
+        """Testa o parâmetro algoritmo de /processar"""
+        base = {'dias': 3, 'grupos_selecionados': [1]}
+
+        self.assertEqual(validate_routing_params(base)['algoritmo'], ALGORITHM_AUTO)
+        self.assertEqual(validate_routing_params(dict(base, agrupamento='balanced'))['algoritmo'], ALGORITHM_BALANCED)
+        self.assertEqual(validate_routing_params(dict(base, algoritmo='grid', tempo_limite_s=5))['tempo_limite_s'], 5.0)
+        for extra in ({'algoritmo': 'outro'}, {'tempo_limite_s': 0}, {'tempo_limite_s': 'rápido'}):
+            with self.assertRaises(RoutingError):
+                validate_routing_params(dict(base, **extra))
+
+
+if __name__ == '__main__':
+    unittest.main()
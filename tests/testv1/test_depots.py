@@ -0,0 +1,149 @@
+"""
+Testes para a atribuição de clientes ao ponto de saída mais próximo (ml/depots.py)
+"""
+import unittest
+from unittest.mock import patch
+
+from ml import route_optimizer
+from ml.depots import DepotIndex
+from ml.route_optimizer import create_routes_knn, format_result_for_api, _split_days_by_depot
+
+
+# Dois pontos de saída ~50 km um do outro (Brasília e Planaltina)
+DEPOTS = [
+    {'id': 1, 'name': 'Centro', 'lat': -15.79, 'lng': -47.88, 'range_km': 10},
+    {'id': 2, 'name': 'Norte', 'lat': -15.45, 'lng': -47.61, 'range_km': None},
+]
+
+
+def _clients_around(lat, lng, n, prefix):
+    return [
+        {'hash_client': f'{prefix}{i}', 'lat': lat + 0.005 * (i % 5), 'lng': lng + 0.005 * (i // 5)}
+        for i in range(n)
+    ]
+
+
+class TestDepotIndex(unittest.TestCase):
+    """Testes da BallTree (haversine) sobre os pontos de saída"""
+
+    def test_nearest_depot(self):
+        """Testa atribuição ao ponto mais próximo e distância em km"""
+        index = DepotIndex(DEPOTS)
+
+        positions, distances = index.nearest([-15.78, -15.46], [-47.87, -47.60])
+
+        self.assertEqual(list(positions), [0, 1])
+        # 0.01° em lat e lng ≈ 1.5 km
+        self.assertAlmostEqual(distances[0], 1.52, delta=0.05)
+
+    def test_respect_range(self):
+        """Testa fallback para o ponto que cobre o cliente quando o mais próximo não cobre"""
+        index = DepotIndex(DEPOTS)
+        # ~20 km do Centro (fora dos 10 km), ~35 km do Norte (sem limite)
+        lat, lng = -15.62, -47.80
+
+        positions, _ = index.nearest([lat], [lng])
+        self.assertEqual(positions[0], 0)
+
+        positions, distances = index.nearest([lat], [lng], respect_range=True)
+        self.assertEqual(positions[0], 1)
+        self.assertGreater(distances[0], 10)
+
+    def test_out_of_every_range(self):
+        """Testa cliente fora do raio de todos os pontos de saída"""
+        index = DepotIndex([dict(d, range_km=5) for d in DEPOTS])
+        clients = [{'lat': -15.62, 'lng': -47.80}, {'lat': -15.79, 'lng': -47.88}]
+
+        unassigned = index.assign_clients(clients, respect_range=True)
+
+        self.assertEqual(unassigned, [clients[0]])
+        self.assertIsNone(clients[0]['depot_id'])
+        self.assertEqual(clients[1]['depot_id'], 1)
+
+    def test_no_depots(self):
+        """Testa índice vazio"""
+        positions, _ = DepotIndex([]).nearest([-15.0], [-47.0])
+        self.assertEqual(list(positions), [-1])
+
+
+class TestRoutesByDepot(unittest.TestCase):
+    """Testes da roteirização separada por ponto de saída"""
+
+    def test_split_days_proportional(self):
+        """Testa divisão dos dias proporcional aos clientes"""
+        self.assertEqual(_split_days_by_depot({1: 30, 2: 10}, 4), {1: 3, 2: 1})
+        self.assertEqual(_split_days_by_depot({1: 100, 2: 1}, 3), {1: 2, 2: 1})
+
+    def test_split_days_total(self):
+        """Testa que o total é sempre n_days, mesmo com vários pontos pequenos"""
+        counts = {1: 1000, 2: 1, 3: 1, 4: 1, 5: 1}
+        for n_days in range(5, 12):
+            days = _split_days_by_depot(counts, n_days)
+            self.assertEqual(sum(days.values()), n_days)
+            self.assertTrue(all(d >= 1 for d in days.values()))
+        self.assertEqual(_split_days_by_depot(counts, 5), {1: 1, 2: 1, 3: 1, 4: 1, 5: 1})
+
+    def test_split_days_fewer_than_depots(self):
+        """Testa erro quando não há um dia para cada ponto de saída"""
+        with self.assertRaises(ValueError):
+            _split_days_by_depot({1: 10, 2: 10, 3: 10}, 2)
+
+    def test_routes_start_from_assigned_depot(self):
+        """Testa que cada rota só contém clientes do seu ponto de saída"""
+        clients = _clients_around(-15.78, -47.87, 20, 'c') + _clients_around(-15.46, -47.60, 10, 'n')
+        DepotIndex(DEPOTS).assign_clients(clients)
+
+        groups = create_routes_knn(clients, n_days=3, depots=DEPOTS)
+
+        # Dias numerados em sequência entre os pontos de saída
+        self.assertEqual([g['day'] for g in groups], list(range(1, len(groups) + 1)))
+        self.assertEqual(sum(g['total_clients'] for g in groups), 30)
+        for group in groups:
+            depot_ids = {c['depot_id'] for c in group['clients']}
+            self.assertEqual(depot_ids, {group['depot']['id']})
+        self.assertEqual({g['depot']['id'] for g in groups}, {1, 2})
+
+    def test_depots_planned_in_parallel(self):
+        """Testa que o planejamento paralelo por ponto de saída gera o mesmo calendário"""
+        clients = _clients_around(-15.78, -47.87, 25, 'c') + _clients_around(-15.46, -47.60, 15, 'n')
+        DepotIndex(DEPOTS).assign_clients(clients)
+
+        sequential = create_routes_knn(clients, n_days=4, max_clients_per_day=10, depots=DEPOTS, depot_workers=0)
+        parallel = create_routes_knn(clients, n_days=4, max_clients_per_day=10, depots=DEPOTS, depot_workers=2)
+
+        summary = lambda groups: [(g['day'], g['depot']['id'], [c['hash_client'] for c in g['clients']]) for g in groups]
+        self.assertEqual(summary(parallel), summary(sequential))
+
+    def test_parallel_depots_limit_threads(self):
+        """Testa que os núcleos são repartidos entre as threads (BLAS no pool, OpenMP em cada thread)"""
+        clients = _clients_around(-15.78, -47.87, 25, 'c') + _clients_around(-15.46, -47.60, 15, 'n')
+        DepotIndex(DEPOTS).assign_clients(clients)
+        calls = []
+        original = route_optimizer.threadpool_limits
+
+        def spy(limits=None, user_api=None):
+            calls.append((limits, user_api))
+            return original(limits=limits, user_api=user_api)
+
+        with patch.object(route_optimizer.os, 'cpu_count', return_value=8), \
+                patch.object(route_optimizer, 'threadpool_limits', spy):
+            create_routes_knn(clients, n_days=4, max_clients_per_day=10, depots=DEPOTS, depot_workers=4)
+
+        # 2 pontos de saída → 2 threads com 8 // 2 núcleos cada
+        self.assertEqual(sorted(calls), [(4, 'blas'), (4, 'openmp'), (4, 'openmp')])
+
+    def test_depot_distance_reported(self):
+        """Testa distância do ponto de saída ao centro de cada grupo"""
+        clients = _clients_around(-15.46, -47.60, 10, 'n')
+        DepotIndex(DEPOTS).assign_clients(clients)
+
+        groups = create_routes_knn(clients, n_days=1, depots=DEPOTS)
+
+        # Centro a ~0.01° do ponto Norte ≈ 1.5 km
+        self.assertAlmostEqual(groups[0]['depot_distance_km'], 1.5, delta=0.5)
+        self.assertEqual(format_result_for_api(groups)['groups'][0]['depot_distance_km'],
+                         groups[0]['depot_distance_km'])
+
+
+if __name__ == '__main__':
+    unittest.main()
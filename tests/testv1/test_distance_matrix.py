@@ -0,0 +1,157 @@
+"""
+Testes para a matriz de distâncias haversine com cache (ml/distance_matrix.py)
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+
+from ml import distance_matrix
+from ml.distance_matrix import (
+    haversine_matrix, coordinates_key, DistanceMatrixCache, path_length_km, annotate_route_distances
+)
+
+
+# Brasília → Goiânia ≈ 177.84 km; Brasília → São Paulo ≈ 872.34 km
+LATS = [-15.7939, -16.6869, -23.5505]
+LNGS = [-47.8828, -49.2648, -46.6333]
+
+
+class TestHaversineMatrix(unittest.TestCase):
+    """Testes do cálculo vetorizado"""
+
+    def test_known_distances(self):
+        """Testa distâncias conhecidas e simetria"""
+        matrix = haversine_matrix(LATS, LNGS)
+
+        self.assertEqual(matrix.dtype, np.float32)
+        self.assertEqual(matrix.shape, (3, 3))
+        self.assertAlmostEqual(float(matrix[0, 1]), 177.84, delta=0.01)
+        self.assertAlmostEqual(float(matrix[0, 2]), 872.34, delta=0.01)
+        np.testing.assert_allclose(matrix, matrix.T, rtol=1e-5)
+        np.testing.assert_array_equal(np.diag(matrix), 0)
+
+    def test_blocks_match_single_pass(self):
+        """Testa que o cálculo em blocos dá o mesmo resultado"""
+        rng = np.random.default_rng(0)
+        lats = rng.uniform(-16, -15, 50)
+        lngs = rng.uniform(-48, -47, 50)
+
+        np.testing.assert_allclose(
+            haversine_matrix(lats, lngs, block_rows=7), haversine_matrix(lats, lngs, block_rows=1000)
+        )
+
+    def test_rectangular(self):
+        """Testa matriz ponto de saída x clientes"""
+        matrix = haversine_matrix(LATS[:1], LNGS[:1], LATS, LNGS)
+
+        self.assertEqual(matrix.shape, (1, 3))
+        self.assertAlmostEqual(float(matrix[0, 0]), 0.0, places=3)
+
+
+class TestDistanceMatrixCache(unittest.TestCase):
+    """Testes do cache em disco"""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_disk_cache_reused(self):
+        """Testa gravação em disco e leitura por outra instância"""
+        DistanceMatrixCache(self.cache_dir, min_disk_cells=0).get(LATS, LNGS)
+        key = coordinates_key(LATS, LNGS)
+        self.assertTrue(os.path.exists(os.path.join(self.cache_dir, f'{key}.npy')))
+
+        # Arquivo adulterado prova que a segunda instância lê do disco
+        np.save(os.path.join(self.cache_dir, f'{key}.npy'), np.full((3, 3), 7, dtype=np.float32))
+        matrix = DistanceMatrixCache(self.cache_dir, min_disk_cells=0).get(LATS, LNGS)
+        self.assertEqual(float(matrix[0, 1]), 7.0)
+
+    def test_small_matrices_stay_in_memory(self):
+        """Testa que matrizes abaixo de min_disk_cells não geram arquivos"""
+        cache = DistanceMatrixCache(self.cache_dir, min_disk_cells=10)
+
+        cache.get(LATS, LNGS)
+
+        self.assertEqual(os.listdir(self.cache_dir), [])
+        self.assertIs(cache.get(LATS, LNGS), cache.get(LATS, LNGS))
+
+    def test_eviction_batched(self):
+        """Testa uma varredura da pasta a cada max_disk_bytes / EVICT_FRACTION bytes gravados"""
+        cache = DistanceMatrixCache(self.cache_dir, memory_size=0, min_disk_cells=0, max_disk_bytes=10 ** 6)
+        with patch.object(cache, '_evict') as evict:
+            for shift in range(20):
+                cache.get([lat + shift for lat in LATS], LNGS)
+        evict.assert_not_called()
+
+    def test_disk_limit_evicts_least_recent(self):
+        """Testa remoção do arquivo usado há mais tempo ao passar do limite em disco"""
+        sets = [(LATS, LNGS), (LATS[::-1], LNGS[::-1]), (LATS[1:] + LATS[:1], LNGS[1:] + LNGS[:1])]
+        paths = [os.path.join(self.cache_dir, f'{coordinates_key(lats, lngs)}.npy') for lats, lngs in sets]
+
+        cache = DistanceMatrixCache(self.cache_dir, memory_size=0, max_disk_bytes=400, min_disk_cells=0)
+        cache.get(*sets[0])
+        cache.get(*sets[1])
+        os.utime(paths[0], (1000, 1000))
+        os.utime(paths[1], (2000, 2000))
+
+        # Leitura renova o primeiro; o segundo passa a ser o menos usado
+        cache.get(*sets[0])
+        cache.get(*sets[2])
+
+        self.assertEqual([os.path.exists(p) for p in paths], [True, False, True])
+
+    def test_key_depends_on_coordinates(self):
+        """Testa chave diferente para outro conjunto de coordenadas"""
+        self.assertNotEqual(coordinates_key(LATS, LNGS), coordinates_key(LATS[:2], LNGS[:2]))
+        self.assertNotEqual(coordinates_key(LATS, LNGS), coordinates_key(LATS, LNGS, LATS, LNGS))
+
+
+class TestRouteDistances(unittest.TestCase):
+    """Testes das distâncias de rota"""
+
+    def test_path_length(self):
+        """Testa caminho aberto e fechado"""
+        matrix = haversine_matrix(LATS, LNGS)
+
+        open_path = path_length_km(matrix, [0, 1, 2])
+        self.assertAlmostEqual(open_path, float(matrix[0, 1]) + float(matrix[1, 2]), places=3)
+        self.assertAlmostEqual(path_length_km(matrix, [0, 1, 2], closed=True), open_path + float(matrix[2, 0]), places=3)
+        self.assertEqual(path_length_km(matrix, [1]), 0.0)
+
+    def test_annotate_group_with_depot(self):
+        """Testa seller_distance_km e sum_distance_km de um grupo"""
+        cache = DistanceMatrixCache(cache_dir=None)
+        group = {
+            'depot': {'id': 1, 'lat': LATS[0], 'lng': LNGS[0]},
+            'clients': [{'lat': LATS[1], 'lng': LNGS[1]}, {'lat': LATS[2], 'lng': LNGS[2]}]
+        }
+
+        annotate_route_distances(group, cache)
+
+        self.assertAlmostEqual(group['clients'][0]['seller_distance_km'], 177.84, delta=0.01)
+        matrix = haversine_matrix(LATS, LNGS)
+        expected = float(matrix[0, 1] + matrix[1, 2] + matrix[2, 0])
+        self.assertAlmostEqual(group['sum_distance_km'], expected, delta=0.01)
+
+
+    def test_large_route_without_matrix(self):
+        """Testa que rotas acima do limite da matriz dão o mesmo total por trechos consecutivos"""
+        cache = DistanceMatrixCache(cache_dir=None)
+        depot = {'id': 1, 'lat': LATS[0], 'lng': LNGS[0]}
+        clients = [{'lat': LATS[1], 'lng': LNGS[1]}, {'lat': LATS[2], 'lng': LNGS[2]}]
+
+        small = annotate_route_distances({'depot': depot, 'clients': [dict(c) for c in clients]}, cache)
+        with patch.object(distance_matrix, 'MAX_ROUTE_MATRIX_POINTS', 2):
+            large = annotate_route_distances({'depot': depot, 'clients': [dict(c) for c in clients]}, cache)
+
+        self.assertAlmostEqual(large['sum_distance_km'], small['sum_distance_km'], delta=0.01)
+        self.assertAlmostEqual(large['clients'][1]['seller_distance_km'], small['clients'][1]['seller_distance_km'], delta=0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,7 @@
 Testes para utilitários geográficos (ml/geo_utils.py)
 """
 import unittest
+import numpy as np
 from ml.geo_utils import GeoUtils
 
 
@@ -160,6 +161,189 @@ class TestFilterClientsByPolygons(unittest.TestCase):
         self.assertEqual(result[1], [])
 
 
+class TestVectorizedMembership(unittest.TestCase):
+    """Testes para o motor vetorizado de ponto-em-polígono"""
+    
+    def setUp(self):
+        """Define dois polígonos sobrepostos e pontos de teste"""
+        self.polygons = [
+            {
+                'id': 10,
+                'coordinates': [
+                    [-15.7, -47.9], [-15.7, -47.8], [-15.8, -47.8], [-15.8, -47.9], [-15.7, -47.9]
+                ]
+            },
+            {
+                'id': 20,
+                'coordinates': [
+                    [-15.75, -47.85], [-15.75, -47.7], [-15.9, -47.7], [-15.9, -47.85], [-15.75, -47.85]
+                ]
+            }
+        ]
+        self.lats = np.array([-15.72, -15.78, -15.85, -15.6, np.nan])
+        self.lngs = np.array([-47.88, -47.82, -47.75, -47.7, -47.85])
+    
+    def test_membership_matrix(self):
+        """Testa matriz de pertinência com polígonos sobrepostos"""
+        geometries = GeoUtils.prepare_polygon_geometries(self.polygons)
+        membership = GeoUtils.points_in_polygons(self.lats, self.lngs, geometries)
+        
+        self.assertEqual(membership.shape, (5, 2))
+        np.testing.assert_array_equal(membership[:, 0], [True, True, False, False, False])
+        np.testing.assert_array_equal(membership[:, 1], [False, True, True, False, False])
+    
+    def test_matches_point_in_polygon_fast(self):
+        """Testa se o motor vetorizado concorda com a verificação ponto a ponto"""
+        rng = np.random.default_rng(0)
+        lats = rng.uniform(-15.95, -15.65, 500)
+        lngs = rng.uniform(-47.95, -47.65, 500)
+        
+        geometries = GeoUtils.prepare_polygon_geometries(self.polygons)
+        membership = GeoUtils.points_in_polygons(lats, lngs, geometries)
+        
+        for j, poly in enumerate(self.polygons):
+            expected = [GeoUtils.point_in_polygon_fast(la, ln, poly['coordinates']) for la, ln in zip(lats, lngs)]
+            np.testing.assert_array_equal(membership[:, j], expected)
+    
+    def test_empty_points(self):
+        """Testa com arrays vazios"""
+        geometries = GeoUtils.prepare_polygon_geometries(self.polygons)
+        membership = GeoUtils.points_in_polygons([], [], geometries)
+        self.assertEqual(membership.shape, (0, 2))
+    
+    def test_invalid_polygon_is_skipped(self):
+        """Testa se polígono com menos de 3 coordenadas válidas é ignorado"""
+        geometries = GeoUtils.prepare_polygon_geometries([
+            {'id': 1, 'coordinates': [[-15.7, -47.9], ['x', None]]}
+        ])
+        self.assertEqual(geometries, [])
+
+
+class TestCompileGeojson(unittest.TestCase):
+    """Testes para a geometria compilada (WKB + bbox) das áreas"""
+    
+    def setUp(self):
+        """Feature no formato salvo pelo frontend ([lon, lat])"""
+        self.feature = {
+            'type': 'Feature',
+            'properties': {'name': 'Área 1'},
+            'geometry': {
+                'type': 'Polygon',
+                'coordinates': [[[-47.9, -15.7], [-47.8, -15.7], [-47.8, -15.8], [-47.9, -15.8], [-47.9, -15.7]]]
+            }
+        }
+    
+    def test_geojson_to_coordinates(self):
+        """Testa conversão de [lon, lat] para [lat, lon]"""
+        coords = GeoUtils.geojson_to_coordinates(self.feature)
+        
+        self.assertEqual(coords[0], [-15.7, -47.9])
+        self.assertEqual(len(coords), 5)
+    
+    def test_compile_geojson(self):
+        """Testa WKB + bbox gerados a partir do GeoJSON (string ou dict)"""
+        import json
+        import shapely
+        
+        compiled = GeoUtils.compile_geojson(json.dumps(self.feature))
+        
+        self.assertAlmostEqual(compiled['bbox']['min_lat'], -15.8)
+        self.assertAlmostEqual(compiled['bbox']['max_lon'], -47.8)
+        geometry = shapely.from_wkb(compiled['wkb'])
+        self.assertTrue(shapely.contains_xy(geometry, -47.85, -15.75))
+        self.assertEqual(set(compiled['simplified']), {0.0001, 0.001, 0.01})
+    
+    def test_compile_invalid_geojson(self):
+        """Testa GeoJSON sem polígono válido"""
+        self.assertIsNone(GeoUtils.compile_geojson({'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [0, 0]}}))
+        self.assertIsNone(GeoUtils.compile_geojson({'type': 'Polygon', 'coordinates': [[[0, 0], [1, 1]]]}))
+
+
+class TestSimplifiedContainment(unittest.TestCase):
+    """Testes para as versões simplificadas e a faixa de borda"""
+    
+    def setUp(self):
+        """Área com muitos vértices (círculo irregular de 720 pontos)"""
+        angles = np.linspace(0, 2 * np.pi, 720, endpoint=False)
+        radius = 0.05 + 0.002 * np.sin(angles * 37)
+        coords = [[-15.75 + r * np.sin(a), -47.85 + r * np.cos(a)] for a, r in zip(angles, radius)]
+        self.polygons = [{'id': 1, 'coordinates': coords + [coords[0]]}]
+    
+    def test_simplify_levels(self):
+        """Testa se cada tolerância reduz os vértices"""
+        geometry = GeoUtils.prepare_polygon_geometries(self.polygons)[0]['geometry']
+        levels = GeoUtils.simplify_levels(geometry)
+        
+        counts = [len(levels[t].exterior.coords) for t in sorted(levels)]
+        self.assertLess(counts[-1], counts[0])
+        self.assertLess(counts[0], len(geometry.exterior.coords))
+    
+    def _assert_matches_exact(self, pdata):
+        import shapely
+        rng = np.random.default_rng(5)
+        lats = rng.uniform(-15.82, -15.68, 20000)
+        lngs = rng.uniform(-47.92, -47.78, 20000)
+        
+        np.testing.assert_array_equal(
+            GeoUtils.contains_points(pdata, lngs, lats),
+            shapely.contains_xy(pdata['geometry'], lngs, lats)
+        )
+        self.assertIsNotNone(pdata.get('band'))
+    
+    def test_band_matches_exact_ring(self):
+        """Testa se o teste com faixa de borda dá o mesmo resultado do anel exato"""
+        self._assert_matches_exact(GeoUtils.prepare_polygon_geometries(self.polygons)[0])
+    
+    def test_band_with_stored_levels(self):
+        """Testa a faixa montada a partir das versões simplificadas armazenadas"""
+        geometry = GeoUtils.prepare_polygon_geometries(self.polygons)[0]['geometry']
+        pdata = GeoUtils.prepare_polygon_geometries([{
+            'id': 1, 'geometry': geometry, 'simplified': GeoUtils.simplify_levels(geometry)
+        }])[0]
+        
+        self._assert_matches_exact(pdata)
+        # Boa parte das células é resolvida sem o anel exato
+        self.assertGreater((pdata['band']['state'] != 0).mean(), 0.5)
+    
+    def test_small_batch_skips_band(self):
+        """Testa que lotes pequenos usam só o anel exato"""
+        pdata = GeoUtils.prepare_polygon_geometries(self.polygons)[0]
+        GeoUtils.contains_points(pdata, np.array([-47.85]), np.array([-15.75]))
+        self.assertIsNone(pdata.get('band'))
+
+
+class TestGeocell(unittest.TestCase):
+    """Testes para a grade espacial usada no filtro por viewport"""
+    
+    def test_parse_bbox(self):
+        """Testa bbox no formato do Leaflet (oeste,sul,leste,norte)"""
+        bbox = GeoUtils.parse_bbox('-48.0,-15.9,-47.7,-15.6')
+        
+        self.assertEqual(bbox, {'min_lat': -15.9, 'max_lat': -15.6, 'min_lon': -48.0, 'max_lon': -47.7})
+        with self.assertRaises(ValueError):
+            GeoUtils.parse_bbox('1,2,3')
+    
+    def test_geocell_invalid(self):
+        """Testa coordenadas inválidas"""
+        self.assertIsNone(GeoUtils.geocell(None, -47.8))
+        self.assertIsNone(GeoUtils.geocell(95, -47.8))
+    
+    def test_ranges_cover_points(self):
+        """Testa se toda célula de um ponto dentro do bbox cai em alguma faixa"""
+        bbox = GeoUtils.parse_bbox('-48.0,-15.9,-47.7,-15.6')
+        ranges = GeoUtils.geocell_ranges(bbox)
+        rng = np.random.default_rng(3)
+        
+        for lat, lon in zip(rng.uniform(-15.9, -15.6, 200), rng.uniform(-48.0, -47.7, 200)):
+            cell = GeoUtils.geocell(lat, lon)
+            self.assertTrue(any(start <= cell <= end for start, end in ranges))
+    
+    def test_ranges_collapse_when_zoomed_out(self):
+        """Testa faixa única quando o bbox cobre muitas linhas da grade"""
+        ranges = GeoUtils.geocell_ranges(GeoUtils.parse_bbox('-75,-35,-30,5'), max_ranges=64)
+        self.assertEqual(len(ranges), 1)
+
+
 class TestBatchAssignClients(unittest.TestCase):
     """Testes para atribuição em lote de clientes a polígonos"""
     
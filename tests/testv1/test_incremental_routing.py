@@ -0,0 +1,120 @@
+"""
+Testes para o replanejamento a partir de um calendário salvo (ml/incremental_routing.py)
+"""
+import unittest
+
+from ml.incremental_routing import load_calendar_days, reroute_incremental
+
+
+def _client(hash_client, lat, lng):
+    return {'hash_client': hash_client, 'lat': lat, 'lng': lng}
+
+
+# Dois dias salvos: oeste (w*) e leste (e*), ~100 km de distância
+WEST = [_client(f'w{i}', -15.80 + 0.01 * i, -48.40) for i in range(4)]
+EAST = [_client(f'e{i}', -15.80 + 0.01 * i, -47.40) for i in range(4)]
+
+ALOCACOES = [
+    {'dia': 1, 'clientes': [{'hash_cliente': c['hash_client'], 'latitude': c['lat'], 'longitude': c['lng']} for c in WEST]},
+    {'dia': 2, 'centro': {'lat': -15.785, 'lng': -47.40},
+     'clientes': [{'hash_cliente': c['hash_client'], 'latitude': c['lat'], 'longitude': c['lng']} for c in EAST]},
+]
+
+
+class TestLoadCalendarDays(unittest.TestCase):
+    """Testes da leitura das alocações salvas"""
+
+    def test_days_and_centers(self):
+        """Testa centro salvo ou calculado pela média dos clientes"""
+        days = load_calendar_days(ALOCACOES)
+
+        self.assertEqual([d['day'] for d in days], [1, 2])
+        self.assertEqual(days[0]['hashes'], ['w0', 'w1', 'w2', 'w3'])
+        self.assertAlmostEqual(days[0]['center']['lat'], -15.785)
+        self.assertEqual(days[1]['center'], {'lat': -15.785, 'lng': -47.40})
+
+
+class TestRerouteIncremental(unittest.TestCase):
+    """Testes do encaixe de clientes novos nos dias salvos"""
+
+    def test_unchanged_calendar_keeps_order(self):
+        """Testa que sem mudanças nenhum dia é reordenado"""
+        clients = list(reversed(WEST + EAST))
+
+        groups = reroute_incremental(clients, load_calendar_days(ALOCACOES))
+
+        self.assertEqual([g['day'] for g in groups], [1, 2])
+        self.assertEqual([c['hash_client'] for c in groups[0]['clients']], ['w0', 'w1', 'w2', 'w3'])
+        self.assertTrue(all(not g['rerouted'] for g in groups))
+        self.assertEqual(len(groups[1]['stops']), 4)
+
+    def test_new_client_goes_to_nearest_day(self):
+        """Testa que o cliente novo vai para o dia mais próximo e só esse dia muda"""
+        clients = WEST + EAST + [_client('novo', -15.76, -47.41)]
+
+        groups = reroute_incremental(clients, load_calendar_days(ALOCACOES))
+
+        self.assertIn('novo', [c['hash_client'] for c in groups[1]['clients']])
+        self.assertEqual([g['rerouted'] for g in groups], [False, True])
+        self.assertEqual(groups[1]['new_clients'], 1)
+
+    def test_capacity_and_overflow_day(self):
+        """Testa que dias cheios não recebem clientes e o excedente forma um dia novo"""
+        clients = WEST + EAST + [_client('n1', -15.75, -47.41), _client('n2', -15.74, -48.41)]
+
+        groups = reroute_incremental(clients, load_calendar_days(ALOCACOES), max_clients_per_day=4)
+
+        self.assertEqual([g['day'] for g in groups], [1, 2, 3])
+        self.assertEqual(sorted(c['hash_client'] for c in groups[2]['clients']), ['n1', 'n2'])
+        self.assertTrue(all(g['total_clients'] <= 4 for g in groups))
+
+    def test_overflow_days_per_depot(self):
+        """Testa que o excedente de pontos de saída diferentes não divide o mesmo dia novo"""
+        clients = [dict(c, depot_id=1) for c in WEST] + [dict(c, depot_id=2) for c in EAST] + [
+            dict(_client('n1', -15.75, -47.41), depot_id=2), dict(_client('n2', -15.74, -48.41), depot_id=1)
+        ]
+        depots = [{'id': 1, 'name': 'Oeste', 'lat': -15.8, 'lng': -48.4},
+                  {'id': 2, 'name': 'Leste', 'lat': -15.8, 'lng': -47.4}]
+
+        groups = reroute_incremental(clients, load_calendar_days(ALOCACOES), max_clients_per_day=4, depots=depots)
+
+        self.assertEqual([g['day'] for g in groups], [1, 2, 3, 4])
+        for group in groups:
+            self.assertEqual(len({c['depot_id'] for c in group['clients']}), 1)
+            self.assertEqual(group['depot']['id'], group['clients'][0]['depot_id'])
+
+    def test_new_client_keeps_its_depot(self):
+        """Testa que um dia com vaga de outro ponto de saída não recebe o cliente novo"""
+        depots = [{'id': 1, 'name': 'Oeste', 'lat': -15.8, 'lng': -48.4},
+                  {'id': 2, 'name': 'Leste', 'lat': -15.8, 'lng': -47.4}]
+        saved = [{'dia': 1, 'clientes': [{'hash_cliente': c['hash_client'], 'latitude': c['lat'],
+                                          'longitude': c['lng']} for c in WEST[:3]]}]
+        # b0 fica ao lado do dia 1, mas sai do ponto de saída 2
+        clients = [dict(c, depot_id=1) for c in WEST[:3]] + [dict(_client('b0', -15.79, -48.39), depot_id=2)]
+
+        groups = reroute_incremental(clients, load_calendar_days(saved), max_clients_per_day=10, depots=depots)
+
+        self.assertEqual([g['day'] for g in groups], [1, 2])
+        self.assertEqual([c['hash_client'] for c in groups[0]['clients']], ['w0', 'w1', 'w2'])
+        self.assertEqual([c['hash_client'] for c in groups[1]['clients']], ['b0'])
+        self.assertEqual([g['depot']['id'] for g in groups], [1, 2])
+
+    def test_saved_depot_used(self):
+        """Testa que o ponto de saída salvo na alocação define o dia"""
+        saved = [dict(ALOCACOES[0], depot={'id': 7, 'name': 'Salvo'})]
+
+        self.assertEqual(load_calendar_days(saved)[0]['depot_id'], 7)
+
+    def test_removed_clients(self):
+        """Testa que clientes removidos saem do dia e marcam o dia como alterado"""
+        clients = WEST[:2] + EAST
+
+        groups = reroute_incremental(clients, load_calendar_days(ALOCACOES))
+
+        self.assertEqual(groups[0]['total_clients'], 2)
+        self.assertEqual(groups[0]['removed_clients'], 2)
+        self.assertEqual([g['rerouted'] for g in groups], [True, False])
+
+
+if __name__ == '__main__':
+    unittest.main()
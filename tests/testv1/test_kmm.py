@@ -0,0 +1,130 @@
+"""
+Testes para a filtragem por áreas e o K-Means (ml/KMM.py)
+"""
+import unittest
+import numpy as np
+import pandas as pd
+from ml.KMM import filter_clients_by_selected_polygons, run_kmeans_clustering
+from ml.geo_utils import GeoUtils
+
+
+POLYGONS = [
+    {'id': 1, 'name': 'Oeste', 'coordinates': [[-15.7, -47.9], [-15.7, -47.8], [-15.8, -47.8], [-15.8, -47.9], [-15.7, -47.9]]},
+    {'id': 2, 'name': 'Sobreposta', 'coordinates': [[-15.75, -47.85], [-15.75, -47.7], [-15.9, -47.7], [-15.9, -47.85], [-15.75, -47.85]]},
+    {'id': 3, 'name': 'Vazia', 'coordinates': [[0, 0], [0, 1], [1, 1], [1, 0], [0, 0]]}
+]
+
+
+class TestFilterBySelectedPolygons(unittest.TestCase):
+    """Testes para filter_clients_by_selected_polygons"""
+
+    def setUp(self):
+        rng = np.random.default_rng(11)
+        n = 3000
+        self.df = pd.DataFrame({
+            'id': np.arange(n),
+            'latitude': rng.uniform(-15.95, -15.65, n),
+            'longitude': rng.uniform(-47.95, -47.65, n)
+        })
+
+    def test_counts_and_polygon_column(self):
+        """Testa contagem por área e área atribuída (última área em caso de sobreposição)"""
+        filtered, counts = filter_clients_by_selected_polygons(self.df, [1, 2, 3], POLYGONS)
+
+        membership = GeoUtils.points_in_polygons(
+            self.df['latitude'], self.df['longitude'], GeoUtils.prepare_polygon_geometries(POLYGONS)
+        )
+        self.assertEqual(counts, {1: int(membership[:, 0].sum()), 2: int(membership[:, 1].sum()), 3: 0})
+        self.assertEqual(len(filtered), int(membership.any(axis=1).sum()))
+
+        both = membership[:, 0] & membership[:, 1]
+        overlap_ids = set(self.df['id'][both])
+        self.assertTrue((filtered[filtered['id'].isin(overlap_ids)]['polygon_id'] == 2).all())
+
+    def test_parallel_matches_serial(self):
+        """Testa se o modo em blocos por processos dá o mesmo resultado"""
+        lats, lngs = self.df['latitude'].to_numpy(), self.df['longitude'].to_numpy()
+
+        serial, serial_ids = GeoUtils.points_in_polygons_chunked(lats, lngs, POLYGONS)
+        parallel, parallel_ids = GeoUtils.points_in_polygons_chunked(
+            lats, lngs, POLYGONS, max_workers=2, chunk_size=700, min_points=0
+        )
+
+        self.assertEqual(serial_ids, parallel_ids)
+        np.testing.assert_array_equal(serial, parallel)
+
+    def test_no_clients_inside(self):
+        """Testa seleção sem clientes dentro"""
+        filtered, counts = filter_clients_by_selected_polygons(self.df, [3], POLYGONS)
+
+        self.assertTrue(filtered.empty)
+        self.assertEqual(counts, {3: 0})
+
+
+class TestRunKmeans(unittest.TestCase):
+    """Testes para run_kmeans_clustering"""
+
+    def test_clusters_with_polygon_filter(self):
+        """Testa K-Means após filtro por áreas"""
+        rng = np.random.default_rng(1)
+        df = pd.DataFrame({
+            'id': np.arange(50),
+            'latitude': rng.uniform(-15.79, -15.71, 50),
+            'longitude': rng.uniform(-47.89, -47.81, 50)
+        })
+
+        result, k, counts = run_kmeans_clustering(df, 5, selected_polygon_ids=[1], polygons_data=POLYGONS)
+
+        self.assertEqual(k, 10)
+        self.assertEqual(counts[1], 50)
+        self.assertIn('cluster', result.columns)
+        self.assertEqual(result.attrs['clustering_backend'], 'kmeans')
+
+    def test_minibatch_path_same_format(self):
+        """Testa o caminho MiniBatchKMeans acima do limite: mesmo formato de saída"""
+        rng = np.random.default_rng(2)
+        df = pd.DataFrame({
+            'id': np.arange(200),
+            'latitude': rng.uniform(-16, -15, 200),
+            'longitude': rng.uniform(-48, -47, 200)
+        })
+
+        result, k, _ = run_kmeans_clustering(df, 20, minibatch_min_points=100)
+
+        self.assertEqual(result.attrs['clustering_backend'], 'minibatch')
+        self.assertEqual(k, 10)
+        self.assertEqual(list(result.columns), ['id', 'latitude', 'longitude', 'cluster'])
+        self.assertTrue(set(result['cluster']).issubset(range(k)))
+
+    def test_registry_algorithm(self):
+        """Testa agrupamento com algoritmo do registro (ml/clustering.py)"""
+        rng = np.random.default_rng(3)
+        df = pd.DataFrame({
+            'id': np.arange(60),
+            'latitude': rng.uniform(-15.79, -15.71, 60),
+            'longitude': rng.uniform(-47.89, -47.81, 60)
+        })
+
+        result, k, _ = run_kmeans_clustering(df, 10, algoritmo='grid')
+
+        self.assertEqual(k, 6)
+        self.assertEqual(result.attrs['clustering_backend'], 'kmeans')
+        self.assertTrue(set(result['cluster']).issubset(range(k)))
+
+    def test_balanced_algorithm(self):
+        """Testa o algoritmo balanceado pelo mesmo registro usado na roteirização"""
+        rng = np.random.default_rng(4)
+        df = pd.DataFrame({
+            'id': np.arange(62),
+            'latitude': rng.uniform(-15.79, -15.71, 62),
+            'longitude': rng.uniform(-47.89, -47.81, 62)
+        })
+
+        result, k, _ = run_kmeans_clustering(df, 10, algoritmo='balanced')
+
+        self.assertEqual(k, 7)
+        self.assertLessEqual(result['cluster'].value_counts().max(), 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
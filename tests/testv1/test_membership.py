@@ -0,0 +1,154 @@
+"""
+Testes para a pertinência cliente → área materializada (ml/membership.py)
+"""
+import json
+import unittest
+from unittest.mock import patch
+from flask import Flask
+
+from config import Config
+from base.models import db, ClientName, LatLong, KNN, Polygon
+from ml.geo_utils import GeoUtils
+from ml.spatial_index import PolygonIndex, load_user_polygons
+from ml import membership
+
+
+SQUARE = [[-15.7, -47.9], [-15.7, -47.8], [-15.8, -47.8], [-15.8, -47.9], [-15.7, -47.9]]
+EAST = [[-15.7, -47.8], [-15.7, -47.7], [-15.8, -47.7], [-15.8, -47.8], [-15.7, -47.8]]
+
+
+class TestMembership(unittest.TestCase):
+    """Testes com bancos SQLite em memória"""
+
+    def setUp(self):
+        """Cria app com todos os binds em memória e alguns clientes"""
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        self.app.config['SQLALCHEMY_BINDS'] = {key: 'sqlite://' for key in Config.SQLALCHEMY_BINDS}
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        db.session.add_all([
+            LatLong(id=1, id_user=1, hash_client='a', latitude=-15.75, longitude=-47.85, user_point=False),
+            LatLong(id=2, id_user=1, hash_client='b', latitude=-15.75, longitude=-47.75, user_point=False),
+            LatLong(id=3, id_user=1, hash_client='c', latitude=-15.60, longitude=-47.60, user_point=False),
+            LatLong(id=4, id_user=1, hash_client='base', latitude=-15.76, longitude=-47.86, user_point=True),
+        ])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_ensure_materializes_missing_polygons(self):
+        """Testa materialização inicial e contagens por área"""
+        index = PolygonIndex([{'id': 10, 'coordinates': SQUARE}, {'id': 20, 'coordinates': EAST}])
+
+        membership.ensure_user_membership(1, index)
+        counts, in_any_area = membership.count_clients_by_polygon([10, 20])
+
+        self.assertEqual(counts, {10: 1, 20: 1})
+        self.assertEqual(in_any_area, 2)
+        # Ponto de saída (user_point=True) não entra na pertinência
+        self.assertEqual(KNN.query.filter_by(id_client=4).count(), 0)
+
+    def test_refresh_polygon_replaces_rows(self):
+        """Testa recálculo incremental de uma área alterada"""
+        membership.ensure_user_membership(1, PolygonIndex([{'id': 10, 'coordinates': SQUARE}]))
+
+        # Área 10 passa a cobrir a região leste
+        membership.refresh_polygon_membership(1, [10], PolygonIndex([{'id': 10, 'coordinates': EAST}]))
+
+        self.assertEqual(membership.get_client_polygon_pairs([10]), [(2, 10)])
+
+    def test_chunked_path_for_large_sets(self):
+        """Testa que acima do limite a pertinência vem do motor em processos, com o mesmo resultado"""
+        index = PolygonIndex([{'id': 10, 'coordinates': SQUARE}, {'id': 20, 'coordinates': EAST}])
+        membership.refresh_polygon_membership(1, [10, 20], index)
+        expected = sorted(membership.get_client_polygon_pairs([10, 20]))
+
+        with patch.object(membership, 'PARALLEL_MIN_POINTS', 1), \
+                patch.object(GeoUtils, 'points_in_polygons_chunked', wraps=GeoUtils.points_in_polygons_chunked) as chunked:
+            membership.refresh_polygon_membership(1, [10, 20], index)
+
+        chunked.assert_called_once()
+        self.assertEqual(sorted(membership.get_client_polygon_pairs([10, 20])), expected)
+
+    def test_refresh_new_clients(self):
+        """Testa atualização só dos pontos recém-importados"""
+        index = PolygonIndex([{'id': 10, 'coordinates': SQUARE}])
+        membership.ensure_user_membership(1, index)
+
+        db.session.add(LatLong(id=5, id_user=1, hash_client='d', latitude=-15.72, longitude=-47.88, user_point=False))
+        db.session.commit()
+        membership.refresh_clients_membership(1, [5], index)
+
+        counts, _ = membership.count_clients_by_polygon([10])
+        self.assertEqual(counts[10], 2)
+
+    def test_load_compiled_polygons(self):
+        """Testa carregamento pela geometria compilada, inclusive de áreas antigas sem WKB"""
+        feature = {
+            'type': 'Feature',
+            'properties': {'name': 'Nova'},
+            'geometry': {'type': 'Polygon', 'coordinates': [[[lng, lat] for lat, lng in SQUARE]]}
+        }
+        new_polygon = Polygon(user_id=1, group_name='Nova')
+        new_polygon.set_geojson(feature)
+        legacy = Polygon(user_id=1, group_name='Antiga', geojson_data=json.dumps(
+            {'type': 'Polygon', 'coordinates': [[[lng, lat] for lat, lng in EAST]]}
+        ))
+        db.session.add_all([new_polygon, legacy])
+        db.session.commit()
+        self.assertIsNotNone(new_polygon.geometry_wkb)
+        self.assertIsNone(legacy.geometry_wkb)
+
+        polygons = load_user_polygons(1)
+
+        self.assertEqual({p['name'] for p in polygons}, {'Nova', 'Antiga'})
+        self.assertIsNotNone(db.session.get(Polygon, legacy.id).geometry_wkb)
+        self.assertEqual(polygons[0]['coordinates'][0], SQUARE[0])
+        self.assertEqual(set(polygons[0]['simplified']), {0.0001, 0.001, 0.01})
+
+        index = PolygonIndex(polygons)
+        membership.ensure_user_membership(1, index)
+        counts, _ = membership.count_clients_by_polygon(index.ids)
+        self.assertEqual(counts, {new_polygon.id: 1, legacy.id: 1})
+
+    def test_empty_polygon_rechecked(self):
+        """Testa que área vazia é conferida de novo (clientes gravados por outro processo)"""
+        north = [[-15.5, -47.9], [-15.5, -47.8], [-15.6, -47.8], [-15.6, -47.9], [-15.5, -47.9]]
+        index = PolygonIndex([{'id': 30, 'coordinates': north}])
+        membership.ensure_user_membership(1, index)
+        self.assertEqual(membership.count_clients_by_polygon([30])[0], {30: 0})
+
+        # Importação feita sem refresh_clients_membership neste processo
+        db.session.add(LatLong(id=6, id_user=1, hash_client='e', latitude=-15.55, longitude=-47.85, user_point=False))
+        db.session.commit()
+        membership.ensure_user_membership(1, index)
+
+        self.assertEqual(membership.get_client_polygon_pairs([30]), [(6, 30)])
+
+    def test_knn_get_client(self):
+        """Testa que KNN.id_client referencia LatLong.id e resolve o cliente pelo hash"""
+        db.session.add(ClientName(hash_client='a', name_client='Cliente A', user_id=1))
+        db.session.commit()
+        membership.ensure_user_membership(1, PolygonIndex([{'id': 10, 'coordinates': SQUARE}]))
+
+        row = KNN.query.filter_by(polygon_id=10).one()
+
+        self.assertEqual(row.get_client().name_client, 'Cliente A')
+
+    def test_remove_polygon(self):
+        """Testa remoção da pertinência de área excluída"""
+        membership.ensure_user_membership(1, PolygonIndex([{'id': 10, 'coordinates': SQUARE}]))
+        membership.remove_polygon_membership([10])
+
+        self.assertEqual(KNN.query.count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+"""
+Testes para o agrupamento de marcadores por zoom (ml/point_clusters.py)
+"""
+import unittest
+import numpy as np
+from ml.geo_utils import GeoUtils
+from ml.point_clusters import PointClusterIndex, MAX_CLUSTER_ZOOM
+from ml.user_cache import UserCache
+
+
+class TestPointClusterIndex(unittest.TestCase):
+    """Testes para a hierarquia de clusters"""
+
+    def setUp(self):
+        """Dois grupos de pontos distantes (Brasília e São Paulo) e um ponto inválido"""
+        rng = np.random.default_rng(7)
+        lats = np.concatenate([rng.normal(-15.78, 0.01, 300), rng.normal(-23.55, 0.01, 200), [np.nan]])
+        lngs = np.concatenate([rng.normal(-47.93, 0.01, 300), rng.normal(-46.63, 0.01, 200), [-47.0]])
+        self.ids = np.arange(1, 502)
+        self.index = PointClusterIndex(self.ids, [f'h{i}' for i in self.ids], lats, lngs)
+
+    def test_counts_preserved_at_every_zoom(self):
+        """Testa se a soma das contagens é o total de pontos válidos em todos os níveis"""
+        self.assertEqual(len(self.index), 500)
+        for zoom in range(0, MAX_CLUSTER_ZOOM + 2):
+            total = sum(c['count'] for c in self.index.get_clusters(None, zoom))
+            self.assertEqual(total, 500)
+
+    def test_low_zoom_aggregates(self):
+        """Testa agregação em poucos clusters com centróide no grupo"""
+        clusters = self.index.get_clusters(None, 4)
+
+        self.assertLessEqual(len(clusters), 2)
+        biggest = max(clusters, key=lambda c: c['count'])
+        self.assertAlmostEqual(biggest['latitude'], -15.78, delta=0.05)
+        self.assertNotIn('id', biggest)
+
+    def test_high_zoom_returns_points(self):
+        """Testa pontos individuais acima do zoom máximo de agrupamento"""
+        clusters = self.index.get_clusters(None, MAX_CLUSTER_ZOOM + 3)
+
+        self.assertEqual(len(clusters), 500)
+        self.assertTrue(all(c['count'] == 1 and 'hash_client' in c for c in clusters))
+
+    def test_bbox_filter(self):
+        """Testa restrição ao bbox visível"""
+        bbox = GeoUtils.parse_bbox('-48.1,-16.0,-47.7,-15.5')
+        total = sum(c['count'] for c in self.index.get_clusters(bbox, 10))
+
+        self.assertEqual(total, 300)
+
+    def test_empty_index(self):
+        """Testa usuário sem pontos"""
+        index = PointClusterIndex([], [], [], [])
+        self.assertEqual(index.get_clusters(None, 5), [])
+
+
+class TestUserCache(unittest.TestCase):
+    """Testes para o cache por usuário"""
+
+    def test_invalidation_during_build_is_not_cached(self):
+        """Testa se valor construído durante uma invalidação não fica em cache"""
+        cache = UserCache()
+
+        def builder():
+            cache.invalidate(1)
+            return 'antigo'
+
+        self.assertEqual(cache.get(1, builder), 'antigo')
+        self.assertEqual(cache.get(1, lambda: 'novo'), 'novo')
+        self.assertEqual(cache.get(1, lambda: 'outro'), 'novo')
+
+
+if __name__ == '__main__':
+    unittest.main()
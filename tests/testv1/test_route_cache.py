@@ -0,0 +1,97 @@
+"""
+Testes para o cache de roteirizações (ml/route_cache.py)
+"""
+import unittest
+
+from ml.route_cache import RouteResultCache, routing_fingerprint
+
+
+CLIENTS = [
+    {'id': 1, 'hash_client': 'a', 'lat': -15.75, 'lng': -47.85, 'polygon_id': 10},
+    {'id': 2, 'hash_client': 'b', 'lat': -15.72, 'lng': -47.88, 'polygon_id': 10},
+]
+POLYGONS = [{'id': 10, 'geometry_version': 1}]
+PARAMS = {'dias': 3, 'max_clients_per_day': None, 'agrupamento': 'kmeans', 'respeitar_range': False}
+
+
+class TestFingerprint(unittest.TestCase):
+    """Testes da impressão digital da entrada"""
+
+    def test_same_input_same_key(self):
+        """Testa chave estável para a mesma entrada"""
+        key = routing_fingerprint(CLIENTS, POLYGONS, PARAMS)
+        self.assertEqual(key, routing_fingerprint([dict(c) for c in CLIENTS], list(POLYGONS), dict(PARAMS)))
+
+    def test_changes_change_key(self):
+        """Testa que clientes, áreas, parâmetros e pontos de saída mudam a chave"""
+        key = routing_fingerprint(CLIENTS, POLYGONS, PARAMS)
+        moved = [CLIENTS[0], dict(CLIENTS[1], lat=-15.73)]
+        variants = [
+            routing_fingerprint(moved, POLYGONS, PARAMS),
+            routing_fingerprint(CLIENTS[:1], POLYGONS, PARAMS),
+            routing_fingerprint(CLIENTS, [{'id': 10, 'geometry_version': 2}], PARAMS),
+            routing_fingerprint(CLIENTS, POLYGONS, dict(PARAMS, dias=4)),
+            routing_fingerprint(CLIENTS, POLYGONS, dict(PARAMS, max_clients_per_day=10)),
+            routing_fingerprint(CLIENTS, POLYGONS, PARAMS, [{'id': 1, 'lat': -15.0, 'lng': -47.0}]),
+        ]
+        self.assertEqual(len({key, *variants}), len(variants) + 1)
+
+
+class TestRouteResultCache(unittest.TestCase):
+    """Testes do LRU por usuário"""
+
+    def test_hit_and_miss(self):
+        """Testa que o builder só roda na primeira chamada"""
+        cache = RouteResultCache()
+        calls = []
+
+        def build():
+            calls.append(1)
+            return [{'group_number': 1}]
+
+        first, hit_first = cache.get(1, 'k', build)
+        second, hit_second = cache.get(1, 'k', build)
+
+        self.assertEqual((hit_first, hit_second), (False, True))
+        self.assertIs(first, second)
+        self.assertEqual(len(calls), 1)
+
+    def test_lru_eviction(self):
+        """Testa descarte da entrada menos usada"""
+        cache = RouteResultCache(max_entries=2)
+        cache.get(1, 'a', lambda: ['a'])
+        cache.get(1, 'b', lambda: ['b'])
+        cache.get(1, 'a', lambda: ['a'])  # 'a' passa a ser a mais recente
+        cache.get(1, 'c', lambda: ['c'])
+
+        self.assertEqual(len(cache), 2)
+        self.assertTrue(cache.get(1, 'a', lambda: ['novo'])[1])
+        self.assertFalse(cache.get(1, 'b', lambda: ['novo'])[1])
+
+    def test_invalidate_user(self):
+        """Testa que invalidar um usuário não afeta os outros"""
+        cache = RouteResultCache()
+        cache.get(1, 'k', lambda: ['u1'])
+        cache.get(2, 'k', lambda: ['u2'])
+
+        cache.invalidate(1)
+
+        self.assertFalse(cache.get(1, 'k', lambda: ['u1'])[1])
+        self.assertTrue(cache.get(2, 'k', lambda: ['u2'])[1])
+
+    def test_not_stored_when_invalidated_during_build(self):
+        """Testa que resultado calculado durante uma invalidação não é guardado"""
+        cache = RouteResultCache()
+
+        def build():
+            cache.invalidate(1)
+            return ['antigo']
+
+        value, _ = cache.get(1, 'k', build)
+
+        self.assertEqual(value, ['antigo'])
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
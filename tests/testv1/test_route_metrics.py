@@ -0,0 +1,94 @@
+"""
+Testes para as métricas de qualidade da roteirização (ml/route_metrics.py)
+"""
+import unittest
+from flask import Flask
+
+from config import Config
+from base.models import db, NDBOut
+from ml.route_metrics import compute_route_metrics, save_route_metrics, AVERAGE_SPEED_KMH
+
+
+def _group(number, clients, depot=None, **extra):
+    lats = [c['lat'] for c in clients]
+    lngs = [c['lng'] for c in clients]
+    group = {
+        'group_number': number,
+        'clients': clients,
+        'center': {'lat': sum(lats) / len(lats), 'lng': sum(lngs) / len(lngs)},
+        'depot': depot
+    }
+    group.update(extra)
+    return group
+
+
+# 0.01° de latitude ≈ 1.112 km
+LINE = [{'lat': -15.80 + 0.01 * i, 'lng': -47.90} for i in range(3)]
+DEPOT = {'id': 9, 'name': 'Base', 'lat': -15.90, 'lng': -47.90}
+
+
+class TestComputeMetrics(unittest.TestCase):
+    """Testes do cálculo vetorizado"""
+
+    def test_line(self):
+        """Testa percurso entre clientes, dispersão e tempo estimado"""
+        metrics = compute_route_metrics([_group(1, LINE, sum_distance_km=10.0)])[0]
+
+        self.assertEqual(metrics['num_clients'], 3)
+        self.assertAlmostEqual(metrics['intra_cluster_km'], 2.224, delta=0.01)
+        # Dois clientes a ~1.112 km do centro e um no centro
+        self.assertAlmostEqual(metrics['centroid_spread_km'], 2 * 1.112 / 3, delta=0.01)
+        self.assertAlmostEqual(metrics['time_moved'], 10.0 / AVERAGE_SPEED_KMH * 60, delta=0.1)
+        self.assertIsNone(metrics['depot_id'])
+
+    def test_groups_do_not_mix(self):
+        """Testa que a perna entre o último cliente de um grupo e o primeiro do próximo não conta"""
+        far = [{'lat': -10.0, 'lng': -40.0}]
+        metrics = compute_route_metrics([_group(1, LINE), _group(2, far, DEPOT, depot_distance_km=5.0)])
+
+        self.assertAlmostEqual(metrics[0]['intra_cluster_km'], 2.224, delta=0.01)
+        self.assertEqual(metrics[1]['intra_cluster_km'], 0.0)
+        self.assertEqual(metrics[1]['centroid_spread_km'], 0.0)
+        self.assertEqual(metrics[1]['depot_id'], 9)
+        self.assertEqual(metrics[1]['depot_distance_km'], 5.0)
+
+    def test_empty(self):
+        """Testa plano sem grupos"""
+        self.assertEqual(compute_route_metrics([]), [])
+
+
+class TestSaveMetrics(unittest.TestCase):
+    """Testes da gravação em NDBOut com bancos SQLite em memória"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        self.app.config['SQLALCHEMY_BINDS'] = {key: 'sqlite://' for key in Config.SQLALCHEMY_BINDS}
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_save(self):
+        """Testa uma linha por grupo com versão do algoritmo, score e chave do plano"""
+        groups = [_group(1, LINE, DEPOT), _group(2, LINE[:1], DEPOT)]
+
+        self.assertEqual(save_route_metrics(3, groups, plan_key='abc', scores=[75.0, 0]), 2)
+
+        rows = NDBOut.query.filter_by(user_id=3).order_by(NDBOut.rout_number).all()
+        self.assertEqual([r.rout_number for r in rows], [1, 2])
+        self.assertEqual([r.num_cliets for r in rows], [3, 1])
+        self.assertEqual(rows[0].score, 75.0)
+        self.assertEqual(rows[0].plan_key, 'abc')
+        self.assertEqual(rows[0].depot_id, 9)
+        self.assertTrue(rows[0].model_version.startswith('v'))
+        self.assertIsNotNone(rows[0].timestamp)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+"""
+Testes para a roteirização (ml/route_optimizer.py)
+"""
+import unittest
+from unittest.mock import patch
+import numpy as np
+from sklearn.cluster import KMeans, MiniBatchKMeans
+
+from ml import clustering, route_optimizer
+from ml.client_batch import ClientBatch
+from ml.clustering import balanced_kmeans
+from ml.route_optimizer import create_routes_knn, format_result_for_api, select_by_priority, CLUSTERING_BALANCED
+
+
+def _random_clients(n, seed=0):
+    rng = np.random.default_rng(seed)
+    lats = rng.normal(-15.8, 0.1, n)
+    lngs = rng.normal(-47.9, 0.1, n)
+    return [{'hash_client': f'h{i}', 'lat': float(lat), 'lng': float(lng)} for i, (lat, lng) in enumerate(zip(lats, lngs))]
+
+
+class TestBalancedClustering(unittest.TestCase):
+    """Testes do agrupamento com capacidade"""
+
+    def test_capacity_respected(self):
+        """Testa que nenhum grupo excede a capacidade"""
+        coordinates = np.array([[c['lat'], c['lng']] for c in _random_clients(103)])
+
+        labels = balanced_kmeans(coordinates, 5, 21)
+
+        counts = np.bincount(labels, minlength=5)
+        self.assertEqual(counts.sum(), 103)
+        self.assertLessEqual(counts.max(), 21)
+
+    def test_assignment_vectorized(self):
+        """Testa atribuição com capacidade: sem aperto cada ponto fica no centro mais próximo"""
+        coordinates = np.array([[c['lat'], c['lng']] for c in _random_clients(500)])
+        centers = coordinates[:20]
+        nearest = np.argmin(((coordinates[:, None, :] - centers[None]) ** 2).sum(axis=2), axis=1)
+
+        np.testing.assert_array_equal(clustering._capacitated_assignment(coordinates, centers, 500), nearest)
+
+        labels = clustering._capacitated_assignment(coordinates, centers, 25, n_candidates=2)
+        self.assertTrue((labels >= 0).all())
+        self.assertEqual(np.bincount(labels, minlength=20).max(), 25)
+
+    def test_insufficient_capacity(self):
+        """Testa erro quando grupos x capacidade não comporta todos os pontos"""
+        with self.assertRaises(ValueError):
+            balanced_kmeans(np.zeros((10, 2)), 2, 4)
+
+    def test_keeps_separated_clumps_together(self):
+        """Testa que aglomerados bem separados e do tamanho da capacidade não são misturados"""
+        west = [{'lat': -15.8 + 0.001 * i, 'lng': -48.5} for i in range(10)]
+        east = [{'lat': -15.8 + 0.001 * i, 'lng': -47.0} for i in range(10)]
+        coordinates = np.array([[c['lat'], c['lng']] for c in west + east])
+
+        labels = balanced_kmeans(coordinates, 2, 10)
+
+        self.assertEqual(len(set(labels[:10])), 1)
+        self.assertEqual(len(set(labels[10:])), 1)
+        self.assertNotEqual(labels[0], labels[10])
+
+    def test_create_routes_balanced(self):
+        """Testa create_routes_knn no modo balanceado: grupos limitados e equilibrados, sem divisões"""
+        clients = _random_clients(95)
+
+        groups = create_routes_knn(clients, n_days=5, max_clients_per_day=12, clustering=CLUSTERING_BALANCED)
+
+        sizes = [g['total_clients'] for g in groups]
+        self.assertEqual(len(groups), 8)  # ceil(95 / 12)
+        self.assertEqual(sum(sizes), 95)
+        self.assertLessEqual(max(sizes), 12)
+        self.assertTrue(all(not g['is_split'] for g in groups))
+        self.assertEqual([g['day'] for g in groups], list(range(1, 9)))
+
+    def test_invalid_mode(self):
+        """Testa modo de agrupamento desconhecido"""
+        with self.assertRaises(ValueError):
+            create_routes_knn(_random_clients(5), n_days=2, clustering='outro')
+
+
+
+class TestLargeNPath(unittest.TestCase):
+    """Testes da troca automática para MiniBatchKMeans"""
+
+    def test_backend_threshold(self):
+        """Testa escolha do estimador pelo número de pontos"""
+        estimator, backend = clustering.make_kmeans(5, 100, min_points=1000)
+        self.assertIsInstance(estimator, KMeans)
+        self.assertEqual(backend, clustering.BACKEND_KMEANS)
+
+        estimator, backend = clustering.make_kmeans(5, 1000, min_points=1000, batch_size=256)
+        self.assertIsInstance(estimator, MiniBatchKMeans)
+        self.assertEqual(estimator.batch_size, 256)
+        self.assertEqual(backend, clustering.BACKEND_MINIBATCH)
+
+    def test_create_routes_reports_backend(self):
+        """Testa que a rota informa o backend e mantém o formato dos grupos"""
+        clients = _random_clients(300)
+
+        with patch.object(clustering, 'MINIBATCH_MIN_POINTS', 200):
+            groups = create_routes_knn(clients, n_days=4, sequence=False)
+        result = format_result_for_api(groups)
+
+        self.assertEqual(result['clustering_backend'], clustering.BACKEND_MINIBATCH)
+        self.assertEqual(result['total_clients'], 300)
+        self.assertEqual(format_result_for_api(create_routes_knn(clients[:50], n_days=4))['clustering_backend'],
+                         clustering.BACKEND_KMEANS)
+
+
+class TestParallelSplit(unittest.TestCase):
+    """Testes da divisão dos clusters grandes num pool de processos"""
+
+    def _summary(self, groups):
+        return [(g['group_number'], g['day'], [c['hash_client'] for c in g['clients']]) for g in groups]
+
+    def test_parallel_matches_sequential(self):
+        """Testa que o pool produz os mesmos grupos, na mesma numeração, que o modo sequencial"""
+        clients = _random_clients(400)
+
+        sequential = create_routes_knn(clients, n_days=3, max_clients_per_day=15, sequence=False, split_workers=0)
+        with patch.object(route_optimizer, 'SPLIT_PARALLEL_MIN_POINTS', 0):
+            parallel = create_routes_knn(clients, n_days=3, max_clients_per_day=15, sequence=False, split_workers=2)
+
+        self.assertEqual(self._summary(parallel), self._summary(sequential))
+        self.assertLessEqual(max(g['total_clients'] for g in parallel), 15)
+        self.assertEqual(sum(g['total_clients'] for g in parallel), 400)
+
+
+class TestDuplicateCoordinates(unittest.TestCase):
+    """Testes dos clientes repetidos unidos em pontos com peso"""
+
+    def test_buildings_not_mixed(self):
+        """Testa que clientes de prédios diferentes não caem no mesmo dia ao dividir"""
+        buildings = [(-15.80, -47.90), (-15.70, -47.80)]
+        clients = [{'hash_client': f'b{b}_{i}', 'lat': lat, 'lng': lng}
+                   for b, (lat, lng) in enumerate(buildings) for i in range(15)]
+
+        groups = create_routes_knn(clients, n_days=1, max_clients_per_day=10, sequence=False)
+
+        self.assertEqual(sum(g['total_clients'] for g in groups), 30)
+        self.assertLessEqual(max(g['total_clients'] for g in groups), 10)
+        for group in groups:
+            self.assertEqual(len({c['hash_client'].split('_')[0] for c in group['clients']}), 1)
+
+    def test_weighted_phase_one(self):
+        """Testa agrupamento inicial com menos pontos distintos que dias"""
+        clients = [{'hash_client': f'h{i}', 'lat': -15.8 + 0.05 * (i % 2), 'lng': -47.9} for i in range(20)]
+
+        groups = create_routes_knn(clients, n_days=4, sequence=False)
+
+        self.assertEqual(sum(g['total_clients'] for g in groups), 20)
+        self.assertTrue(all(len({c['lat'] for c in g['clients']}) == 1 for g in groups))
+
+
+class TestScorePriority(unittest.TestCase):
+    """Testes da prioridade por score RFM"""
+
+    def test_select_by_priority(self):
+        """Testa que os de menor score (e sem score) saem primeiro quando passa da capacidade"""
+        batch = ClientBatch.from_records([{'lat': -15.8, 'lng': -47.9, 'score': s}
+                                          for s in (50, None, 90, 10, 70, 50)])
+
+        kept, deferred = select_by_priority(batch, 2, 2)
+
+        self.assertEqual(list(kept), [0, 2, 4, 5])
+        self.assertEqual(list(deferred), [1, 3])
+        self.assertEqual(len(select_by_priority(batch, 2, None)[1]), 0)
+        self.assertEqual(len(select_by_priority(batch, 3, 2)[1]), 0)
+
+    def test_high_scores_first(self):
+        """Testa que o grupo de maior score médio fica no primeiro dia"""
+        west = [{'hash_client': f'w{i}', 'lat': -15.8 + 0.001 * i, 'lng': -48.5, 'score': 20} for i in range(10)]
+        east = [{'hash_client': f'e{i}', 'lat': -15.8 + 0.001 * i, 'lng': -47.0, 'score': 90} for i in range(10)]
+
+        groups = create_routes_knn(west + east, n_days=2, sequence=False, priority=True)
+
+        self.assertEqual([g['day'] for g in groups], [1, 2])
+        self.assertTrue(all(c['hash_client'].startswith('e') for c in groups[0]['clients']))
+        self.assertTrue(all(c['hash_client'].startswith('w') for c in groups[1]['clients']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -78,6 +78,19 @@ class TestRoutesIntegration(unittest.TestCase):
             response = self.client.get('/autenticado/grupos?action=get&user_id=1')
             self.assertIn(response.status_code, [200, 302])
     
+    @patch('ml.point_clusters.get_point_clusters')
+    def test_api_clusters_uses_session_user(self, mock_get_point_clusters):
+        """Testa que /api/clusters ignora user_id da query string"""
+        mock_get_point_clusters.return_value.get_clusters.return_value = []
+
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = 1
+
+        response = self.client.get('/api/clusters?zoom=5&user_id=2')
+
+        self.assertEqual(response.status_code, 200)
+        mock_get_point_clusters.assert_called_once_with(1)
+
     @patch('base.routes.db')
     def test_roteirizacao_page_loads(self, mock_db):
         """Testa se página de roteirização carrega"""
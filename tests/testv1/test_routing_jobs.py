@@ -0,0 +1,294 @@
+"""
+Testes para a roteirização em segundo plano (ml/routing_service.py e ml/routing_jobs.py)
+"""
+import json
+import threading
+import unittest
+from datetime import datetime, timedelta
+from flask import Flask
+
+from config import Config
+from base.models import db, LatLong, Polygon, RoutingJob, SavedCalendar, ClientScore, NDBOut
+from ml.spatial_index import invalidate_polygon_index
+from ml.depots import invalidate_depot_index
+from ml.route_cache import invalidate_route_cache
+from ml.routing_service import RoutingError, validate_routing_params, plan_routes
+from ml.routing_jobs import submit_job, get_job, cancel_job, wait_job, fail_stale_jobs, JOB_STALE_MINUTES
+from base.routes import main as main_bp
+
+
+SQUARE = [[-15.7, -47.9], [-15.7, -47.8], [-15.8, -47.8], [-15.8, -47.9], [-15.7, -47.9]]
+
+
+class TestValidateParams(unittest.TestCase):
+    """Testes da validação dos parâmetros de /processar"""
+
+    def test_valid(self):
+        """Testa normalização dos parâmetros"""
+        params = validate_routing_params({'dias': 3, 'grupos_selecionados': ['5', 7]})
+
+        self.assertEqual(params['grupos_selecionados'], [5, 7])
+        self.assertIsNone(params['max_clients_per_day'])
+        self.assertFalse(params['respeitar_range'])
+        self.assertEqual(params['agrupamento'], 'kmeans')
+
+    def test_invalid(self):
+        """Testa erros de entrada com código 400"""
+        for data in ({'dias': 0, 'grupos_selecionados': [1]},
+                     {'dias': 31, 'grupos_selecionados': [1]},
+                     {'dias': 3, 'grupos_selecionados': []},
+                     {'dias': 3, 'grupos_selecionados': ['x']},
+                     {'dias': 3, 'grupos_selecionados': [1], 'max_clients_per_day': 500},
+                     {'dias': 3, 'grupos_selecionados': [1], 'agrupamento': 'outro'}):
+            with self.assertRaises(RoutingError) as ctx:
+                validate_routing_params(data)
+            self.assertEqual(ctx.exception.status_code, 400)
+
+
+class TestRoutingJobs(unittest.TestCase):
+    """Testes com bancos SQLite em memória"""
+
+    def setUp(self):
+        """Cria app com todos os binds em memória, clientes e uma área"""
+        self.app = Flask(__name__)
+        self.app.config['SECRET_KEY'] = 'test'
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        self.app.config['SQLALCHEMY_BINDS'] = {key: 'sqlite://' for key in Config.SQLALCHEMY_BINDS}
+        db.init_app(self.app)
+        self.app.register_blueprint(main_bp)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        db.session.add_all([
+            LatLong(id=i + 1, id_user=1, hash_client=f'h{i}', user_point=False,
+                    latitude=-15.71 - 0.008 * (i % 10), longitude=-47.81 - 0.008 * (i // 10))
+            for i in range(40)
+        ])
+        polygon = Polygon(user_id=1, group_name='Centro')
+        polygon.set_geojson({
+            'type': 'Feature',
+            'properties': {'name': 'Centro'},
+            'geometry': {'type': 'Polygon', 'coordinates': [[[lng, lat] for lat, lng in SQUARE]]}
+        })
+        db.session.add(polygon)
+        db.session.commit()
+        self.polygon_id = polygon.id
+
+        invalidate_polygon_index(1)
+        invalidate_depot_index(1)
+        invalidate_route_cache(1)
+
+    def tearDown(self):
+        invalidate_polygon_index(1)
+        invalidate_depot_index(1)
+        invalidate_route_cache(1)
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def _params(self, **overrides):
+        return validate_routing_params(dict({'dias': 2, 'grupos_selecionados': [self.polygon_id]}, **overrides))
+
+    def _job(self, job_id):
+        db.session.expire_all()
+        return get_job(1, job_id)
+
+    def test_plan_routes(self):
+        """Testa o pipeline completo com chamadas de progresso crescentes"""
+        steps = []
+
+        result = plan_routes(1, self._params(), lambda fraction, message: steps.append(fraction))
+
+        self.assertTrue(result['success'])
+        self.assertEqual(result['total_clients'], 40)
+        self.assertEqual(result['clients_count_by_polygon'], {self.polygon_id: 40})
+        self.assertEqual(steps, sorted(steps))
+
+    def test_plan_routes_cached(self):
+        """Testa que a mesma entrada reaproveita os grupos e outra entrada recalcula"""
+        first = plan_routes(1, self._params())
+        second = plan_routes(1, self._params())
+        other = plan_routes(1, self._params(dias=3))
+
+        self.assertFalse(first['cached'])
+        self.assertTrue(second['cached'])
+        self.assertFalse(other['cached'])
+        self.assertEqual(second['groups'], first['groups'])
+
+        # Métricas gravadas uma vez por plano calculado (o do cache não grava de novo)
+        self.assertEqual(NDBOut.query.filter_by(user_id=1).count(), first['total_groups'] + other['total_groups'])
+
+        invalidate_route_cache(1)
+        self.assertFalse(plan_routes(1, self._params())['cached'])
+
+    def test_plan_routes_from_calendar(self):
+        """Testa replanejamento incremental a partir de um calendário salvo"""
+        clients = LatLong.query.filter_by(id_user=1).order_by(LatLong.id).all()
+        alocacoes = [
+            {'dia': day + 1, 'clientes': [{'hash_cliente': c.hash_client, 'latitude': c.latitude,
+                                           'longitude': c.longitude} for c in clients[day * 10:(day + 1) * 10]]}
+            for day in range(3)
+        ]
+        calendario = SavedCalendar(user_id=1, nome='Semana', configuracao=json.dumps({'max_clientes_dia': 15}),
+                                   alocacoes=json.dumps(alocacoes), total_clusters=3, total_clientes=30)
+        db.session.add(calendario)
+        db.session.commit()
+
+        result = plan_routes(1, self._params(calendario_id=calendario.id))
+
+        self.assertEqual(result['total_clients'], 40)
+        self.assertEqual(result['incremental']['new_clients'], 10)
+        self.assertEqual(result['incremental']['removed_clients'], 0)
+        self.assertTrue(all(g['total_clients'] <= 15 for g in result['groups']))
+
+        with self.assertRaises(RoutingError) as ctx:
+            plan_routes(1, self._params(calendario_id=999))
+        self.assertEqual(ctx.exception.status_code, 404)
+
+    def test_plan_routes_score_priority(self):
+        """Testa corte dos clientes de menor score e dias ordenados por score"""
+        db.session.add_all([ClientScore(user_id=1, hash_cliente=f'h{i}', score_total=float(i * 2))
+                            for i in range(40)])
+        db.session.commit()
+
+        result = plan_routes(1, self._params(max_clients_per_day=15, priorizar_score=True))
+
+        self.assertTrue(result['priorizar_score'])
+        self.assertEqual(result['total_clients'], 30)
+        self.assertEqual({c['hash_client'] for c in result['clients_deferred']}, {f'h{i}' for i in range(10)})
+        medias = [g['score_medio'] for g in result['groups']]
+        self.assertEqual(medias, sorted(medias, reverse=True))
+        self.assertFalse(plan_routes(1, self._params(max_clients_per_day=15))['cached'])
+
+    def test_plan_routes_scores_without_priority(self):
+        """Testa score médio dos grupos a partir dos scores carregados no lote (sem prioridade)"""
+        db.session.add_all([ClientScore(user_id=1, hash_cliente=f'h{i}', score_total=50.0) for i in range(20)])
+        db.session.add(ClientScore(user_id=2, hash_cliente='h30', score_total=99.0))
+        db.session.commit()
+
+        result = plan_routes(1, self._params())
+
+        self.assertFalse(result['priorizar_score'])
+        total = sum(g['score_medio'] for g in result['groups'] if g['score_medio'])
+        self.assertGreater(total, 0)
+        self.assertTrue(all(g['score_medio'] in (0, 50.0) for g in result['groups']))
+
+    def test_plan_routes_without_clients_in_area(self):
+        """Testa erro quando nenhum cliente está nas áreas"""
+        with self.assertRaises(RoutingError):
+            plan_routes(2, self._params())
+
+    def test_job_completes(self):
+        """Testa job em segundo plano até o resultado"""
+        job_id = submit_job(1, self._params())
+
+        self.assertTrue(wait_job(job_id, timeout=60))
+        job = self._job(job_id)
+        self.assertEqual(job.status, RoutingJob.STATUS_DONE)
+        self.assertEqual(job.progress, 1.0)
+        self.assertEqual(json.loads(job.result)['total_clients'], 40)
+        self.assertEqual(json.loads(job.params)['dias'], 2)
+
+    def test_job_failure(self):
+        """Testa que erros do pipeline ficam registrados no job"""
+        def task(user_id, params, progress):
+            raise RoutingError('Nenhum cliente cadastrado', 400)
+
+        job_id = submit_job(1, self._params(), task=task)
+
+        wait_job(job_id, timeout=10)
+        job = self._job(job_id)
+        self.assertEqual(job.status, RoutingJob.STATUS_FAILED)
+        self.assertEqual(job.error, 'Nenhum cliente cadastrado')
+        self.assertEqual(job.status_code, 400)
+
+    def test_cancel_running_job(self):
+        """Testa cancelamento cooperativo na próxima etapa do pipeline"""
+        started = threading.Event()
+        release = threading.Event()
+        reached_end = []
+
+        def task(user_id, params, progress):
+            progress(0.1, 'Etapa 1')
+            started.set()
+            release.wait(10)
+            progress(0.5, 'Etapa 2')
+            reached_end.append(True)
+            return {'success': True}
+
+        job_id = submit_job(1, self._params(), task=task)
+        self.assertTrue(started.wait(10))
+        self.assertEqual(self._job(job_id).status, RoutingJob.STATUS_RUNNING)
+
+        cancel_job(1, job_id)
+        release.set()
+        wait_job(job_id, timeout=10)
+
+        job = self._job(job_id)
+        self.assertEqual(job.status, RoutingJob.STATUS_CANCELLED)
+        self.assertIsNone(job.result)
+        self.assertEqual(reached_end, [])
+
+    def test_jobs_are_per_user(self):
+        """Testa que outro usuário não vê nem cancela o job"""
+        job_id = submit_job(1, self._params(), task=lambda user_id, params, progress: {'success': True})
+        wait_job(job_id, timeout=10)
+
+        self.assertIsNone(get_job(2, job_id))
+        self.assertIsNone(cancel_job(2, job_id))
+        self.assertEqual(self._job(job_id).status, RoutingJob.STATUS_DONE)
+
+    def test_stale_jobs_marked_failed(self):
+        """Testa que jobs sem heartbeat (processo reiniciado) viram falhos e os recentes não"""
+        old = datetime.utcnow() - timedelta(minutes=JOB_STALE_MINUTES + 5)
+        db.session.add_all([
+            RoutingJob(id='parado', user_id=1, status=RoutingJob.STATUS_RUNNING, progress=0.4,
+                       created_at=old, heartbeat_at=old),
+            RoutingJob(id='fila', user_id=1, status=RoutingJob.STATUS_QUEUED, progress=0.0, created_at=old),
+            RoutingJob(id='ativo', user_id=1, status=RoutingJob.STATUS_RUNNING, progress=0.4,
+                       created_at=old, heartbeat_at=datetime.utcnow()),
+        ])
+        db.session.commit()
+
+        self.assertEqual(fail_stale_jobs(), 2)
+        self.assertEqual(self._job('parado').status, RoutingJob.STATUS_FAILED)
+        self.assertEqual(self._job('parado').status_code, 500)
+        self.assertEqual(self._job('fila').status, RoutingJob.STATUS_FAILED)
+        self.assertEqual(self._job('ativo').status, RoutingJob.STATUS_RUNNING)
+
+    def test_get_job_fails_stale(self):
+        """Testa que a consulta de um job abandonado já devolve falha (o polling termina)"""
+        old = datetime.utcnow() - timedelta(minutes=JOB_STALE_MINUTES + 5)
+        db.session.add(RoutingJob(id='parado', user_id=1, status=RoutingJob.STATUS_RUNNING,
+                                  progress=0.4, created_at=old, heartbeat_at=old))
+        db.session.commit()
+
+        job = self._job('parado')
+        self.assertTrue(job.is_finished())
+        self.assertIsNotNone(job.finished_at)
+
+    def test_async_endpoints(self):
+        """Testa /processar com async=true, consulta de estado e resultado"""
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+
+        response = client.post('/autenticado/roteirizacao/processar',
+                               json={'dias': 2, 'grupos_selecionados': [self.polygon_id], 'async': True})
+        self.assertEqual(response.status_code, 202)
+        job_id = response.get_json()['job_id']
+
+        wait_job(job_id, timeout=60)
+        status = client.get(f'/autenticado/roteirizacao/jobs/{job_id}').get_json()
+        self.assertEqual(status['status'], RoutingJob.STATUS_DONE)
+
+        result = client.get(f'/autenticado/roteirizacao/jobs/{job_id}/resultado')
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.get_json()['total_clients'], 40)
+
+        self.assertEqual(client.get('/autenticado/roteirizacao/jobs/inexistente').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
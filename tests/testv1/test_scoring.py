@@ -6,13 +6,17 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 
-# Mock para evitar importação do banco
+# Mock para evitar importação do banco (restaurado após o import para não afetar outros testes)
 import sys
 from unittest.mock import MagicMock
+_real_models = sys.modules.get('base.models')
 sys.modules['base.models'] = MagicMock()
 
 from ml.client_scoring import RFMScorer
 
+if _real_models is not None:
+    sys.modules['base.models'] = _real_models
+
 
 class TestRFMScorer(unittest.TestCase):
     """Testes para a classe RFMScorer"""
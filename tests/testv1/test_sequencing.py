@@ -0,0 +1,115 @@
+"""
+Testes para a ordem de visita dos clientes (ml/sequencing.py)
+"""
+import unittest
+from unittest.mock import patch
+import numpy as np
+
+from ml import sequencing
+from ml.distance_matrix import DistanceMatrixCache, route_matrix, path_length_km
+from ml.sequencing import nearest_neighbour_tour, two_opt, sequence_clients, sequence_group
+
+
+DEPOT = {'id': 1, 'lat': -15.75, 'lng': -47.75}
+
+
+def _random_clients(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        {'hash_client': f'h{i}', 'lat': float(lat), 'lng': float(lng)}
+        for i, (lat, lng) in enumerate(zip(rng.uniform(-16, -15.5, n), rng.uniform(-48, -47.5, n)))
+    ]
+
+
+class TestTourConstruction(unittest.TestCase):
+    """Testes do vizinho mais próximo e do 2-opt"""
+
+    def test_nearest_neighbour_visits_all(self):
+        """Testa que o percurso visita cada nó uma vez, começando no início pedido"""
+        matrix = np.abs(np.subtract.outer(np.arange(6.0), np.arange(6.0)))
+
+        tour = nearest_neighbour_tour(matrix, 2)
+
+        self.assertEqual(tour[0], 2)
+        self.assertEqual(sorted(tour), list(range(6)))
+
+    def test_two_opt_untangles_crossing(self):
+        """Testa que o 2-opt desfaz um cruzamento num quadrado"""
+        # Cantos de um quadrado; o percurso 0-2-1-3 cruza as diagonais
+        points = np.array([[0, 0], [0, 1], [1, 1], [1, 0]], dtype=float)
+        matrix = np.sqrt(((points[:, None, :] - points[None, :, :]) ** 2).sum(axis=2))
+
+        tour = two_opt(matrix, [0, 2, 1, 3])
+
+        self.assertEqual(tour[0], 0)
+        self.assertAlmostEqual(path_length_km(matrix, tour, closed=True), 4.0)
+
+    def test_two_opt_row_blocks(self):
+        """Testa que os ganhos por blocos de linhas dão o mesmo percurso que um bloco só"""
+        clients = _random_clients(80)
+        matrix = route_matrix(clients, DEPOT, DistanceMatrixCache(cache_dir=None))
+        tour = nearest_neighbour_tour(matrix, 0)
+
+        single = two_opt(matrix, tour, time_budget=5.0)
+        with patch.object(sequencing, 'TWO_OPT_BLOCK_ROWS', 7):
+            blocked = two_opt(matrix, tour, time_budget=5.0)
+
+        self.assertEqual(blocked, single)
+
+
+class TestSequenceClients(unittest.TestCase):
+    """Testes da ordenação de um dia de visitas"""
+
+    def setUp(self):
+        self.cache = DistanceMatrixCache(cache_dir=None)
+
+    def _length(self, clients, order, depot):
+        matrix = route_matrix([clients[k] for k in order], depot, self.cache)
+        nodes = range(len(order) + (1 if depot else 0))
+        return path_length_km(matrix, nodes, closed=bool(depot))
+
+    def test_improves_on_nearest_neighbour(self):
+        """Testa que o 2-opt não piora a construção inicial"""
+        clients = _random_clients(60)
+
+        initial = sequence_clients(clients, DEPOT, time_budget=0.0, cache=self.cache)
+        improved = sequence_clients(clients, DEPOT, cache=self.cache)
+
+        self.assertEqual(sorted(improved), list(range(60)))
+        self.assertLessEqual(self._length(clients, improved, DEPOT), self._length(clients, initial, DEPOT) + 1e-6)
+
+    def test_large_group_skips_two_opt(self):
+        """Testa que acima de TWO_OPT_MAX_POINTS fica o percurso do vizinho mais próximo"""
+        clients = _random_clients(60)
+
+        nearest = sequence_clients(clients, DEPOT, time_budget=0.0, cache=self.cache)
+        with patch.object(sequencing, 'TWO_OPT_MAX_POINTS', 50), \
+                patch.object(sequencing, 'two_opt', wraps=sequencing.two_opt) as spy:
+            order = sequence_clients(clients, DEPOT, cache=self.cache)
+
+        self.assertEqual(order, nearest)
+        spy.assert_not_called()
+
+    def test_open_path_without_depot(self):
+        """Testa percurso aberto em linha reta: visita na ordem da linha"""
+        clients = [{'lat': -15.0, 'lng': -47.0 + 0.01 * k} for k in (3, 0, 4, 1, 2)]
+
+        order = sequence_clients(clients, None, cache=self.cache)
+
+        lngs = [clients[k]['lng'] for k in order]
+        self.assertIn(lngs, [sorted(lngs), sorted(lngs, reverse=True)])
+
+    def test_sequence_group_stops(self):
+        """Testa paradas numeradas com distância de cada trecho"""
+        group = {'group_number': 1, 'depot': DEPOT, 'clients': _random_clients(8)}
+
+        sequence_group(group, cache=self.cache)
+
+        self.assertEqual([s['sequence'] for s in group['stops']], list(range(1, 9)))
+        self.assertEqual([s['hash_client'] for s in group['stops']], [c['hash_client'] for c in group['clients']])
+        total = sum(s['leg_km'] for s in group['stops']) + group['return_km']
+        self.assertAlmostEqual(total, self._length(group['clients'], range(8), DEPOT), delta=0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+"""
+Testes para o índice espacial de polígonos (ml/spatial_index.py)
+"""
+import unittest
+import numpy as np
+from flask import Flask
+
+from config import Config
+from base.models import db, Polygon
+from ml.geo_utils import GeoUtils
+from ml.spatial_index import PolygonIndex, get_polygon_index, get_user_polygon_index, invalidate_polygon_index
+
+
+POLYGONS = [
+    {
+        'id': 1,
+        'name': 'Área 1',
+        'coordinates': [[-15.7, -47.9], [-15.7, -47.8], [-15.8, -47.8], [-15.8, -47.9], [-15.7, -47.9]]
+    },
+    {
+        'id': 2,
+        'name': 'Área 2',
+        'coordinates': [[-15.75, -47.85], [-15.75, -47.7], [-15.9, -47.7], [-15.9, -47.85], [-15.75, -47.85]]
+    }
+]
+
+
+class TestPolygonIndex(unittest.TestCase):
+    """Testes para consultas no STRtree"""
+
+    def test_matches_vectorized_engine(self):
+        """Testa se o índice retorna a mesma pertinência que o motor vetorizado"""
+        rng = np.random.default_rng(1)
+        lats = rng.uniform(-15.95, -15.65, 1000)
+        lngs = rng.uniform(-47.95, -47.65, 1000)
+
+        index = PolygonIndex(POLYGONS)
+        expected = GeoUtils.points_in_polygons(lats, lngs, GeoUtils.prepare_polygon_geometries(POLYGONS))
+
+        np.testing.assert_array_equal(index.query_membership(lats, lngs), expected)
+
+    def test_filter_clients_subset(self):
+        """Testa filtragem restrita a um subconjunto de polígonos"""
+        clients = [
+            {'id': 1, 'latitude': -15.72, 'longitude': -47.88},
+            {'id': 2, 'latitude': -15.85, 'longitude': -47.75},
+            {'id': 3, 'latitude': None, 'longitude': -47.75}
+        ]
+
+        result = PolygonIndex(POLYGONS).filter_clients(clients, [2])
+
+        self.assertEqual(list(result.keys()), [2])
+        self.assertEqual([c['id'] for c in result[2]], [2])
+
+    def test_empty_index(self):
+        """Testa índice sem polígonos válidos"""
+        index = PolygonIndex([{'id': 9, 'coordinates': []}])
+
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.query_membership([-15.7], [-47.8]).shape, (1, 0))
+
+
+class TestPolygonIndexCache(unittest.TestCase):
+    """Testes para o cache por usuário"""
+
+    def test_cache_and_invalidation(self):
+        """Testa se o loader só roda de novo após invalidação"""
+        calls = []
+
+        def loader():
+            calls.append(1)
+            return POLYGONS
+
+        invalidate_polygon_index('test-user')
+        first = get_polygon_index('test-user', loader)
+        second = get_polygon_index('test-user', loader)
+        self.assertIs(first, second)
+        self.assertEqual(len(calls), 1)
+
+        invalidate_polygon_index('test-user')
+        third = get_polygon_index('test-user', loader)
+        self.assertIsNot(first, third)
+        self.assertEqual(len(calls), 2)
+
+    def test_version_change_rebuilds(self):
+        """Testa reconstrução quando a versão dos dados muda sem invalidate (gravação em outro worker)"""
+        calls = []
+
+        def loader():
+            calls.append(1)
+            return POLYGONS
+
+        invalidate_polygon_index('test-user')
+        first = get_polygon_index('test-user', loader, (2, 2, 2))
+        self.assertIs(get_polygon_index('test-user', loader, (2, 2, 2)), first)
+        self.assertIsNot(get_polygon_index('test-user', loader, (2, 2, 3)), first)
+        self.assertEqual(len(calls), 2)
+
+
+class TestPolygonDataVersion(unittest.TestCase):
+    """Testes da versão das áreas lida do banco (SQLite em memória)"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        self.app.config['SQLALCHEMY_BINDS'] = {key: 'sqlite://' for key in Config.SQLALCHEMY_BINDS}
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def _feature(self, ring):
+        return {'type': 'Feature', 'geometry': {'type': 'Polygon', 'coordinates': [[[lng, lat] for lat, lng in ring]]}}
+
+    def test_index_follows_database(self):
+        """Testa que o índice em cache acompanha áreas gravadas sem passar pelo invalidate"""
+        polygon = Polygon(user_id=5, group_name='A')
+        polygon.set_geojson(self._feature(POLYGONS[0]['coordinates']))
+        db.session.add(polygon)
+        db.session.commit()
+
+        first = get_user_polygon_index(5)
+        self.assertIs(get_user_polygon_index(5), first)
+
+        # Edição da geometria incrementa geometry_version
+        polygon.set_geojson(self._feature(POLYGONS[1]['coordinates']))
+        db.session.commit()
+        second = get_user_polygon_index(5)
+        self.assertIsNot(second, first)
+
+        db.session.delete(polygon)
+        db.session.commit()
+        self.assertEqual(get_user_polygon_index(5).get_polygons(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
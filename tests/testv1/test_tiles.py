@@ -0,0 +1,114 @@
+"""
+Testes para os tiles GeoJSON (ml/tiles.py)
+"""
+import json
+import unittest
+import numpy as np
+from flask import Flask
+
+from config import Config
+from base.models import db, LatLong
+from ml.spatial_index import PolygonIndex
+from ml.point_clusters import PointClusterIndex
+from ml import tiles
+
+
+AREA = [[-15.7, -47.9], [-15.7, -47.8], [-15.8, -47.8], [-15.8, -47.9], [-15.7, -47.9]]
+
+
+class TestTileGeometry(unittest.TestCase):
+    """Testes sem banco de dados"""
+
+    def test_tile_bounds(self):
+        """Testa bbox do tile raiz e de um tile do Brasil"""
+        world = tiles.tile_bounds(0, 0, 0)
+        self.assertAlmostEqual(world['min_lon'], -180)
+        self.assertAlmostEqual(world['max_lat'], 85.0511, places=3)
+
+        bounds = tiles.tile_bounds(10, 375, 569)
+        self.assertLess(bounds['min_lon'], bounds['max_lon'])
+        self.assertLess(bounds['min_lat'], bounds['max_lat'])
+
+    def test_validate_tile(self):
+        """Testa tiles fora do mundo"""
+        tiles.validate_tile(3, 7, 7)
+        with self.assertRaises(ValueError):
+            tiles.validate_tile(3, 8, 0)
+        with self.assertRaises(ValueError):
+            tiles.validate_tile(30, 0, 0)
+
+    def test_clusters_partitioned_between_tiles(self):
+        """Testa se cada cluster aparece em exatamente um dos tiles filhos"""
+        rng = np.random.default_rng(2)
+        n = 400
+        index = PointClusterIndex(np.arange(n), [None] * n, rng.uniform(-16, -15.5, n), rng.uniform(-48, -47.5, n))
+
+        total = sum(
+            c['count']
+            for x in range(2 ** 6) for y in range(2 ** 6)
+            for c in index.get_clusters_in_tile(6, x, y)
+        )
+        self.assertEqual(total, n)
+
+
+class TestTileCache(unittest.TestCase):
+    """Testes com bancos SQLite em memória"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        self.app.config['SQLALCHEMY_BINDS'] = {key: 'sqlite://' for key in Config.SQLALCHEMY_BINDS}
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        db.session.add(LatLong(id=1, id_user=1, hash_client='base', latitude=-15.76, longitude=-47.86, user_point=True))
+        db.session.commit()
+        tiles.invalidate_tiles(1)
+
+        self.polygon_index = PolygonIndex([{'id': 10, 'name': 'Centro', 'coordinates': AREA}])
+        self.clusters = PointClusterIndex([2, 3], ['a', 'b'], [-15.75, -15.74], [-47.85, -47.84])
+
+    def tearDown(self):
+        tiles.invalidate_tiles(1)
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def _tile(self, z, x, y, calls):
+        def polygon_loader():
+            calls.append(1)
+            return self.polygon_index
+        return tiles.get_tile(1, z, x, y, polygon_loader, lambda: self.clusters)
+
+    def test_tile_layers(self):
+        """Testa camadas de clientes, pontos de saída e áreas no tile"""
+        calls = []
+        _, body = self._tile(8, 93, 139, calls)
+        layers = [f['properties']['layer'] for f in json.loads(body)['features']]
+
+        self.assertEqual(layers.count('depots'), 1)
+        self.assertEqual(layers.count('areas'), 1)
+        self.assertEqual(sum(1 for layer in layers if layer == 'clients'), 1)
+
+    def test_empty_tile(self):
+        """Testa tile sem dados"""
+        _, body = self._tile(8, 0, 0, [])
+        self.assertEqual(json.loads(body)['features'], [])
+
+    def test_cache_and_invalidation(self):
+        """Testa se o tile é reaproveitado até a invalidação"""
+        calls = []
+        first = self._tile(8, 93, 139, calls)
+        second = self._tile(8, 93, 139, calls)
+        self.assertEqual(first, second)
+        self.assertEqual(len(calls), 1)
+
+        tiles.invalidate_tiles(1)
+        self._tile(8, 93, 139, calls)
+        self.assertEqual(len(calls), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
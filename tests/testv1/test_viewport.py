@@ -0,0 +1,72 @@
+"""
+Testes para a consulta de pontos por viewport (ml/viewport.py)
+"""
+import unittest
+from flask import Flask
+
+from config import Config
+from base.models import db, LatLong
+from ml.geo_utils import GeoUtils
+from ml import viewport
+
+
+class TestViewportPoints(unittest.TestCase):
+    """Testes com bancos SQLite em memória"""
+
+    def setUp(self):
+        """Cria app com todos os binds em memória e alguns pontos"""
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        self.app.config['SQLALCHEMY_BINDS'] = {key: 'sqlite://' for key in Config.SQLALCHEMY_BINDS}
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        db.session.add_all([
+            LatLong(id=1, id_user=1, hash_client='a', latitude=-15.75, longitude=-47.85, user_point=False),
+            LatLong(id=2, id_user=1, hash_client='b', latitude=-15.75001, longitude=-47.85001, user_point=False),
+            LatLong(id=3, id_user=1, hash_client='c', latitude=-23.55, longitude=-46.63, user_point=False),
+            LatLong(id=4, id_user=1, hash_client='base', latitude=-15.76, longitude=-47.86, user_point=True),
+            LatLong(id=5, id_user=2, hash_client='x', latitude=-15.75, longitude=-47.85, user_point=False),
+        ])
+        db.session.commit()
+        viewport._backfilled_users.clear()
+        self.brasilia = GeoUtils.parse_bbox('-48.0,-15.9,-47.7,-15.6')
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_geocell_set_on_insert(self):
+        """Testa preenchimento automático do geocell"""
+        point = db.session.get(LatLong, 1)
+        self.assertEqual(point.geocell, GeoUtils.geocell(-15.75, -47.85))
+
+    def test_bbox_filter(self):
+        """Testa se apenas pontos do usuário dentro do bbox retornam"""
+        points = viewport.query_viewport_points(1, bbox=self.brasilia)
+        self.assertEqual(sorted(p['id'] for p in points), [1, 2, 4])
+
+    def test_zoom_merges_same_pixel(self):
+        """Testa agrupamento de clientes no mesmo pixel (ponto de saída nunca agrupa)"""
+        points = viewport.query_viewport_points(1, bbox=self.brasilia, zoom=10)
+
+        clients = [p for p in points if not p['user_point']]
+        self.assertEqual(len(clients), 1)
+        self.assertEqual(clients[0]['count'], 2)
+        self.assertEqual(sum(1 for p in points if p['user_point']), 1)
+
+    def test_backfill_matches_python_geocell(self):
+        """Testa se o backfill em SQL gera a mesma célula que GeoUtils.geocell"""
+        LatLong.query.update({LatLong.geocell: None}, synchronize_session=False)
+        db.session.commit()
+
+        self.assertEqual(viewport.backfill_geocells(1), 4)
+        for point in LatLong.query.filter_by(id_user=1).all():
+            self.assertEqual(point.geocell, GeoUtils.geocell(point.latitude, point.longitude))
+
+
+if __name__ == '__main__':
+    unittest.main()